@@ -0,0 +1,242 @@
+"""
+Vectorised anomaly detection over the event window.
+
+Only events appended since the last run are scored; per-type running moments and
+rolling-window histories carry over between runs, so detection keeps pace with
+ingest instead of rescanning. Robust (median/MAD) baselines are recomputed from the
+whole window at most every `baseline_interval` seconds.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from event_window import BALANCE_TOLERANCE, NUMERIC_FIELDS, Columns, balance_deltas, event_window
+
+logger = logging.getLogger(__name__)
+
+DETECTORS = ("zscore", "mad", "rolling", "balance")
+# Scale factor that makes the MAD a consistent estimator of the standard deviation
+MAD_SCALE = 0.6745
+
+
+def _values(columns: Columns) -> np.ndarray:
+    """(rows, fields) matrix of the numeric fields"""
+    if not len(columns["id"]):
+        return np.empty((0, len(NUMERIC_FIELDS)))
+    return np.column_stack([columns[name] for name in NUMERIC_FIELDS])
+
+
+class _Moments:
+    """Per-field count, mean and sum of squared deviations, merged batch by batch (Chan et al.)"""
+
+    def __init__(self):
+        self.count = np.zeros(len(NUMERIC_FIELDS))
+        self.mean = np.zeros(len(NUMERIC_FIELDS))
+        self.m2 = np.zeros(len(NUMERIC_FIELDS))
+
+    def update(self, values: np.ndarray):
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0)
+        if not count.any():
+            return
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, np.nansum(values, axis=0) / count, 0.0)
+            m2 = np.nansum((values - mean) ** 2, axis=0)
+            total = self.count + count
+            delta = mean - self.mean
+            self.mean = np.where(total > 0, self.mean + delta * count / total, 0.0)
+            self.m2 = self.m2 + m2 + np.where(total > 0, delta ** 2 * self.count * count / total, 0.0)
+        self.count = total
+
+    def std(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(self.m2 / self.count)
+
+
+def _rolling_z(history: np.ndarray, values: np.ndarray, window: int, min_samples: int) -> Tuple[np.ndarray, np.ndarray]:
+    """z-score of each new value against the `window` values before it; returns (scores, new history)"""
+    series = np.concatenate([history, values])
+    valid = ~np.isnan(series)
+    x = np.where(valid, series, 0.0)
+    sums = np.concatenate([[0.0], np.cumsum(x)])
+    squares = np.concatenate([[0.0], np.cumsum(x * x)])
+    counts = np.concatenate([[0], np.cumsum(valid)])
+    positions = np.arange(len(history), len(series))
+    lower = np.maximum(positions - window, 0)
+    n = counts[positions] - counts[lower]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (sums[positions] - sums[lower]) / n
+        std = np.sqrt(np.maximum((squares[positions] - squares[lower]) / n - mean ** 2, 0.0))
+        scores = np.abs(series[positions] - mean) / std
+    scores[(n < min_samples) | ~(std > 0)] = np.nan
+    return scores, series[-window:]
+
+
+class AnomalyDetector:
+    """Incremental z-score, robust MAD, rolling-window and balance-identity detectors per type"""
+
+    def __init__(
+        self,
+        z_threshold: float,
+        mad_threshold: float,
+        rolling_window: int,
+        rolling_threshold: float,
+        min_samples: int,
+        baseline_interval: float,
+        max_results: int,
+    ):
+        self.z_threshold = z_threshold
+        self.mad_threshold = mad_threshold
+        self.rolling_window = rolling_window
+        self.rolling_threshold = rolling_threshold
+        self.min_samples = min_samples
+        self.baseline_interval = baseline_interval
+        self.max_results = max_results
+        self._lock = asyncio.Lock()
+        self._reset(None)
+
+    def _reset(self, epoch: Optional[int]):
+        self._epoch = epoch
+        self._position = 0
+        self._moments: Dict[str, _Moments] = {}
+        self._histories: Dict[str, List[np.ndarray]] = {}
+        self._baselines: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._baseline_at = 0.0
+        self._recent: Dict[str, Deque[Dict[str, Any]]] = {name: deque(maxlen=self.max_results) for name in DETECTORS}
+        self.counts = {name: 0 for name in DETECTORS}
+        self.rows_scanned = 0
+
+    async def update(self):
+        """Score events that arrived since the last call"""
+        await event_window.refresh()
+        async with self._lock:
+            batch = event_window.since(self._epoch, self._position) if self._epoch is not None else None
+            if batch is None:
+                self._reset(event_window.epoch)
+                batch = event_window.columns
+            self._position = event_window.end
+            if time.monotonic() - self._baseline_at > self.baseline_interval:
+                # Vectorised median/MAD per type over the window; CPU-bound, so off the event loop
+                self._baselines = await asyncio.to_thread(self._robust_baselines, event_window.columns)
+                self._baseline_at = time.monotonic()
+            if len(batch["id"]):
+                await asyncio.to_thread(self._score, batch)
+
+    def _robust_baselines(self, columns: Columns) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        baselines = {}
+        values = _values(columns)
+        types, inverse = np.unique(columns["type"], return_inverse=True)
+        for index, name in enumerate(types):
+            group = values[inverse == index]
+            if len(group) < self.min_samples:
+                continue
+            # Fields a type never carries stay NaN; nanmedian would warn on their all-NaN slices
+            present = ~np.isnan(group).all(axis=0)
+            median = np.full(group.shape[1], np.nan)
+            mad = np.full(group.shape[1], np.nan)
+            median[present] = np.nanmedian(group[:, present], axis=0)
+            mad[present] = np.nanmedian(np.abs(group[:, present] - median[present]), axis=0)
+            baselines[name] = (median, mad)
+        return baselines
+
+    def _score(self, batch: Columns):
+        values = _values(batch)
+        self.rows_scanned += len(values)
+        types, inverse = np.unique(batch["type"], return_inverse=True)
+        for index, name in enumerate(types):
+            rows = np.nonzero(inverse == index)[0]
+            group = values[rows]
+
+            moments = self._moments.setdefault(name, _Moments())
+            moments.update(group)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                z = np.abs(group - moments.mean) / moments.std()
+            z[:, moments.count < self.min_samples] = np.nan
+            self._collect("zscore", batch, rows, z, self.z_threshold, group)
+
+            if name in self._baselines:
+                median, mad = self._baselines[name]
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    robust = MAD_SCALE * np.abs(group - median) / mad
+                robust[:, ~(mad > 0)] = np.nan
+                self._collect("mad", batch, rows, robust, self.mad_threshold, group)
+
+            histories = self._histories.setdefault(name, [np.empty(0)] * len(NUMERIC_FIELDS))
+            rolling = np.empty_like(group)
+            for field in range(len(NUMERIC_FIELDS)):
+                rolling[:, field], histories[field] = _rolling_z(
+                    histories[field], group[:, field], self.rolling_window, self.min_samples
+                )
+            self._collect("rolling", batch, rows, rolling, self.rolling_threshold, group)
+
+        deltas = balance_deltas(batch)
+        for side, delta in deltas.items():
+            with np.errstate(invalid="ignore"):
+                mismatch = np.abs(delta) > BALANCE_TOLERANCE
+            flagged = np.nonzero(mismatch)[0]
+            self.counts["balance"] += len(flagged)
+            for row in flagged[-self.max_results:]:
+                self._recent["balance"].append(self._record(
+                    batch, row, "balance", f"{side}_balance", float(delta[row]), None,
+                ))
+
+    def _collect(self, detector: str, batch: Columns, rows: np.ndarray, scores: np.ndarray, threshold: float, values: np.ndarray):
+        with np.errstate(invalid="ignore"):
+            hits = np.nan_to_num(scores) > threshold
+        local, fields = np.nonzero(hits)
+        self.counts[detector] += len(local)
+        for i, field in zip(local[-self.max_results:], fields[-self.max_results:]):
+            self._recent[detector].append(self._record(
+                batch, rows[i], detector, NUMERIC_FIELDS[field], float(values[i, field]), float(scores[i, field]),
+            ))
+
+    @staticmethod
+    def _record(batch: Columns, row: int, detector: str, field: str, value: float, score: Optional[float]) -> Dict[str, Any]:
+        return {
+            "id": int(batch["id"][row]),
+            "time": int(batch["time"][row]),
+            "type": batch["type"][row],
+            "detector": detector,
+            "field": field,
+            "value": round(value, 2),
+            "score": round(score, 2) if score is not None else None,
+        }
+
+    async def get(
+        self,
+        limit: int,
+        detector: Optional[str] = None,
+        event_type: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        await self.update()
+        detectors = [detector] if detector else list(DETECTORS)
+        anomalies = [
+            record
+            for name in detectors
+            for record in self._recent[name]
+            if event_type is None or record["type"] == event_type
+        ]
+        anomalies.sort(key=lambda record: (record["time"], record["id"]), reverse=True)
+        return {
+            "anomalies": anomalies[:limit],
+            "counts": dict(self.counts),
+            "rows_scanned": self.rows_scanned,
+            "window_rows": len(event_window),
+        }
+
+
+# Global anomaly detector instance
+anomaly_detector = AnomalyDetector(
+    settings.ANOMALY_Z_THRESHOLD,
+    settings.ANOMALY_MAD_THRESHOLD,
+    settings.ANOMALY_ROLLING_WINDOW,
+    settings.ANOMALY_ROLLING_THRESHOLD,
+    settings.ANOMALY_MIN_SAMPLES,
+    settings.ANOMALY_BASELINE_INTERVAL,
+    settings.ANOMALY_MAX_RESULTS,
+)
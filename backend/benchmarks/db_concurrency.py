@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for the DatabaseService-backed routes.
+
+Fires many parallel `/api/graphs/` and `/api/agent-query` calls at the app
+(in-process over ASGI) while the database is a local stub PostgREST server
+with a fixed per-request latency, then prints p50/p99 latency and throughput.
+
+Usage:
+    python benchmarks/db_concurrency.py --requests 400 --concurrency 50 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_postgrest import StubPostgREST  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(args):
+    import httpx
+    from main import app
+
+    endpoints = ["/api/graphs/", f"/api/agent-query?limit={args.limit}"]
+    latencies = {path: [] for path in endpoints}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def hit(path):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies[path].append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(hit(endpoints[i % len(endpoints)]) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, "
+          f"stub latency {args.latency * 1000:.0f} ms, DB_MAX_WORKERS={os.environ['DB_MAX_WORKERS']}")
+    for path, samples in latencies.items():
+        print(f"  {path:<28} p50 {percentile(samples, 50) * 1000:8.1f} ms   "
+              f"p99 {percentile(samples, 99) * 1000:8.1f} ms   "
+              f"mean {statistics.mean(samples) * 1000:8.1f} ms")
+    print(f"  throughput {args.requests / elapsed:.1f} req/s over {elapsed:.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub PostgREST latency in seconds")
+    parser.add_argument("--limit", type=int, default=100, help="limit passed to /api/agent-query")
+    parser.add_argument("--workers", type=int, default=None, help="override DB_MAX_WORKERS")
+    args = parser.parse_args()
+
+    stub = StubPostgREST(latency=args.latency, events=args.limit).start()
+    os.environ["SUPABASE_URL"] = stub.url
+    os.environ["SUPABASE_KEY"] = "bench.stub.key"
+    if args.workers is not None:
+        os.environ["DB_MAX_WORKERS"] = str(args.workers)
+    os.environ.setdefault("DB_MAX_WORKERS", "16")
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
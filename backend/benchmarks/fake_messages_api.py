@@ -0,0 +1,76 @@
+"""
+Local stand-in for the Anthropic Messages API used by the generation load test.
+
+Answers POST /v1/messages after a fixed artificial latency with a canned graph
+definition, so the backend's LLM path can be exercised without network access.
+"""
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GRAPH_JSON = json.dumps({
+    "type": "bar",
+    "title": "Average amount by transaction type",
+    "sql_query": "SELECT type AS category, AVG((properties->>'amount')::NUMERIC) AS value FROM events GROUP BY type",
+    "extra": {"y_axis_label": "Average amount"},
+})
+
+
+class FakeMessagesAPI:
+    """Threaded HTTP server answering Messages API calls after `latency` seconds"""
+
+    def __init__(self, latency: float = 0.5):
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                with fake._lock:
+                    fake.requests += 1
+                time.sleep(fake.latency)
+                body = json.dumps({
+                    "id": f"msg_{uuid.uuid4().hex}",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": request.get("model", "fake"),
+                    "content": [{"type": "text", "text": GRAPH_JSON}],
+                    "stop_reason": "end_turn",
+                    "stop_sequence": None,
+                    "usage": {"input_tokens": 100, "output_tokens": 50},
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self) -> "FakeMessagesAPI":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Load test for /api/generate-graph against a local fake Messages API.
+
+Runs the same number of generations at increasing client concurrency and prints
+throughput for each level. With a non-blocking client, throughput grows with
+concurrency up to GRAPH_GENERATION_CONCURRENCY instead of staying flat at
+1 / latency.
+
+Usage:
+    python benchmarks/generation_load.py --requests 64 --latency 0.5 --levels 1,4,16,32
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_messages_api import FakeMessagesAPI  # noqa: E402
+from stub_postgrest import StubPostgREST  # noqa: E402
+
+
+async def run_level(client, requests: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def generate(i):
+        async with semaphore:
+            # Distinct prompts per level so the generation cache never answers
+            prompt = f"average amount by type variant {concurrency}-{i}"
+            response = await client.post("/api/generate-graph", json={"request": prompt})
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(generate(i) for i in range(requests)))
+    return time.perf_counter() - started
+
+
+async def run(args):
+    import httpx
+    from main import app
+    from generate_new_graph import generation_limiter
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"{args.requests} generations per level, fake LLM latency {args.latency * 1000:.0f} ms, "
+              f"GRAPH_GENERATION_CONCURRENCY={generation_limiter.limit}")
+        for level in args.levels:
+            elapsed = await run_level(client, args.requests, level)
+            print(f"  concurrency {level:>3}: {args.requests / elapsed:7.2f} req/s  ({elapsed:.2f} s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.5, help="fake Messages API latency in seconds")
+    parser.add_argument("--levels", type=lambda v: [int(x) for x in v.split(",")], default=[1, 4, 16, 32])
+    parser.add_argument("--limit", type=int, default=None, help="override GRAPH_GENERATION_CONCURRENCY")
+    args = parser.parse_args()
+
+    fake = FakeMessagesAPI(latency=args.latency).start()
+    stub = StubPostgREST(latency=0.01).start()
+    os.environ["SUPABASE_URL"] = stub.url
+    os.environ["SUPABASE_KEY"] = "bench.stub.key"
+    os.environ["ANTHROPIC_BASE_URL"] = fake.url
+    os.environ["ANTHROPIC_API_KEY"] = "bench-key"
+    if args.limit is not None:
+        os.environ["GRAPH_GENERATION_CONCURRENCY"] = str(args.limit)
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        fake.stop()
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
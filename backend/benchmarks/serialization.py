@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Event page serialisation benchmark.
+
+Compares the previous /api/agent-query response path (AgentQueryResponse validation,
+jsonable_encoder and the stdlib JSON encoder) with the pass-through FastJSONResponse,
+and reports payload sizes raw, gzipped and, if the `brotli` package is installed,
+brotli-compressed at the middleware's default levels.
+
+Usage:
+    python benchmarks/serialization.py --rows 1000 10000 100000 --repeat 5
+"""
+import argparse
+import gzip
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from models import AgentQueryResponse  # noqa: E402
+from responses import FastJSONResponse, brotli  # noqa: E402
+
+TYPES = ["PAYMENT", "TRANSFER", "CASH_OUT", "DEBIT", "CASH_IN"]
+
+
+def make_events(rows: int):
+    rng = random.Random(7)
+    events = []
+    for i in range(rows):
+        amount = round(rng.lognormvariate(10, 1.5), 2)
+        old_balance = round(rng.uniform(0, 2_000_000), 2)
+        events.append({
+            "id": i,
+            "time": 1_700_000_000 + i,
+            "type": rng.choice(TYPES),
+            "properties": {
+                "step": i // 1000 + 1,
+                "amount": amount,
+                "nameOrig": f"C{rng.randrange(10 ** 9)}",
+                "oldbalanceOrg": old_balance,
+                "newbalanceOrig": max(old_balance - amount, 0.0),
+                "nameDest": f"M{rng.randrange(10 ** 9)}",
+                "oldbalanceDest": 0.0,
+                "newbalanceDest": 0.0,
+                "isFraud": int(rng.random() < 0.002),
+                "isFlaggedFraud": 0,
+            },
+        })
+    return events
+
+
+def model_path(events):
+    # What FastAPI does for a route with response_model=AgentQueryResponse
+    model = AgentQueryResponse(events=events, next_cursor=None)
+    validated = AgentQueryResponse.model_validate(model.model_dump())
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def fast_path(events):
+    return FastJSONResponse({"events": events, "next_cursor": None}).body
+
+
+def median_time(fn, events, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn(events)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8}{'model path':>14}{'fast path':>12}{'speedup':>10}{'raw':>12}{'gzip':>12}{'brotli':>12}")
+    for rows in args.rows:
+        events = make_events(rows)
+        model_time, _ = median_time(model_path, events, args.repeat)
+        fast_time, body = median_time(fast_path, events, args.repeat)
+        gzipped = len(gzip.compress(body, compresslevel=6))
+        brotlied = f"{len(brotli.compress(body, quality=4)) / 1024:>9.0f} KB" if brotli else f"{'n/a':>12}"
+        print(
+            f"{rows:>8}{model_time * 1000:>11.1f} ms{fast_time * 1000:>9.1f} ms{model_time / fast_time:>9.1f}x"
+            f"{len(body) / 1024:>9.0f} KB{gzipped / 1024:>9.0f} KB{brotlied}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Minimal local stand-in for the Supabase PostgREST API used by the benchmarks.
+
+Serves canned `events` and `graphs` rows with a fixed artificial latency so the
+backend can be load-tested without network access or real credentials.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+
+def make_events(count: int) -> list:
+    events = []
+    for i in range(count):
+        amount = round(random.uniform(1, 50000), 2)
+        old_balance = round(random.uniform(0, 100000), 2)
+        events.append({
+            "id": count - i,
+            "type": random.choice(["PAYMENT", "TRANSFER", "CASH_OUT", "DEBIT", "CASH_IN"]),
+            "time": 1_700_000_000 - i,
+            "properties": {
+                "step": str(1 + i // 100),
+                "amount": str(amount),
+                "isFraud": str(int(random.random() < 0.01)),
+                "isFlaggedFraud": "0",
+                "nameOrig": f"C{random.randint(1, 10_000)}",
+                "nameDest": f"M{random.randint(1, 10_000)}",
+                "oldbalanceOrg": str(old_balance),
+                "newbalanceOrig": str(max(old_balance - amount, 0)),
+                "oldbalanceDest": "0",
+                "newbalanceDest": "0",
+            },
+        })
+    return events
+
+
+def make_graphs(count: int) -> list:
+    return [
+        {
+            "id": f"graph-{i}",
+            "type": "bar",
+            "title": f"Graph {i}",
+            "sql_query": "SELECT type AS category, COUNT(*) AS value FROM events GROUP BY type",
+            "extra": {},
+            "justification": None,
+        }
+        for i in range(count)
+    ]
+
+
+class StubPostgREST:
+    """Threaded HTTP server answering PostgREST-style requests after `latency` seconds"""
+
+    def __init__(self, latency: float = 0.02, events: int = 100, graphs: int = 10):
+        self.latency = latency
+        self.tables = {"events": make_events(events), "graphs": make_graphs(graphs)}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _respond(self, rows):
+                time.sleep(stub.latency)
+                body = json.dumps(rows).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _table(self):
+                path = urlparse(self.path).path
+                return path.rsplit("/", 1)[-1]
+
+            def _rows(self):
+                rows = stub.tables.get(self._table(), [])
+                limit = None
+                for column, condition in parse_qsl(urlparse(self.path).query):
+                    if column == "limit":
+                        limit = int(condition)
+                    elif condition.startswith("eq."):
+                        rows = [row for row in rows if str(row.get(column)) == condition[3:]]
+                return rows[:limit]
+
+            def do_GET(self):
+                self._respond(self._rows())
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"null")
+                rows = payload if isinstance(payload, list) else [payload]
+                self._respond(rows)
+
+            def do_PATCH(self):
+                self._respond(self._rows()[:1])
+
+            def do_DELETE(self):
+                self._respond(self._rows()[:1])
+
+        return Handler
+
+    def start(self) -> "StubPostgREST":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
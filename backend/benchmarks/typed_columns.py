@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+JSON-path vs typed-column chart query benchmark.
+
+Loads a synthetic PaySim-like events table into an in-memory DuckDB, applies the
+typed-column migration, then times representative generated chart queries as written
+(`(properties->>'amount')::NUMERIC`) and as rewritten to the typed columns.
+
+Usage:
+    python benchmarks/typed_columns.py --rows 1000000 --repeat 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from duckdb_storage import DuckDBStorage  # noqa: E402
+from typed_columns import rewrite_sql  # noqa: E402
+
+QUERIES = {
+    "bar: amount by type": (
+        "SELECT type AS category, SUM((properties->>'amount')::NUMERIC) AS value "
+        "FROM events GROUP BY type"
+    ),
+    "line: fraud amount by step": (
+        "SELECT (properties->>'step')::INT8 AS time, SUM((properties->>'amount')::NUMERIC) AS value "
+        "FROM events WHERE (properties->>'isFraud')::INT = 1 GROUP BY 1 ORDER BY 1"
+    ),
+    "pie: flagged share": (
+        "SELECT properties->>'isFlaggedFraud' AS slice, COUNT(*) AS value FROM events GROUP BY 1"
+    ),
+    "scatter: balance drop vs amount": (
+        "SELECT (properties->>'amount')::NUMERIC AS x_value, "
+        "(properties->>'oldbalanceOrg')::NUMERIC - (properties->>'newbalanceOrig')::NUMERIC AS y_value "
+        "FROM events WHERE (properties->>'amount')::NUMERIC > 900000"
+    ),
+    "bar: top origins": (
+        "SELECT properties->>'nameOrig' AS category, SUM((properties->>'amount')::NUMERIC) AS value "
+        "FROM events GROUP BY properties->>'nameOrig' ORDER BY value DESC LIMIT 10"
+    ),
+}
+
+
+# Generated inside DuckDB: building a large table through insert_events would dominate the run
+LOAD_SQL = """
+INSERT INTO events (id, time, type, properties)
+SELECT i, i, ['PAYMENT', 'TRANSFER', 'CASH_OUT', 'DEBIT', 'CASH_IN'][1 + (hash(i) % 5)::INT],
+    json_object(
+        'step', (i // 1000 + 1)::VARCHAR,
+        'amount', round(amount, 2)::VARCHAR,
+        'isFraud', CASE WHEN random() < 0.002 THEN '1' ELSE '0' END,
+        'isFlaggedFraud', CASE WHEN random() < 0.0005 THEN '1' ELSE '0' END,
+        'nameOrig', 'C' || (hash(i, 1) % 50000)::VARCHAR,
+        'nameDest', 'M' || (hash(i, 2) % 50000)::VARCHAR,
+        'oldbalanceOrg', round(old_org, 2)::VARCHAR,
+        'newbalanceOrig', round(greatest(old_org - amount, 0), 2)::VARCHAR,
+        'oldbalanceDest', round(old_dest, 2)::VARCHAR,
+        'newbalanceDest', round(old_dest + amount, 2)::VARCHAR
+    )
+FROM (
+    SELECT i, exp(10 + 1.5 * sqrt(-2 * ln(random())) * cos(2 * pi() * random())) AS amount,
+        random() * 2000000 AS old_org, random() * 2000000 AS old_dest
+    FROM range(?) t(i)
+)
+"""
+
+
+def time_query(storage, sql, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        storage.run_sql(sql)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    storage = DuckDBStorage(":memory:")
+    started = time.perf_counter()
+    storage._write("SELECT setseed(0.7)", [])
+    storage._write(LOAD_SQL, [args.rows])
+    print(f"loaded {args.rows} events in {time.perf_counter() - started:.1f} s")
+
+    started = time.perf_counter()
+    storage.typed_columns = storage.migrate()
+    print(f"migration (add columns, backfill, index) took {time.perf_counter() - started:.1f} s")
+
+    print(f"{'query':<34}{'json path':>12}{'typed':>12}{'speedup':>10}")
+    for name, sql in QUERIES.items():
+        json_time = time_query(storage, sql, args.repeat)
+        typed_time = time_query(storage, rewrite_sql(sql), args.repeat)
+        print(f"{name:<34}{json_time * 1000:>9.1f} ms{typed_time * 1000:>9.1f} ms{json_time / typed_time:>9.1f}x")
+    storage.close()
+
+
+if __name__ == "__main__":
+    main()
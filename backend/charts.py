@@ -0,0 +1,233 @@
+import asyncio
+import functools
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache import MISSING, TTLCache
+from config import settings
+from database import db_service
+from metrics import metrics
+from incremental import AggregateQuery, combine_queries, incremental_engine, parse_aggregate_query, split_partial_rows
+from query_guard import query_guard
+from responses import dumps, loads
+from shared_cache import shared_cache
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def _definition(graph: Dict[str, Any]) -> str:
+    """Short hash of what a graph's result depends on.
+
+    Part of every cache key, so a worker still holding the old definition of an edited
+    graph never serves, or writes to the shared tier, results the new one would read.
+    """
+    return hashlib.sha1(f"{graph['type']}\0{graph['sql_query']}".encode()).hexdigest()[:16]
+
+
+def _cache_key(graph: Dict[str, Any], before: Optional[int]) -> tuple:
+    return graph["id"], _definition(graph), before
+
+
+def _shared_key(graph: Dict[str, Any], before: Optional[int]) -> str:
+    return f"chart:{graph['id']}:{_definition(graph)}:{'' if before is None else before}"
+
+
+def _scan_shared_key(graphs: List[Dict[str, Any]], before: Optional[int]) -> str:
+    """Shared-cache key of the combined partial rows of graphs evaluated in one scan"""
+    members = "\0".join(_shared_key(graph, before) for graph in graphs)
+    return f"chart-scan:{hashlib.sha1(members.encode()).hexdigest()}"
+
+
+def _lease_ttl() -> float:
+    # The longest a chart query may run, after which waiting workers compute it themselves
+    return settings.QUERY_TIMEOUT + 1 if settings.QUERY_TIMEOUT else settings.CHART_CACHE_TTL
+
+
+class ChartService:
+    """Executes stored graph queries server-side and shares results between viewers.
+
+    Results are cached per (graph_id, definition, before) cursor, and concurrent requests for the
+    same key wait on a single in-flight query instead of each hitting the database.
+    Behind the in-process cache, the shared cache tier serves results computed by other
+    workers and coalesces their concurrent misses. Decomposable aggregates are
+    refreshed incrementally by the IncrementalEngine.
+    """
+
+    def __init__(self):
+        self.cache = TTLCache(settings.CHART_CACHE_SIZE, settings.CHART_CACHE_TTL)
+        self._flights = SingleFlight("chart_results")
+        # Bumped on every invalidation so a query started before an update never repopulates the cache
+        self._generations: Dict[str, int] = {}
+
+    async def get_graph_data(self, graph: Dict[str, Any], before: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """Return the rows of graph's query at the given time cursor, or None if the query failed.
+
+        Raises QueryRejected if the stored SQL does not pass the query guard.
+        """
+        key = _cache_key(graph, before)
+        cached = self.cache.get(key)
+        if cached is not MISSING:
+            return cached
+        await query_guard.check(graph["sql_query"], graph["type"])
+
+        return await self._flights.do(key, lambda: self._compute(graph, before))
+
+    async def _compute(self, graph: Dict[str, Any], before: Optional[int]) -> Optional[List[Dict[str, Any]]]:
+        generation = self._generations.get(graph["id"], 0)
+
+        def current(rows):
+            return rows is not None and self._generations.get(graph["id"], 0) == generation
+
+        rows = await shared_cache.get_or_compute(
+            _shared_key(graph, before),
+            lambda: incremental_engine.run(graph, before),
+            ttl=settings.CHART_CACHE_TTL,
+            encode=dumps,
+            decode=loads,
+            lease_ttl=_lease_ttl(),
+            store=current,
+        )
+        if current(rows):
+            self.cache.set(_cache_key(graph, before), rows)
+        return rows
+
+    async def get_many_graph_data(self, graphs: List[Dict[str, Any]], before: Optional[int] = None) -> Dict[str, Any]:
+        """Rows of each graph's query at before, or the exception its evaluation raised, by graph id.
+
+        Cached results are served directly. Uncached decomposable graphs with no running
+        incremental state that group and filter events the same way are computed in one
+        shared pass over events, which concurrent batches and get_graph_data calls for the
+        same graphs wait on rather than repeat; everything else goes through
+        get_graph_data. At most CHART_BATCH_CONCURRENCY queries run at once.
+        """
+        results: Dict[str, Any] = {}
+        scans: Dict[tuple, list] = {}
+        singles = []
+        missing = []
+        for graph in graphs:
+            cached = self.cache.get(_cache_key(graph, before))
+            if cached is not MISSING:
+                results[graph["id"]] = cached
+            else:
+                missing.append(graph)
+        shared = await shared_cache.get_many([_shared_key(graph, before) for graph in missing])
+        for graph in missing:
+            stored = shared.get(_shared_key(graph, before))
+            if stored is not None:
+                results[graph["id"]] = loads(stored)
+                self.cache.set(_cache_key(graph, before), results[graph["id"]])
+                continue
+            query = parse_aggregate_query(graph["sql_query"])
+            if query is None or incremental_engine.is_warm(graph, before):
+                singles.append(graph)
+            else:
+                scans.setdefault(query.scan_key(), []).append((graph, query))
+        for members in [members for members in scans.values() if len(members) == 1]:
+            singles.append(members[0][0])
+
+        semaphore = asyncio.Semaphore(settings.CHART_BATCH_CONCURRENCY)
+
+        async def run_single(graph):
+            async with semaphore:
+                try:
+                    results[graph["id"]] = await self.get_graph_data(graph, before)
+                except Exception as e:
+                    results[graph["id"]] = e
+
+        async def run_shared(members):
+            accepted = []
+            for graph, query in members:
+                try:
+                    await query_guard.check(graph["sql_query"], graph["type"])
+                    accepted.append((graph, query))
+                except Exception as e:
+                    results[graph["id"]] = e
+            if not accepted:
+                return
+            scan_key = ("scan",) + tuple(_cache_key(graph, before) for graph, _ in accepted)
+
+            async def member(graph):
+                scanned = await self._flights.do(scan_key, lambda: self._scan(accepted, before, semaphore))
+                return None if scanned is None else scanned[graph["id"]]
+
+            # Each member is an in-flight call of its own, so a concurrent get_graph_data for
+            # it waits on the scan, and a member already being computed is not waited for twice
+            outcomes = await asyncio.gather(
+                *(self._flights.do(_cache_key(graph, before), functools.partial(member, graph)) for graph, _ in accepted),
+                return_exceptions=True,
+            )
+            results.update((graph["id"], outcome) for (graph, _), outcome in zip(accepted, outcomes))
+
+        await asyncio.gather(
+            *(run_single(graph) for graph in singles),
+            *(run_shared(members) for members in scans.values() if len(members) > 1),
+        )
+        return results
+
+    async def _scan(
+        self,
+        members: List[Tuple[Dict[str, Any], AggregateQuery]],
+        before: Optional[int],
+        semaphore: asyncio.Semaphore,
+    ) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Rows of each member graph by id from one combined partial-aggregate query, or None if it failed.
+
+        The combined rows go through the shared cache tier, so workers evaluating the same
+        dashboard at once run the query once between them.
+        """
+        graphs = [graph for graph, _ in members]
+        queries = [query for _, query in members]
+        generations = {graph["id"]: self._generations.get(graph["id"], 0) for graph in graphs}
+        epoch = incremental_engine.epoch
+        computed_here = []
+
+        def current(rows):
+            return rows is not None and all(self._generations.get(g["id"], 0) == generations[g["id"]] for g in graphs)
+
+        async def run():
+            computed_here.append(True)
+            async with semaphore:
+                return await db_service.run_chart_query(combine_queries(queries).partial_sql(), before)
+
+        rows = await shared_cache.get_or_compute(
+            _scan_shared_key(graphs, before), run,
+            ttl=settings.CHART_CACHE_TTL,
+            encode=dumps,
+            decode=loads,
+            lease_ttl=_lease_ttl(),
+            store=current,
+        )
+        if rows is None:
+            return None
+        scanned = {}
+        for (graph, query), partial_rows in zip(members, split_partial_rows(queries, rows)):
+            if computed_here:
+                data = incremental_engine.seed(graph, before, query, partial_rows, epoch)
+            else:
+                # Rows another worker computed earlier may predate writes this worker has
+                # seen, so they answer this request but do not start the running state
+                groups: Dict[Any, list] = {}
+                query.merge(groups, partial_rows)
+                data = query.finalize(groups)
+            if self._generations.get(graph["id"], 0) == generations[graph["id"]]:
+                self.cache.set(_cache_key(graph, before), data)
+                await shared_cache.set(_shared_key(graph, before), dumps(data), settings.CHART_CACHE_TTL)
+            scanned[graph["id"]] = data
+        logger.debug(f"Evaluated {len(members)} graphs in one shared scan")
+        return scanned
+
+    async def invalidate(self, graph_id: str):
+        """Drop every cached result, here and in the shared tier, and the running aggregate state for graph_id"""
+        self._generations[graph_id] = self._generations.get(graph_id, 0) + 1
+        incremental_engine.reset(graph_id)
+        removed = self.cache.invalidate(lambda key: key[0] == graph_id)
+        await shared_cache.invalidate(f"chart:{graph_id}:")
+        logger.debug(f"Invalidated {removed} cached results for graph {graph_id}")
+
+
+# Global chart service instance
+chart_service = ChartService()
+metrics.track_cache("chart_results", chart_service.cache)
+metrics.gauge("chart_queries_in_flight", "Distinct chart queries being computed", fn=lambda: len(chart_service._flights))
@@ -4,6 +4,14 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+
+def _cpu_count() -> int:
+    """CPUs this process may run on, which in a container can be fewer than the host has"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
 class Settings:
     # API Configuration
     API_TITLE: str = "HackMIT 2025 Backend API"
@@ -14,6 +22,8 @@ class Settings:
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
+    # Worker processes run.py starts when DEBUG is off (same variable uvicorn and gunicorn read)
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", str(_cpu_count())))
     
     # CORS Configuration
     ALLOWED_ORIGINS: list = [
@@ -28,5 +38,154 @@ class Settings:
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
     SUPABASE_SERVICE_ROLE_KEY: str = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
 
+    # Anthropic Configuration
+    ANTHROPIC_API_KEY: str = os.getenv("ANTHROPIC_API_KEY", "")
+    ANTHROPIC_BASE_URL: str = os.getenv("ANTHROPIC_BASE_URL", "")
+    ANTHROPIC_MODEL: str = os.getenv("ANTHROPIC_MODEL", "claude-3-5-sonnet-20240620")
+    ANTHROPIC_TIMEOUT: float = float(os.getenv("ANTHROPIC_TIMEOUT", "60"))
+    ANTHROPIC_MAX_RETRIES: int = int(os.getenv("ANTHROPIC_MAX_RETRIES", "2"))
+    ANTHROPIC_MAX_CONNECTIONS: int = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "20"))
+    GRAPH_GENERATION_CONCURRENCY: int = int(os.getenv("GRAPH_GENERATION_CONCURRENCY", "8"))
+
+    # Graph generation cache Configuration
+    GENERATION_CACHE_SIZE: int = int(os.getenv("GENERATION_CACHE_SIZE", "256"))
+    GENERATION_CACHE_TTL: float = float(os.getenv("GENERATION_CACHE_TTL", "3600"))
+    # Jaccard score (0-1) for serving a near-identical prompt from cache; 0 disables the similarity tier
+    GENERATION_SIMILARITY_THRESHOLD: float = float(os.getenv("GENERATION_SIMILARITY_THRESHOLD", "0"))
+
+    # Schema digest used to build generation prompts
+    SCHEMA_DIGEST_TTL: float = float(os.getenv("SCHEMA_DIGEST_TTL", "300"))
+    SCHEMA_DIGEST_SAMPLE_SIZE: int = int(os.getenv("SCHEMA_DIGEST_SAMPLE_SIZE", "200"))
+
+    # Storage Configuration
+    # "supabase" (default) or "duckdb" for an embedded local database
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "supabase")
+    DUCKDB_PATH: str = os.getenv("DUCKDB_PATH", "data/events.duckdb")
+
+    # Database executor Configuration
+    # The supabase client is synchronous, so every request runs on a bounded
+    # thread pool instead of blocking the event loop
+    DB_MAX_WORKERS: int = int(os.getenv("DB_MAX_WORKERS", "16"))
+    # Concurrent identical agent_query/get_all_graphs calls and generation prompts share one upstream call
+    SINGLE_FLIGHT_ENABLED: bool = os.getenv("SINGLE_FLIGHT_ENABLED", "True").lower() == "true"
+    # Read typed projections of hot properties keys instead of JSON (typed_columns.py)
+    TYPED_COLUMNS_ENABLED: bool = os.getenv("TYPED_COLUMNS_ENABLED", "True").lower() == "true"
+
+    # Startup Configuration
+    # Prime graph definitions, the schema digest and the LLM client before reporting ready
+    STARTUP_WARMUP: bool = os.getenv("STARTUP_WARMUP", "True").lower() == "true"
+    # Concurrent pings at startup, opening that many DB threads and connections
+    DB_WARMUP_CONNECTIONS: int = int(os.getenv("DB_WARMUP_CONNECTIONS", "4"))
+    # Seconds a /api/ready database round-trip result is reused
+    READY_CACHE_TTL: float = float(os.getenv("READY_CACHE_TTL", "5"))
+
+    # Response compression Configuration
+    # Responses at least this many bytes are gzip/brotli compressed; 0 disables compression
+    RESPONSE_COMPRESSION_MIN_BYTES: int = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+    RESPONSE_GZIP_LEVEL: int = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+    RESPONSE_BROTLI_QUALITY: int = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+
+    # Event export Configuration
+    AGENT_QUERY_MAX_LIMIT: int = int(os.getenv("AGENT_QUERY_MAX_LIMIT", "1000"))
+    AGENT_QUERY_PAGE_SIZE: int = int(os.getenv("AGENT_QUERY_PAGE_SIZE", "500"))
+
+    # Graph registry Configuration
+    # Seconds between full reloads of graph definitions from the database; 0 disables revalidation
+    GRAPH_REGISTRY_TTL: float = float(os.getenv("GRAPH_REGISTRY_TTL", "60"))
+
+    # Event ingestion Configuration
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+    INGEST_FLUSH_INTERVAL: float = float(os.getenv("INGEST_FLUSH_INTERVAL", "0.5"))
+    # Pending batches buffered before ingestion requests are made to wait
+    INGEST_QUEUE_BATCHES: int = int(os.getenv("INGEST_QUEUE_BATCHES", "16"))
+
+    # Chart result cache Configuration
+    CHART_CACHE_SIZE: int = int(os.getenv("CHART_CACHE_SIZE", "512"))
+    CHART_CACHE_TTL: float = float(os.getenv("CHART_CACHE_TTL", "30"))
+    # Queries a batch data request runs at once, and graphs it may ask for
+    CHART_BATCH_CONCURRENCY: int = int(os.getenv("CHART_BATCH_CONCURRENCY", "4"))
+    CHART_BATCH_MAX_GRAPHS: int = int(os.getenv("CHART_BATCH_MAX_GRAPHS", "50"))
+
+    # Incremental aggregation Configuration
+    INCREMENTAL_ENABLED: bool = os.getenv("INCREMENTAL_ENABLED", "True").lower() == "true"
+    INCREMENTAL_STATE_SIZE: int = int(os.getenv("INCREMENTAL_STATE_SIZE", "256"))
+    # Running state is rebuilt from scratch this often to pick up late-arriving events
+    INCREMENTAL_RESYNC_INTERVAL: float = float(os.getenv("INCREMENTAL_RESYNC_INTERVAL", "600"))
+
+    # Shared cache Configuration
+    # Tier behind the per-worker chart and generation caches: "memory" (not shared), "sqlite" or "redis"
+    SHARED_CACHE_BACKEND: str = os.getenv("SHARED_CACHE_BACKEND", "memory")
+    SHARED_CACHE_PATH: str = os.getenv("SHARED_CACHE_PATH", "data/shared_cache.sqlite3")
+    SHARED_CACHE_URL: str = os.getenv("SHARED_CACHE_URL", "redis://localhost:6379/0")
+    SHARED_CACHE_MAX_ENTRIES: int = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "10000"))
+    # Seconds between checks while another worker computes the same entry
+    SHARED_CACHE_POLL_INTERVAL: float = float(os.getenv("SHARED_CACHE_POLL_INTERVAL", "0.05"))
+
+    # Chart query guard Configuration
+    # Largest planner estimate accepted for chart SQL (DuckDB: biggest operator cardinality,
+    # Postgres: total plan cost); 0 disables the EXPLAIN check
+    QUERY_MAX_COST: float = float(os.getenv("QUERY_MAX_COST", "1e9"))
+    # Refuse chart SQL whose cost cannot be estimated instead of running it under the timeout and
+    # row cap alone; turn on once migrations/002 is applied, or every Supabase chart query gets a 503
+    QUERY_COST_REQUIRED: bool = os.getenv("QUERY_COST_REQUIRED", "False").lower() == "true"
+    QUERY_TIMEOUT: float = float(os.getenv("QUERY_TIMEOUT", "10"))
+    QUERY_MAX_ROWS: int = int(os.getenv("QUERY_MAX_ROWS", "50000"))
+    QUERY_GUARD_CACHE_SIZE: int = int(os.getenv("QUERY_GUARD_CACHE_SIZE", "1024"))
+    # Seconds a cost estimate is trusted before EXPLAIN runs again
+    QUERY_GUARD_CACHE_TTL: float = float(os.getenv("QUERY_GUARD_CACHE_TTL", "600"))
+
+    # Chart downsampling Configuration
+    # Most points a line/area graph returns per series (LTTB); 0 returns every row unless requested
+    GRAPH_MAX_POINTS: int = int(os.getenv("GRAPH_MAX_POINTS", "5000"))
+
+    # Live updates Configuration
+    LIVE_POLL_INTERVAL: float = float(os.getenv("LIVE_POLL_INTERVAL", "2"))
+    LIVE_HEARTBEAT_INTERVAL: float = float(os.getenv("LIVE_HEARTBEAT_INTERVAL", "15"))
+    # New-event batches buffered per subscriber before the oldest are dropped
+    LIVE_BUFFER_BATCHES: int = int(os.getenv("LIVE_BUFFER_BATCHES", "32"))
+    LIVE_MAX_EVENTS_PER_TICK: int = int(os.getenv("LIVE_MAX_EVENTS_PER_TICK", "1000"))
+
+    # Report upload Configuration
+    REPORT_SPOOL_DIR: str = os.getenv("REPORT_SPOOL_DIR", "data/report_uploads")
+    # Per-file limit, and the limit on the whole multipart body including its part headers
+    REPORT_MAX_FILE_BYTES: int = int(os.getenv("REPORT_MAX_FILE_BYTES", str(10 * 1024 * 1024)))
+    REPORT_MAX_REQUEST_BYTES: int = int(os.getenv("REPORT_MAX_REQUEST_BYTES", str(50 * 1024 * 1024)))
+
+    # Report job Configuration
+    REPORT_JOBS_DB: str = os.getenv("REPORT_JOBS_DB", "data/report_jobs.sqlite3")
+    REPORT_OUTPUT_DIR: str = os.getenv("REPORT_OUTPUT_DIR", "generated_reports")
+    REPORT_WORKERS: int = int(os.getenv("REPORT_WORKERS", "4"))
+    # Concurrent agent runs; each holds an LLM request open for tens of seconds
+    REPORT_LLM_CONCURRENCY: int = int(os.getenv("REPORT_LLM_CONCURRENCY", "2"))
+    # Processes for the CPU-bound pandoc render
+    REPORT_RENDER_PROCESSES: int = int(os.getenv("REPORT_RENDER_PROCESSES", "2"))
+    REPORT_MAX_ATTEMPTS: int = int(os.getenv("REPORT_MAX_ATTEMPTS", "3"))
+    REPORT_RETRY_BACKOFF: float = float(os.getenv("REPORT_RETRY_BACKOFF", "2"))
+    # Seconds between heartbeats on running jobs, and without one before a job is re-queued
+    REPORT_HEARTBEAT_INTERVAL: float = float(os.getenv("REPORT_HEARTBEAT_INTERVAL", "10"))
+    REPORT_HEARTBEAT_TIMEOUT: float = float(os.getenv("REPORT_HEARTBEAT_TIMEOUT", "60"))
+    # Base URL of a remote API for the report agent's data tools; empty reads the database in-process
+    REPORT_DATA_API_URL: str = os.getenv("REPORT_DATA_API_URL", "")
+
+    # Event window Configuration
+    # Newest events held as in-memory columns for summaries and detectors; 0 keeps every event
+    EVENT_WINDOW_SIZE: int = int(os.getenv("EVENT_WINDOW_SIZE", "200000"))
+    EVENT_WINDOW_PAGE_SIZE: int = int(os.getenv("EVENT_WINDOW_PAGE_SIZE", "5000"))
+    EVENT_WINDOW_REFRESH_INTERVAL: float = float(os.getenv("EVENT_WINDOW_REFRESH_INTERVAL", "30"))
+    EVENT_WINDOW_RESYNC_INTERVAL: float = float(os.getenv("EVENT_WINDOW_RESYNC_INTERVAL", "3600"))
+    EVENT_SUMMARY_TOP_N: int = int(os.getenv("EVENT_SUMMARY_TOP_N", "5"))
+
+    # Anomaly detection Configuration
+    ANOMALY_Z_THRESHOLD: float = float(os.getenv("ANOMALY_Z_THRESHOLD", "4"))
+    # Modified z-score (0.6745 * |x - median| / MAD) above which a value is flagged
+    ANOMALY_MAD_THRESHOLD: float = float(os.getenv("ANOMALY_MAD_THRESHOLD", "3.5"))
+    ANOMALY_ROLLING_WINDOW: int = int(os.getenv("ANOMALY_ROLLING_WINDOW", "100"))
+    ANOMALY_ROLLING_THRESHOLD: float = float(os.getenv("ANOMALY_ROLLING_THRESHOLD", "4"))
+    # Events of a type needed before its statistics are trusted
+    ANOMALY_MIN_SAMPLES: int = int(os.getenv("ANOMALY_MIN_SAMPLES", "30"))
+    ANOMALY_BASELINE_INTERVAL: float = float(os.getenv("ANOMALY_BASELINE_INTERVAL", "300"))
+    # Most recent anomalies kept per detector
+    ANOMALY_MAX_RESULTS: int = int(os.getenv("ANOMALY_MAX_RESULTS", "5000"))
+
 # Create settings instance
 settings = Settings()
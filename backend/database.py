@@ -1,132 +1,262 @@
-from supabase import create_client, Client
 from config import settings
+from metrics import metrics
+from storage import FIELD_RE, Cursor, QueryTimeout, QueryTooLarge, StorageBackend, create_storage_backend
+from singleflight import single_flight
+from typed_columns import rewrite_sql
 from typing import Optional, List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
 import logging
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class SupabaseClient:
-    client: Optional[Client] = None
+db_seconds = metrics.histogram(
+    "db_operation_duration_seconds", "Storage calls by operation, including wait for a DB thread", ("operation", "outcome")
+)
+db_in_flight = metrics.gauge("db_operations_in_flight", "Storage calls queued or running on the DB thread pool")
 
-    def __init__(self):
-        self.client: Optional[Client] = None
-        self._initialize_client()
-    
-    def _initialize_client(self):
-        """Initialize Supabase client with configuration"""
-        try:
-            if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
-                logger.warning("Supabase credentials not found. Using mock client.")
-                self.client = None
-                return
-            
-            # Use the correct Supabase client initialization
-            self.client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
-            logger.info("Supabase client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize Supabase client: {e}")
-            self.client = None
-    
-    def is_connected(self) -> bool:
-        """Check if Supabase client is connected"""
-        return self.client is not None
 
-# Global Supabase client instance
-supabase_client = SupabaseClient()
+def encode_cursor(event: Dict[str, Any]) -> str:
+    """Opaque keyset cursor for an event row"""
+    return f"{event['time']}:{event['id']}"
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Parse a `time:id` cursor; a bare `time` is also accepted. Raises ValueError if malformed."""
+    cursor_time, _, cursor_id = str(cursor).partition(":")
+    try:
+        return int(cursor_time), int(cursor_id) if cursor_id else None
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
 
 class DatabaseService:
-    """Service class for database operations using Supabase"""
-    client: Optional[Client] = None
-    
-    def __init__(self):
-        self.client = supabase_client.client
+    """Service class for database operations on the configured storage backend"""
+
+    def __init__(self, storage: Optional[StorageBackend] = None):
+        # Created on first use (normally start()) so importing the app opens no connections
+        self._storage = storage
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.DB_MAX_WORKERS,
+            thread_name_prefix="db",
+        )
+
+    @property
+    def storage(self) -> StorageBackend:
+        if self._storage is None:
+            self._storage = create_storage_backend()
+        return self._storage
+
+    async def _run(self, fn, *args, **kwargs):
+        """Run a blocking storage call on the DB thread pool"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        outcome = "error"
+        db_in_flight.inc()
+        try:
+            result = await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+            outcome = "ok"
+            return result
+        finally:
+            db_in_flight.dec()
+            db_seconds.observe(time.perf_counter() - started, fn.__name__, outcome)
+
+    async def start(self):
+        """Create the storage client and warm the DB thread pool and its connections.
+
+        Runs DB_WARMUP_CONNECTIONS pings at once so that many pool threads (and, for
+        Supabase, pooled HTTP connections) are open before the first request arrives.
+        """
+        loop = asyncio.get_running_loop()
+        storage = await loop.run_in_executor(self._executor, lambda: self.storage)
+        if not storage.is_available() or settings.DB_WARMUP_CONNECTIONS <= 0:
+            return
+        results = await asyncio.gather(
+            *(self._run(storage.ping) for _ in range(settings.DB_WARMUP_CONNECTIONS)), return_exceptions=True
+        )
+        failures = [result for result in results if isinstance(result, Exception)]
+        if failures:
+            logger.warning(f"{storage.name} warm-up: {len(failures)}/{len(results)} pings failed: {failures[0]}")
+        else:
+            logger.info(f"{storage.name} storage warmed with {len(results)} connections")
+
+    def shutdown(self):
+        """Release the DB thread pool and storage connections"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._storage is not None:
+            self._storage.close()
+
+    async def migrate(self) -> bool:
+        """Apply startup schema migrations; returns whether chart SQL uses typed event columns"""
+        if not settings.TYPED_COLUMNS_ENABLED or not self.storage.is_available():
+            return False
+        try:
+            self.storage.typed_columns = await self._run(self.storage.migrate)
+        except Exception as e:
+            logger.error(f"Schema migration failed: {e}")
+            self.storage.typed_columns = False
+        logger.info(f"Typed event columns {'enabled' if self.storage.typed_columns else 'disabled'}")
+        return self.storage.typed_columns
 
     async def test_connection(self) -> bool:
         """Test database connection"""
-        return self.client is not None
+        return self.storage.is_available()
 
-    async def agent_query(self, limit: int) -> list[dict[str, any]]:
-        """Query for the top limit events in the database by time descending"""
-        if not self.client:
-            return "Error: Supabase client not available"
+    async def ping(self) -> bool:
+        """Whether a real round-trip to the database succeeds"""
+        if not self.storage.is_available():
+            return False
         try:
-            result = self.client.table("events")\
-                .select("*")\
-                .order("time", desc=True)\
-                .limit(limit)\
-                .execute()
-            return result.data
+            await self._run(self.storage.ping)
+            return True
         except Exception as e:
-            logger.error(f"Database connection test failed: {e}")
+            logger.error(f"Database ping failed: {e}")
             return False
-    
+
+    @single_flight(
+        "agent_query",
+        key=lambda self, limit, before=None, after=None, fields=None: (self, limit, before, after, tuple(fields or ())),
+    )
+    async def agent_query(
+        self,
+        limit: int,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Query up to limit events using keyset pagination on (time, id).
+
+        With no cursor, or with `before`, events are returned newest first and strictly
+        older than the cursor; with `after` they are returned oldest first and strictly
+        newer. `fields` projects top-level columns or `properties` keys; id and time are
+        always included so the last row can be turned into the next cursor.
+        Raises ValueError for a malformed cursor or field name; returns None if the query failed.
+        """
+        for name in fields or []:
+            if not FIELD_RE.match(name):
+                raise ValueError(f"Invalid field name: {name!r}")
+        raw_cursor = after if after is not None else before
+        cursor = decode_cursor(raw_cursor) if raw_cursor is not None else None
+        if not self.storage.is_available():
+            logger.error(f"{self.storage.name} storage not available")
+            return None
+        try:
+            return await self._run(
+                self.storage.query_events, limit, cursor=cursor, ascending=after is not None, fields=fields
+            )
+        except Exception as e:
+            logger.error(f"Error querying events: {e}")
+            return None
+
+    async def run_chart_query(
+        self,
+        sql_query: str,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Run a graph's SQL over events with after < time <= before.
+
+        Returns the result rows, or None if the query failed. Raises QueryTimeout when the
+        query runs past QUERY_TIMEOUT and QueryTooLarge when it exceeds QUERY_MAX_ROWS rows.
+        """
+        if not self.storage.is_available():
+            return None
+        if self.storage.typed_columns:
+            sql_query = rewrite_sql(sql_query)
+        timeout = settings.QUERY_TIMEOUT or None
+        try:
+            # The backend cancels the statement itself; wait_for only stops us waiting on it
+            return await asyncio.wait_for(
+                self._run(self.storage.run_sql, sql_query, before, after, timeout, settings.QUERY_MAX_ROWS),
+                timeout + 1 if timeout else None,
+            )
+        except asyncio.TimeoutError:
+            raise QueryTimeout(f"Query exceeded the {timeout:g} s timeout")
+        except (QueryTimeout, QueryTooLarge):
+            raise
+        except Exception as e:
+            logger.error(f"Error running chart query: {e}")
+            return None
+
+    async def explain_cost(self, sql_query: str) -> Optional[float]:
+        """Planner cost estimate for chart SQL, or None if unavailable"""
+        if not self.storage.is_available():
+            return None
+        if self.storage.typed_columns:
+            sql_query = rewrite_sql(sql_query)
+        try:
+            return await self._run(self.storage.explain_cost, sql_query)
+        except Exception as e:
+            logger.warning(f"Could not estimate chart query cost: {e}")
+            return None
+
+    async def insert_events(self, events: List[Dict[str, Any]]) -> int:
+        """Insert a batch of events; returns the number written (0 if the write failed)"""
+        if not self.storage.is_available():
+            logger.error(f"{self.storage.name} storage not available")
+            return 0
+        try:
+            return await self._run(self.storage.insert_events, events)
+        except Exception as e:
+            logger.error(f"Error inserting {len(events)} events: {e}")
+            return 0
+
     # Graph operations
     async def create_graph(self, graph_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Create a new graph configuration"""
-        if not self.client:
-            logger.error("Supabase client not available")
+        if not self.storage.is_available():
+            logger.error(f"{self.storage.name} storage not available")
             return None
         try:
-            result = self.client.table("graphs").insert(graph_data).execute()
-            if result.data:
-                return result.data[0]
-            return None
+            return await self._run(self.storage.create_graph, graph_data)
         except Exception as e:
             logger.error(f"Error creating graph: {e}")
             return None
 
     async def get_graph(self, graph_id: str) -> Optional[Dict[str, Any]]:
         """Get graph by ID"""
-        if not self.client:
+        if not self.storage.is_available():
             return None
         try:
-            result = self.client.table("graphs").select("*").eq("id", graph_id).execute()
-            if result.data:
-                return result.data[0]
-            return None
+            return await self._run(self.storage.get_graph, graph_id)
         except Exception as e:
             logger.error(f"Error getting graph {graph_id}: {e}")
             return None
 
-    async def get_all_graphs(self) -> List[Dict[str, Any]]:
-        """Get all graphs"""
-        if not self.client:
+    @single_flight("get_all_graphs")
+    async def get_all_graphs(self) -> Optional[List[Dict[str, Any]]]:
+        """Get all graphs, or None if the query failed"""
+        if not self.storage.is_available():
             return []
         try:
-            result = self.client.table("graphs").select("*").execute()
-            return result.data or []
+            return await self._run(self.storage.list_graphs)
         except Exception as e:
             logger.error(f"Error getting all graphs: {e}")
-            return []
-        
+            return None
+
     async def update_graph(self, graph_id: str, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Update a graph by ID"""
-        if not self.client:
+        if not self.storage.is_available():
             return None
         try:
-            result = self.client.table("graphs").update(update_data).eq("id", graph_id).execute()
-            if result.data:
-                return result.data[0]
-            return None
+            return await self._run(self.storage.update_graph, graph_id, update_data)
         except Exception as e:
             logger.error(f"Error updating graph {graph_id}: {e}")
             return None
 
     async def delete_graph(self, graph_id: str) -> bool:
         """Delete a graph by ID"""
-        if not self.client:
+        if not self.storage.is_available():
             return False
         try:
-            result = self.client.table("graphs").delete().eq("id", graph_id).execute()
-            return bool(result.data)  # True if rows were deleted
+            return await self._run(self.storage.delete_graph, graph_id)
         except Exception as e:
             logger.error(f"Error deleting graph {graph_id}: {e}")
             return False
-    
-    
-
 
 
 # Global database service instance
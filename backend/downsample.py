@@ -0,0 +1,81 @@
+"""
+Largest-Triangle-Three-Buckets downsampling of line and area chart results.
+
+A long history returns one row per distinct time value, far more points than a chart
+can draw. LTTB keeps the first and last points and, from each of max_points - 2 equal
+buckets in between, the point forming the largest triangle with the previously kept
+point and the next bucket's average, which preserves peaks and troughs.
+"""
+from typing import Any, Dict, List
+
+import numpy as np
+
+# Chart types whose rows are a (time, value) series
+SERIES_CHART_TYPES = ("line", "area")
+
+
+def _as_float(values: List[Any]) -> np.ndarray:
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices of the points LTTB keeps from a series sorted by x"""
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+    # Bucket boundaries over the points between the fixed first and last
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    # Average of each bucket, used as the third triangle vertex for the bucket before it
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(np.nan_to_num(y[1:n - 1]), edges[:-1] - 1)
+    sizes = np.diff(edges)
+    avg_x = np.append(sums_x / sizes, x[-1])[1:]
+    avg_y = np.append(sums_y / sizes, y[-1])[1:]
+
+    kept = np.empty(max_points, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Twice the triangle area; the constant factor does not change the argmax
+        area = np.abs(
+            (x[previous] - avg_x[bucket]) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y[bucket] - y[previous])
+        )
+        previous = start + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def downsample_series(rows: List[Dict[str, Any]], max_points: int, x: str = "time", y: str = "value") -> List[Dict[str, Any]]:
+    """Reduce (time, value) rows to at most max_points per series.
+
+    Rows carrying other columns (e.g. a series label) are downsampled per distinct
+    combination of those columns. Rows that cannot be read as numbers are returned as-is.
+    """
+    # Query results share one set of columns, so the first row describes them all
+    if len(rows) <= max_points or x not in rows[0] or y not in rows[0]:
+        return rows
+    labels = [key for key in rows[0] if key not in (x, y)]
+    if labels:
+        series: Dict[tuple, List[Dict[str, Any]]] = {}
+        for row in rows:
+            series.setdefault(tuple(str(row[key]) for key in labels), []).append(row)
+        groups = list(series.values())
+    else:
+        groups = [rows]
+    reduced = []
+    for group in groups:
+        try:
+            values = _as_float([row[y] for row in group])
+        except (TypeError, ValueError):
+            return rows
+        try:
+            positions = _as_float([row[x] for row in group])
+        except (TypeError, ValueError):
+            # Timestamps or labels: keep the query's order and space points evenly
+            positions = np.arange(len(group), dtype=float)
+        order = np.argsort(positions, kind="stable")
+        kept = order[lttb_indices(positions[order], values[order], max_points)]
+        reduced.extend(group[i] for i in kept)
+    return reduced
@@ -0,0 +1,263 @@
+"""
+Embedded DuckDB storage backend.
+
+Keeps `events` and `graphs` in a local columnar database file, so the backend can run
+as a single low-latency node or fully offline for tests and benchmarks. DuckDB's JSON
+support understands the Postgres-style chart SQL we generate (`properties->>'key'`,
+`::NUMERIC` casts, `FROM events`) without rewriting.
+"""
+import json
+import logging
+import os
+import threading
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from storage import EVENT_COLUMNS, QueryTimeout, QueryTooLarge, StorageBackend, time_window_cte
+from typed_columns import INDEXED_COLUMNS, TYPED_COLUMNS
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover
+    duckdb = None  # We will validate at runtime
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE SEQUENCE IF NOT EXISTS events_id_seq;
+CREATE TABLE IF NOT EXISTS events (
+    id BIGINT DEFAULT nextval('events_id_seq'),
+    time BIGINT NOT NULL,
+    type VARCHAR,
+    properties JSON
+);
+CREATE TABLE IF NOT EXISTS graphs (
+    id VARCHAR PRIMARY KEY DEFAULT (uuid()::VARCHAR),
+    type VARCHAR NOT NULL,
+    title VARCHAR NOT NULL,
+    sql_query VARCHAR NOT NULL,
+    extra JSON,
+    justification VARCHAR
+);
+"""
+
+GRAPH_COLUMNS = ("id", "type", "title", "sql_query", "extra", "justification")
+_JSON_COLUMNS = ("properties", "extra")
+
+
+def _to_python(value: Any) -> Any:
+    # DECIMAL results (e.g. ::NUMERIC casts) are not JSON serialisable
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+class DuckDBStorage(StorageBackend):
+    """DuckDB backend; every call uses its own cursor so the DB thread pool can share one connection"""
+
+    name = "duckdb"
+
+    def __init__(self, path: str):
+        if duckdb is None:
+            raise RuntimeError(
+                "The 'duckdb' package is not installed. Please add it to requirements.txt"
+            )
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._conn = duckdb.connect(path)
+        self._conn.execute(SCHEMA)
+        self._write_lock = threading.Lock()
+        logger.info(f"DuckDB storage initialized at {path}")
+
+    def is_available(self) -> bool:
+        return self._conn is not None
+
+    def ping(self):
+        self._fetch("SELECT 1")
+
+    def migrate(self):
+        """Add the typed property columns, backfill existing rows and index the lookup columns"""
+        backfill = ", ".join(
+            f"{typed.column} = TRY_CAST(properties->>'{typed.key}' AS {typed.duckdb_type})" for typed in TYPED_COLUMNS
+        )
+        missing = " OR ".join(
+            f"({typed.column} IS NULL AND (properties->>'{typed.key}') IS NOT NULL)" for typed in TYPED_COLUMNS
+        )
+        with self._write_lock:
+            cursor = self._conn.cursor()
+            try:
+                for typed in TYPED_COLUMNS:
+                    cursor.execute(f"ALTER TABLE events ADD COLUMN IF NOT EXISTS {typed.column} {typed.duckdb_type}")
+                cursor.execute(f"UPDATE events SET {backfill} WHERE {missing}")
+                for column in INDEXED_COLUMNS:
+                    cursor.execute(f"CREATE INDEX IF NOT EXISTS events_{column}_idx ON events ({column})")
+            finally:
+                cursor.close()
+        return True
+
+    def _fetch(
+        self,
+        sql: str,
+        params: Optional[list] = None,
+        json_columns=_JSON_COLUMNS,
+        timeout: Optional[float] = None,
+        max_rows: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        cursor = self._conn.cursor()
+        # Interrupting the cursor cancels the running statement without touching other cursors
+        timer = threading.Timer(timeout, cursor.interrupt) if timeout else None
+        try:
+            if timer:
+                timer.start()
+            try:
+                cursor.execute(sql, params or [])
+                names = [column[0] for column in cursor.description]
+                results = cursor.fetchall() if max_rows is None else cursor.fetchmany(max_rows + 1)
+            except duckdb.InterruptException:
+                raise QueryTimeout(f"Query exceeded the {timeout:g} s timeout")
+            if max_rows is not None and len(results) > max_rows:
+                raise QueryTooLarge(f"Query returned more than {max_rows} rows")
+            rows = []
+            for values in results:
+                row = {}
+                for name, value in zip(names, values):
+                    if name in json_columns and isinstance(value, str):
+                        value = json.loads(value)
+                    row[name] = _to_python(value)
+                rows.append(row)
+            return rows
+        finally:
+            if timer:
+                timer.cancel()
+            cursor.close()
+
+    def _write(self, sql: str, params: list) -> List[Dict[str, Any]]:
+        # DuckDB allows a single writer per connection at a time
+        with self._write_lock:
+            return self._fetch(sql, params)
+
+    def query_events(self, limit, cursor=None, ascending=False, fields=None):
+        if fields:
+            columns = ["id", "time"] + [
+                name if name in EVENT_COLUMNS else f"properties->>'{name}' AS {name}"
+                for name in fields if name not in ("id", "time")
+            ]
+        else:
+            columns = list(EVENT_COLUMNS)
+        sql = f"SELECT {', '.join(columns)} FROM events"
+        params: list = []
+        operator = ">" if ascending else "<"
+        if cursor is not None:
+            cursor_time, cursor_id = cursor
+            if cursor_id is None:
+                sql += f" WHERE time {operator} ?"
+                params = [cursor_time]
+            else:
+                sql += f" WHERE time {operator} ? OR (time = ? AND id {operator} ?)"
+                params = [cursor_time, cursor_time, cursor_id]
+        direction = "ASC" if ascending else "DESC"
+        sql += f" ORDER BY time {direction}, id {direction} LIMIT ?"
+        params.append(int(limit))
+        return self._fetch(sql, params)
+
+    def run_sql(self, sql_query, before=None, after=None, timeout=None, max_rows=None):
+        # Results of arbitrary chart SQL are returned as-is; no column is assumed to be JSON
+        return self._fetch(
+            time_window_cte(sql_query, "main.events", before, after),
+            json_columns=(),
+            timeout=timeout,
+            max_rows=max_rows,
+        )
+
+    def explain_cost(self, sql_query):
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql_query}")
+            plans = [json.loads(row[1]) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+        # The widest intermediate result: a cross product shows up as rows x rows
+        cost = 0.0
+        nodes = [node for plan in plans for node in plan]
+        while nodes:
+            node = nodes.pop()
+            estimate = node.get("extra_info", {}).get("Estimated Cardinality")
+            if estimate:
+                cost = max(cost, float(str(estimate).lstrip("~")))
+            nodes.extend(node.get("children", []))
+        return cost
+
+    def insert_events(self, events):
+        # One multi-row INSERT per chunk is far cheaper than executemany's per-row statements
+        chunk_size = 1000
+        typed = TYPED_COLUMNS if self.typed_columns else ()
+        columns = "".join(f", {t.column}" for t in typed)
+        projections = "".join(f", TRY_CAST(properties->>'{t.key}' AS {t.duckdb_type})" for t in typed)
+        with self._write_lock:
+            cursor = self._conn.cursor()
+            # One transaction: a failed chunk must not leave the chunks before it committed
+            cursor.execute("BEGIN TRANSACTION")
+            try:
+                for start in range(0, len(events), chunk_size):
+                    chunk = events[start:start + chunk_size]
+                    placeholders = ", ".join("(?, ?, ?, ?::JSON)" for _ in chunk)
+                    params = []
+                    for event in chunk:
+                        params += [event.get("id"), event["time"], event.get("type"), json.dumps(event.get("properties") or {})]
+                    cursor.execute(
+                        f"INSERT INTO events (id, time, type, properties{columns}) "
+                        f"SELECT COALESCE(id, nextval('events_id_seq')), time, type, properties{projections} "
+                        f"FROM (VALUES {placeholders}) AS v(id, time, type, properties)",
+                        params,
+                    )
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+        return len(events)
+
+    @staticmethod
+    def _graph_params(data: Dict[str, Any]) -> Dict[str, Any]:
+        params = {k: v for k, v in data.items() if k in GRAPH_COLUMNS and k != "id"}
+        if params.get("extra") is not None:
+            params["extra"] = json.dumps(params["extra"])
+        return params
+
+    def create_graph(self, graph_data):
+        params = self._graph_params(graph_data)
+        names = list(params)
+        rows = self._write(
+            f"INSERT INTO graphs ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)}) RETURNING *",
+            [params[name] for name in names],
+        )
+        return rows[0] if rows else None
+
+    def get_graph(self, graph_id):
+        rows = self._fetch("SELECT * FROM graphs WHERE id = ?", [graph_id])
+        return rows[0] if rows else None
+
+    def list_graphs(self):
+        return self._fetch("SELECT * FROM graphs")
+
+    def update_graph(self, graph_id, update_data):
+        params = self._graph_params(update_data)
+        if not params:
+            return self.get_graph(graph_id)
+        assignments = ", ".join(f"{name} = ?" for name in params)
+        rows = self._write(
+            f"UPDATE graphs SET {assignments} WHERE id = ? RETURNING *",
+            list(params.values()) + [graph_id],
+        )
+        return rows[0] if rows else None
+
+    def delete_graph(self, graph_id):
+        rows = self._write("DELETE FROM graphs WHERE id = ? RETURNING id", [graph_id])
+        return bool(rows)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
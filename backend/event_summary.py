@@ -0,0 +1,116 @@
+"""
+Vectorised statistical summary of the event window for report prompts.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from event_window import BALANCE_TOLERANCE, Columns, balance_deltas, event_window
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _amount_stats(amounts: np.ndarray) -> Dict[str, Any]:
+    amounts = amounts[~np.isnan(amounts)]
+    if not len(amounts):
+        return {"total": 0.0, "mean": 0.0, "max": 0.0, "quantiles": {}}
+    quantiles = np.quantile(amounts, QUANTILES)
+    return {
+        "total": round(float(amounts.sum()), 2),
+        "mean": round(float(amounts.mean()), 2),
+        "max": round(float(amounts.max()), 2),
+        "quantiles": {f"p{int(q * 100)}": round(float(v), 2) for q, v in zip(QUANTILES, quantiles)},
+    }
+
+
+def _rate(flags: np.ndarray) -> float:
+    return round(float(flags.mean()), 5) if len(flags) else 0.0
+
+
+def _balance_mismatches(columns: Columns) -> Dict[str, np.ndarray]:
+    """Rows whose balances do not move by the transaction amount"""
+    deltas = balance_deltas(columns)
+    return {
+        # NaN comparisons are False, so rows missing a balance never count as mismatches
+        "origin": np.abs(deltas["origin"]) > BALANCE_TOLERANCE,
+        "destination": np.abs(deltas["destination"]) > BALANCE_TOLERANCE,
+        "emptied_origin": (columns["newbalanceOrig"] == 0) & (columns["oldbalanceOrg"] > 0),
+    }
+
+
+def _top_counterparties(names: np.ndarray, amounts: np.ndarray, top_n: int) -> List[Dict[str, Any]]:
+    if not len(names):
+        return []
+    unique, inverse = np.unique(names, return_inverse=True)
+    counts = np.bincount(inverse)
+    totals = np.bincount(inverse, weights=np.nan_to_num(amounts))
+    order = np.argsort(totals)[::-1][:top_n]
+    return [
+        {"name": unique[i], "transactions": int(counts[i]), "amount_total": round(float(totals[i]), 2)}
+        for i in order if unique[i]
+    ]
+
+
+def summarize_columns(columns: Columns, top_n: int) -> Dict[str, Any]:
+    """Per-type counts, amount distributions, fraud rates, balance anomalies and top counterparties"""
+    rows = len(columns["id"])
+    summary: Dict[str, Any] = {"rows": rows}
+    if not rows:
+        return summary
+    mismatches = _balance_mismatches(columns)
+    fraud = columns["isFraud"]
+    flagged = columns["isFlaggedFraud"]
+    summary.update({
+        "time_range": [int(columns["time"].min()), int(columns["time"].max())],
+        "amount": _amount_stats(columns["amount"]),
+        "fraud_rate": _rate(fraud),
+        "flagged_rate": _rate(flagged),
+        # Share of actual fraud the existing flag catches
+        "flag_recall": round(float(flagged[fraud == 1].mean()), 5) if fraud.any() else None,
+        "balance_mismatch_rate": {name: _rate(mask) for name, mask in mismatches.items()},
+        "by_type": {},
+        "top_origins": _top_counterparties(columns["nameOrig"], columns["amount"], top_n),
+        "top_destinations": _top_counterparties(columns["nameDest"], columns["amount"], top_n),
+    })
+    types, inverse = np.unique(columns["type"], return_inverse=True)
+    for index, name in enumerate(types):
+        mask = inverse == index
+        summary["by_type"][name or "unknown"] = {
+            "count": int(mask.sum()),
+            "share": round(float(mask.mean()), 4),
+            "amount": _amount_stats(columns["amount"][mask]),
+            "fraud_rate": _rate(fraud[mask]),
+            "balance_mismatch_rate": {check: _rate(m[mask]) for check, m in mismatches.items()},
+        }
+    return summary
+
+
+class EventSummary:
+    """Summary of the event window, recomputed only when the window has changed"""
+
+    def __init__(self, top_n: int):
+        self.top_n = top_n
+        self._key: Optional[Tuple[int, int, int]] = None
+        self._summary: Optional[Dict[str, Any]] = None
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> Dict[str, Any]:
+        await event_window.refresh()
+        async with self._lock:
+            key = (event_window.epoch, event_window.start, event_window.end)
+            if key != self._key:
+                columns = event_window.columns
+                # Summarising a large window is CPU-bound; keep it off the event loop
+                self._summary = await asyncio.to_thread(summarize_columns, columns, self.top_n)
+                self._summary["window_size"] = event_window.size or None
+                self._key = key
+            return self._summary
+
+
+# Global event summary instance
+event_summary = EventSummary(settings.EVENT_SUMMARY_TOP_N)
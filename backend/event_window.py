@@ -0,0 +1,168 @@
+"""
+Columnar in-memory window over the newest events, kept current by keyset cursor.
+
+Statistics and detectors work on whole NumPy columns instead of per-row dicts. The
+window is filled once, then only events after the newest cursor are fetched and
+appended; the oldest rows are trimmed to keep at most `size` rows.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import settings
+from database import db_service, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_FIELDS = ("amount", "oldbalanceOrg", "newbalanceOrig", "oldbalanceDest", "newbalanceDest")
+FLAG_FIELDS = ("isFraud", "isFlaggedFraud")
+TEXT_FIELDS = ("type", "nameOrig", "nameDest")
+FIELDS = list(TEXT_FIELDS + NUMERIC_FIELDS + FLAG_FIELDS)
+
+Columns = Dict[str, np.ndarray]
+
+# Balance identities are checked to the cent
+BALANCE_TOLERANCE = 0.01
+
+
+def _parse_numeric(values: List[Any]) -> np.ndarray:
+    """Property values are stored as strings; parse them in one pass, NaN when missing or invalid"""
+    text = np.array(["nan" if value is None else value for value in values], dtype=str)
+    try:
+        return text.astype(np.float64)
+    except ValueError:
+        parsed = np.full(len(values), np.nan)
+        for i, value in enumerate(text):
+            try:
+                parsed[i] = float(value)
+            except ValueError:
+                pass
+        return parsed
+
+
+def to_columns(rows: List[Dict[str, Any]]) -> Columns:
+    """Convert rows projected to FIELDS into one array per field"""
+    columns = {
+        "id": np.array([row["id"] for row in rows], dtype=np.int64),
+        "time": np.array([row["time"] for row in rows], dtype=np.int64),
+    }
+    for name in TEXT_FIELDS:
+        columns[name] = np.array([row.get(name) or "" for row in rows], dtype=object)
+    for name in NUMERIC_FIELDS:
+        columns[name] = _parse_numeric([row.get(name) for row in rows])
+    for name in FLAG_FIELDS:
+        columns[name] = np.nan_to_num(_parse_numeric([row.get(name) for row in rows])).astype(np.int8)
+    return columns
+
+
+def empty_columns() -> Columns:
+    return to_columns([])
+
+
+def balance_deltas(columns: Columns) -> Dict[str, np.ndarray]:
+    """How far each side's balance change is from the transaction amount (0 when consistent)"""
+    amount = columns["amount"]
+    return {
+        "origin": columns["oldbalanceOrg"] - amount - columns["newbalanceOrig"],
+        "destination": columns["oldbalanceDest"] + amount - columns["newbalanceDest"],
+    }
+
+
+class EventWindow:
+    """The newest `size` events (all events when size is 0) as NumPy columns.
+
+    `start` and `end` are running row counts: the window holds rows [start, end) of
+    everything appended during the current `epoch`. A periodic full reload starts a
+    new epoch so late-arriving events are picked up; consumers that keep their own
+    incremental state rebuild when the epoch changes.
+    """
+
+    def __init__(self, size: int, page_size: int, refresh_interval: float, resync_interval: float):
+        self.size = size
+        self.page_size = page_size
+        self.refresh_interval = refresh_interval
+        self.resync_interval = resync_interval
+        self.columns: Columns = empty_columns()
+        self.epoch = 0
+        self.start = 0
+        self.end = 0
+        self._cursor: Optional[str] = None
+        self._refreshed_at = 0.0
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    async def refresh(self, force: bool = False):
+        """Fetch events newer than the window (or reload it) unless refreshed recently"""
+        if not force and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        async with self._lock:
+            if not force and time.monotonic() - self._refreshed_at < self.refresh_interval:
+                return
+            if self._cursor is None or time.monotonic() - self._loaded_at > self.resync_interval:
+                await self._reload()
+            else:
+                await self._append_new()
+            self._refreshed_at = time.monotonic()
+
+    async def _reload(self):
+        rows: List[Dict[str, Any]] = []
+        cursor = None
+        while not self.size or len(rows) < self.size:
+            limit = self.page_size if not self.size else min(self.page_size, self.size - len(rows))
+            page = await db_service.agent_query(limit, before=cursor, fields=FIELDS)
+            if page is None:
+                logger.error("Event window reload failed; keeping previous window")
+                return
+            rows += page
+            if len(page) < limit:
+                break
+            cursor = encode_cursor(page[-1])
+        rows.reverse()
+        self.columns = to_columns(rows)
+        self.epoch += 1
+        self.start, self.end = 0, len(rows)
+        self._cursor = encode_cursor(rows[-1]) if rows else "0"
+        self._loaded_at = time.monotonic()
+
+    async def _append_new(self):
+        while True:
+            page = await db_service.agent_query(self.page_size, after=self._cursor, fields=FIELDS)
+            if page is None:
+                logger.error("Event window refresh failed")
+                return
+            if page:
+                self._append(to_columns(page))
+                self._cursor = encode_cursor(page[-1])
+            if len(page) < self.page_size:
+                return
+
+    def _append(self, batch: Columns):
+        count = len(batch["id"])
+        self.columns = {name: np.concatenate([self.columns[name], batch[name]]) for name in self.columns}
+        self.end += count
+        if self.size and len(self) > self.size:
+            trim = len(self) - self.size
+            self.columns = {name: values[trim:] for name, values in self.columns.items()}
+            self.start += trim
+
+    def since(self, epoch: int, position: int) -> Optional[Columns]:
+        """Rows appended after `position` in `epoch`, or None if the caller must rebuild"""
+        if epoch != self.epoch or position < self.start:
+            return None
+        offset = position - self.start
+        return {name: values[offset:] for name, values in self.columns.items()}
+
+
+# Global event window instance
+event_window = EventWindow(
+    settings.EVENT_WINDOW_SIZE,
+    settings.EVENT_WINDOW_PAGE_SIZE,
+    settings.EVENT_WINDOW_REFRESH_INTERVAL,
+    settings.EVENT_WINDOW_RESYNC_INTERVAL,
+)
@@ -1,57 +1,75 @@
 import os
 import json
-import time
-import asyncio
+import logging
 from datetime import datetime
 from strands import Agent, tool
 from strands.models.anthropic import AnthropicModel
 import httpx
-from typing import Dict, Any, List, Optional
+from typing import Optional
 import pypandoc
 
-# Configuration - set your API base URL here
-BASE_URL = "http://localhost:8000"  # Change this to your deployed URL as needed
+from config import settings
+from event_summary import event_summary
+
+logger = logging.getLogger(__name__)
+
+# Configuration - leave REPORT_DATA_API_URL empty to read the database in-process
+BASE_URL = settings.REPORT_DATA_API_URL
+
+# Shared pooled client, only used when the data API is remote
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            base_url=BASE_URL,
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
 
 # ============= API-CALLING TOOLS =============
 
 @tool
-async def get_recent_financial_data(limit: int = 100) -> dict:
+async def get_recent_financial_data() -> dict:
     """
-    Get the most recent financial data rows for analysis.
-    
-    Args:
-        limit (int): Number of recent rows to fetch (default: 100, max: 1000)
+    Get a statistical summary of the recent financial data for analysis: per-type
+    counts, amount quantiles, fraud rates, balance mismatches and top counterparties.
     
     Returns:
-        dict: Financial data response with events
+        dict: Summary of the events in the configured window
     """
     try:
-        # Ensure limit doesn't exceed 1000
-        limit = min(limit, 1000)
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{BASE_URL}/api/agent-query",
-                params={"limit": limit},
-                timeout=30.0
-            )
+        if BASE_URL:
+            response = await get_http_client().get("/api/events/summary")
             response.raise_for_status()
+            summary = response.json()
+        else:
+            summary = await event_summary.get()
             
-            data = response.json()
-            
-            return {
-                "status": "success",
-                "timestamp": datetime.now().isoformat(),
-                "data": data.get("events", data) if isinstance(data, dict) else data,
-                "count": len(data.get("events", data) if isinstance(data, dict) else data),
-                "message": f"Retrieved {len(data.get('events', data) if isinstance(data, dict) else data)} financial records"
-            }
+        return {
+            "status": "success",
+            "timestamp": datetime.now().isoformat(),
+            "summary": summary,
+            "count": summary.get("rows", 0),
+            "message": f"Summarised {summary.get('rows', 0)} financial records"
+        }
     
     except httpx.HTTPStatusError as e:
         return {
             "status": "error",
             "timestamp": datetime.now().isoformat(),
-            "data": [],
+            "summary": None,
             "count": 0,
             "message": f"HTTP {e.response.status_code} error: {str(e)}"
         }
@@ -59,44 +77,35 @@ async def get_recent_financial_data(limit: int = 100) -> dict:
         return {
             "status": "error",
             "timestamp": datetime.now().isoformat(),
-            "data": [],
+            "summary": None,
             "count": 0,
             "message": f"Error retrieving financial data: {str(e)}"
         }
     
 
-def save_financial_report_to_pdf(markdown_text: str, images: list) -> str:
+def save_financial_report_to_pdf(markdown_text: str, images: list, pdf_path: Optional[str] = None) -> str:
     """
     Convert the agent's Markdown report into a PDF with embedded screenshots.
     
     Args:
         markdown_text (str): Markdown text generated by the agent
-        images (list): Uploaded screenshots in {filename, content_base64} format
+        images (list): Spooled screenshots in {filename, path, size} format
+        pdf_path (str): Output path; a timestamped file in generated_reports by default
 
     Returns:
         str: Path to the generated PDF file
     """
-    # Create temp directory for images
-    temp_dir = tempfile.mkdtemp()
-    image_paths = []
-
+    # Screenshots are already on disk; reference them in place
     for img in images:
-        img_path = os.path.join(temp_dir, img['filename'])
-        with open(img_path, "wb") as f:
-            f.write(base64.b64decode(img['content_base64']))
-        image_paths.append(img_path)
-
-    # Add images to the Markdown
-    for path in image_paths:
         # Pandoc syntax for embedding images
-        markdown_text += f"\n\n![]({path})\n\n"
+        markdown_text += f"\n\n![]({os.path.abspath(img['path'])})\n\n"
 
     # Ensure output directory exists
-    output_dir = "generated_reports"
-    os.makedirs(output_dir, exist_ok=True)
-    pdf_path = os.path.join(
-        output_dir, f"financial_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    )
+    if pdf_path is None:
+        pdf_path = os.path.join(
+            "generated_reports", f"financial_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        )
+    os.makedirs(os.path.dirname(pdf_path) or ".", exist_ok=True)
 
     # Convert Markdown → PDF
     pypandoc.convert_text(
@@ -151,7 +160,7 @@ def get_financial_report_prompt(images: list, recent_data: dict) -> str:
     
     Args:
         images (list): Encoded screenshots of graphs
-        recent_data (dict): Most recent financial data rows
+        recent_data (dict): Summary of the most recent financial data rows
     
     Returns:
         str: Detailed financial analysis + report generation prompt
@@ -165,8 +174,8 @@ You have access to:
 1. **Screenshots of current financial graphs**:  
    {[img['filename'] for img in images]}
 
-2. **Recent financial data rows (up to {len(recent_data.get("data", []))} records)**:  
-   {recent_data}
+2. **Statistical summary of recent financial data ({recent_data.get("count", 0)} records)**:  
+   {json.dumps(recent_data.get("summary"), default=str)}
 
 ---
 
@@ -205,6 +214,32 @@ Ensure the Markdown is **well-structured and cleanly formatted** so it can be di
 # ============= MAIN EXECUTION FUNCTIONS =============
 
 
+async def write_financial_report(api_key: str, images: list) -> str:
+    """
+    Fetches recent data and runs the agent; the LLM stage of a report job.
+
+    Args:
+        api_key (str): Anthropic API key
+        images (list): List of spooled screenshots in
+                       {filename, path, size} format
+
+    Returns:
+        str: Markdown report text
+    """
+    # Create the AI agent
+    agent = create_agent(api_key)
+
+    # Fetch recent financial data using the tool directly
+    recent_data = await get_recent_financial_data()
+
+    # Build the prompt
+    message = get_financial_report_prompt(images=images, recent_data=recent_data)
+
+    # Run the agent without blocking the event loop
+    result = await agent.invoke_async(message)
+    return str(result)
+
+
 async def run_graph_management_agent(
     api_key: str,
     images: list
@@ -214,37 +249,23 @@ async def run_graph_management_agent(
 
     Args:
         api_key (str): Anthropic API key
-        images (list): List of uploaded screenshots in 
-                       {filename, content_base64} format
+        images (list): List of spooled screenshots in
+                       {filename, path, size} format
 
     Returns:
         str: Path to the generated PDF report
     """
-    print("🚀 Starting Financial Report Generation Agent...")
-    print(f"🌐 API Base URL: {BASE_URL}")
-    print(f"🖼️ Received {len(images)} images")
-    print(f"⏰ Start time: {datetime.now()}")
-    print("=" * 80)
-
-    # Create the AI agent
-    agent = create_agent(api_key)
+    logger.info(f"Starting financial report generation with {len(images)} images; data source: {BASE_URL or 'in-process database'}")
 
     try:
-        # Fetch recent financial data using the tool directly
-        recent_data = await get_recent_financial_data(limit=100)
-
-        # Build the prompt
-        message = get_financial_report_prompt(images=images, recent_data=recent_data)
-
-        # Run the agent
-        result = await agent(message)
+        markdown_text = await write_financial_report(api_key, images)
 
-        # Save report as PDF (you still need to implement this helper)
-        pdf_path = save_financial_report_to_pdf(result, images)
+        # Save report as PDF
+        pdf_path = save_financial_report_to_pdf(markdown_text, images)
 
-        print(f"✅ Financial report generated successfully: {pdf_path}")
+        logger.info(f"Financial report generated: {pdf_path}")
         return pdf_path
 
     except Exception as e:
-        print(f"❌ Agent error: {e}")
+        logger.error(f"Report agent error: {e}")
         raise
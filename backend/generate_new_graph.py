@@ -1,14 +1,19 @@
-import os
+import asyncio
 import json
-from typing import Any, Dict, List
+import logging
+import time
 
 from pydantic import ValidationError
+from config import settings
+from generation_cache import GenerationCache
+from metrics import metrics
+from schema_digest import schema_digest
+from shared_cache import shared_cache
+from singleflight import single_flight
 from models import GraphBase
 
-try:
-    import anthropic
-except ImportError:  # pragma: no cover
-    anthropic = None  # We will validate at runtime
+
+logger = logging.getLogger(__name__)
 
 
 GRAPH_PROMPT_PREAMBLE = (
@@ -51,33 +56,117 @@ Constraints:
 )
 
 
-def _build_prompt(user_request: str, recent_events_sample: List[Dict[str, Any]]) -> str:
-    sample_preview = json.dumps(recent_events_sample[:5], indent=2) if recent_events_sample else "[]"
+def _build_prompt(user_request: str, schema_summary: str) -> str:
     return (
         f"{GRAPH_PROMPT_PREAMBLE}\n\n"
         f"User request: {user_request}\n\n"
-        f"Recent events sample (JSON, first 5 rows):\n{sample_preview}\n\n"
+        f"{schema_summary}\n\n"
         f"{GRAPH_SCHEMA_INSTRUCTIONS}\n\n"
         "Return ONLY the JSON object, no code fences."
     )
 
-def call_anthropic_generate_graph(prompt: str) -> GraphBase:
-    api_key = os.getenv("ANTHROPIC_API_KEY")
-    if not api_key:
+class GenerationLimiter:
+    """Caps concurrent in-flight LLM generations and tracks how many are queued behind the cap"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.queued = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __aenter__(self):
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.in_flight, "queued": self.queued}
+
+
+generation_limiter = GenerationLimiter(settings.GRAPH_GENERATION_CONCURRENCY)
+# Generation runs at temperature 0, so a prompt's output only changes with the instructions or model
+generation_cache = GenerationCache(
+    fingerprint=GRAPH_PROMPT_PREAMBLE + GRAPH_SCHEMA_INSTRUCTIONS + settings.ANTHROPIC_MODEL,
+    maxsize=settings.GENERATION_CACHE_SIZE,
+    ttl=settings.GENERATION_CACHE_TTL,
+    similarity_threshold=settings.GENERATION_SIMILARITY_THRESHOLD or None,
+)
+_anthropic_client = None
+
+generation_seconds = metrics.histogram(
+    "graph_generation_stage_duration_seconds", "Graph generation time by stage (schema, llm, parse)", ("stage",)
+)
+metrics.track_cache("graph_generation", generation_cache)
+metrics.gauge("graph_generations_in_flight", "LLM graph generations running", fn=lambda: generation_limiter.in_flight)
+metrics.gauge("graph_generations_queued", "LLM graph generations waiting for a slot", fn=lambda: generation_limiter.queued)
+
+
+def get_anthropic_client():
+    """Process-wide AsyncAnthropic client, so every generation shares one connection pool"""
+    global _anthropic_client
+    if _anthropic_client is not None:
+        return _anthropic_client
+
+    if not settings.ANTHROPIC_API_KEY:
         raise RuntimeError("ANTHROPIC_API_KEY is not set")
 
-    if anthropic is None:
+    # Imported on first use; the SDK and httpx are a large part of the app's import time
+    try:
+        import anthropic
+        import httpx
+    except ImportError:  # pragma: no cover
         raise RuntimeError(
             "The 'anthropic' package is not installed. Please add it to requirements.txt"
         )
 
-    client = anthropic.Anthropic(api_key=api_key)
-    resp = client.messages.create(
-        model="claude-3-5-sonnet-20240620",
-        max_tokens=800,
-        temperature=0,
-        messages=[{"role": "user", "content": prompt}],
+    _anthropic_client = anthropic.AsyncAnthropic(
+        api_key=settings.ANTHROPIC_API_KEY,
+        base_url=settings.ANTHROPIC_BASE_URL or None,
+        timeout=settings.ANTHROPIC_TIMEOUT,
+        max_retries=settings.ANTHROPIC_MAX_RETRIES,
+        http_client=anthropic.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=settings.ANTHROPIC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.ANTHROPIC_MAX_CONNECTIONS,
+            ),
+        ),
     )
+    return _anthropic_client
+
+
+async def close_anthropic_client():
+    global _anthropic_client
+    if _anthropic_client is not None:
+        await _anthropic_client.close()
+        _anthropic_client = None
+
+
+async def call_anthropic_generate_graph(prompt: str) -> GraphBase:
+    client = get_anthropic_client()
+    async with generation_limiter:
+        with generation_seconds.time("llm"):
+            resp = await client.messages.create(
+                model=settings.ANTHROPIC_MODEL,
+                max_tokens=800,
+                temperature=0,
+                messages=[{"role": "user", "content": prompt}],
+            )
+    started = time.perf_counter()
+    try:
+        return _parse_graph(resp)
+    finally:
+        generation_seconds.observe(time.perf_counter() - started, "parse")
+
+
+def _parse_graph(resp) -> GraphBase:
     # Extract text content
     parts = getattr(resp, "content", [])
     text = "".join([p.text for p in parts if hasattr(p, "text")]) if parts else ""
@@ -123,14 +212,30 @@ def call_anthropic_generate_graph(prompt: str) -> GraphBase:
     return normalized
 
 
-def generate_graph_from_request(
-    user_request: str,
-    recent_events: List[Dict[str, Any]] | None = None,
-) -> GraphBase:
-    prompt = _build_prompt(
-        user_request,
-        recent_events or [],
+async def _generate(user_request: str) -> GraphBase:
+    with generation_seconds.time("schema"):
+        schema_summary = await schema_digest.get_text()
+    prompt = _build_prompt(user_request, schema_summary)
+    return await call_anthropic_generate_graph(prompt)
+
+
+# Prompts that normalise to the same cache key share one LLM call
+@single_flight("graph_generation", key=lambda user_request: generation_cache.key(user_request))
+async def generate_graph_from_request(user_request: str) -> GraphBase:
+    cached = generation_cache.get(user_request)
+    if cached is not None:
+        return cached
+
+    # Other workers may have generated it already, or be generating it right now
+    graph = await shared_cache.get_or_compute(
+        f"generation:{generation_cache.key(user_request)}",
+        lambda: _generate(user_request),
+        ttl=settings.GENERATION_CACHE_TTL,
+        encode=lambda graph: graph.model_dump_json().encode(),
+        decode=GraphBase.model_validate_json,
+        lease_ttl=settings.ANTHROPIC_TIMEOUT * (settings.ANTHROPIC_MAX_RETRIES + 1),
     )
-    return call_anthropic_generate_graph(prompt)
+    generation_cache.set(user_request, graph)
+    return graph
 
 
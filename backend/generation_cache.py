@@ -0,0 +1,115 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+from cache import MISSING, TTLCache
+from models import GraphBase
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_request(user_request: str) -> str:
+    """Canonical form of a prompt: case, punctuation and whitespace differences are ignored"""
+    text = unicodedata.normalize("NFKC", user_request).lower()
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def _shingles(normalized: str) -> frozenset:
+    """Word unigrams and bigrams; a single changed word moves the Jaccard score a lot"""
+    words = normalized.split()
+    return frozenset(words) | frozenset(zip(words, words[1:]))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class GenerationCache:
+    """Cache of generated graph definitions keyed by normalised request.
+
+    Keys also include a fingerprint of everything else that shapes the prompt (schema
+    instructions, model), so changing those never serves stale generations. When
+    `similarity_threshold` is set, a miss falls back to the most similar cached request
+    whose word-shingle Jaccard score reaches the threshold.
+    """
+
+    def __init__(self, fingerprint: str, maxsize: int, ttl: float, similarity_threshold: Optional[float] = None):
+        self.fingerprint = hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._exact = TTLCache(maxsize, ttl)
+        self._shingles: "OrderedDict[str, frozenset]" = OrderedDict()
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+
+    def _key(self, normalized: str) -> str:
+        return f"{self.fingerprint}:{hashlib.sha256(normalized.encode()).hexdigest()}"
+
+    def key(self, user_request: str) -> str:
+        """Cache key of user_request, also used for the shared cache tier"""
+        return self._key(normalize_request(user_request))
+
+    def get(self, user_request: str) -> Optional[GraphBase]:
+        normalized = normalize_request(user_request)
+        graph = self._exact.get(self._key(normalized))
+        if graph is MISSING and self.similarity_threshold:
+            graph = self._get_similar(normalized)
+            if graph is not MISSING:
+                self.similar_hits += 1
+        if graph is MISSING:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return graph.model_copy(deep=True)
+
+    def _get_similar(self, normalized: str):
+        shingles = _shingles(normalized)
+        with self._lock:
+            candidates = list(self._shingles.items())
+        best, best_score = None, self.similarity_threshold
+        for other, other_shingles in candidates:
+            score = _jaccard(shingles, other_shingles)
+            if score >= best_score:
+                best, best_score = other, score
+        if best is None:
+            return MISSING
+        graph = self._exact.get(self._key(best))
+        if graph is MISSING:
+            with self._lock:
+                self._shingles.pop(best, None)
+        return graph
+
+    def set(self, user_request: str, graph: GraphBase):
+        normalized = normalize_request(user_request)
+        self._exact.set(self._key(normalized), graph.model_copy(deep=True))
+        if self.similarity_threshold:
+            with self._lock:
+                self._shingles[normalized] = _shingles(normalized)
+                self._shingles.move_to_end(normalized)
+                while len(self._shingles) > self._maxsize:
+                    self._shingles.popitem(last=False)
+
+    def clear(self):
+        self._exact.clear()
+        with self._lock:
+            self._shingles.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._exact),
+            "maxsize": self._maxsize,
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
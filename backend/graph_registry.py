@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from database import db_service
+from shared_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+# Shared-cache key holding a token that changes whenever any worker writes a graph
+VERSION_KEY = "graphs:version"
+VERSION_TTL = 7 * 24 * 3600
+
+
+class GraphRegistry:
+    """In-process copy of the graphs table kept coherent by writing through it.
+
+    Definitions are loaded once and served from memory. Creates, updates and deletes go
+    to the database and are applied here on success; the whole table is reloaded every
+    `ttl` seconds to pick up changes made by other processes. With a shared cache tier,
+    writes also publish a version token there, and other workers reload as soon as
+    they see it change.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._graphs: Dict[str, Dict[str, Any]] = {}
+        self._loaded_at: Optional[float] = None
+        self._version = 0
+        self._etag: Optional[str] = None
+        self._lock = asyncio.Lock()
+        # Last version token seen in the shared cache
+        self._shared_version: Optional[bytes] = None
+
+    def _is_fresh(self) -> bool:
+        if self._loaded_at is None:
+            return False
+        return self.ttl <= 0 or time.monotonic() - self._loaded_at < self.ttl
+
+    async def _check_shared_version(self):
+        if not shared_cache.shared:
+            return
+        version = (await shared_cache.get_many([VERSION_KEY])).get(VERSION_KEY)
+        if version != self._shared_version:
+            # Another worker changed a graph since we last looked
+            self._shared_version = version
+            self._loaded_at = None
+
+    async def _publish(self):
+        if not shared_cache.shared:
+            return
+        version = uuid.uuid4().hex.encode()
+        await shared_cache.set(VERSION_KEY, version, VERSION_TTL)
+        self._shared_version = version
+
+    async def _ensure_loaded(self):
+        await self._check_shared_version()
+        if self._is_fresh():
+            return
+        async with self._lock:
+            if self._is_fresh():
+                return
+            version = self._version
+            graphs = await db_service.get_all_graphs()
+            if graphs is None:
+                # Keep serving what we have; retry on the next request
+                return
+            if version != self._version:
+                # A write landed while loading; its result is newer than this snapshot
+                return
+            self._graphs = {graph["id"]: graph for graph in graphs}
+            self._loaded_at = time.monotonic()
+            self._changed()
+
+    def _changed(self):
+        self._version += 1
+        self._etag = None
+
+    def _put(self, graph: Dict[str, Any]):
+        self._graphs[graph["id"]] = graph
+        self._changed()
+
+    async def list(self) -> List[Dict[str, Any]]:
+        await self._ensure_loaded()
+        return list(self._graphs.values())
+
+    async def etag(self) -> str:
+        """Weak validator that changes whenever any graph definition changes"""
+        await self._ensure_loaded()
+        if self._etag is None:
+            payload = json.dumps(sorted(self._graphs.items()), sort_keys=True, default=str)
+            self._etag = f'W/"{hashlib.sha1(payload.encode()).hexdigest()}"'
+        return self._etag
+
+    async def get(self, graph_id: str) -> Optional[Dict[str, Any]]:
+        await self._ensure_loaded()
+        graph = self._graphs.get(graph_id)
+        if graph is None:
+            # May have been created by another process since the last reload
+            graph = await db_service.get_graph(graph_id)
+            if graph:
+                self._put(graph)
+        return graph
+
+    async def knows(self, graph_id: str) -> bool:
+        """Whether graph_id is in the registry, without a database lookup"""
+        await self._ensure_loaded()
+        return graph_id in self._graphs
+
+    async def create(self, graph_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        graph = await db_service.create_graph(graph_data)
+        if graph:
+            self._put(graph)
+            await self._publish()
+        return graph
+
+    async def update(self, graph_id: str, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Update in a single round-trip; None means no row matched or the write failed"""
+        graph = await db_service.update_graph(graph_id, update_data)
+        if graph:
+            self._put(graph)
+            await self._publish()
+        return graph
+
+    async def delete(self, graph_id: str) -> bool:
+        """Delete in a single round-trip; False means no row matched or the write failed"""
+        deleted = await db_service.delete_graph(graph_id)
+        if deleted:
+            self._graphs.pop(graph_id, None)
+            self._changed()
+            await self._publish()
+        return deleted
+
+
+# Global graph registry instance
+graph_registry = GraphRegistry(settings.GRAPH_REGISTRY_TTL)
@@ -0,0 +1,485 @@
+"""
+Incremental aggregation for simple grouped chart queries.
+
+Chart SQL of the shape
+
+    SELECT <key expr> AS <key>, AGG(<expr>) AS <value>[, ...]
+    FROM events [WHERE <row predicate>]
+    GROUP BY <key expr> [ORDER BY ...]
+
+with AGG in SUM/COUNT/AVG/MIN/MAX is decomposable: the result over events up to a
+cursor is the merge of per-group partial states over disjoint time ranges. The engine
+keeps that partial state per graph and, when the cursor advances, only aggregates the
+events in (last cursor, new cursor]. Anything it cannot decompose is run in full.
+
+Events written through the batch writer with a time at or before a state's cursor
+would never be folded in, so the writer reports the oldest time it wrote and every
+state whose cursor is at or after it is dropped and rebuilt on its next run; with a
+shared cache tier the time is also published for the other workers. Rows written by
+other means are picked up when the state is rebuilt every INCREMENTAL_RESYNC_INTERVAL
+seconds.
+"""
+import asyncio
+import logging
+import re
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache import MISSING, TTLCache
+from config import settings
+from database import db_service
+from metrics import metrics
+from shared_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+# Shared-cache key holding "<token>:<oldest event time>" of the last batch any worker wrote
+WRITTEN_KEY = "incremental:written"
+# Recent (epoch, oldest time) writes kept to tell whether a run overlapped one
+WRITE_HISTORY = 1024
+
+_CLAUSE_RE = re.compile(
+    r"\b(SELECT|FROM|WHERE|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT|OFFSET|FETCH|UNION|INTERSECT|EXCEPT|WITH|WINDOW)\b",
+    re.IGNORECASE,
+)
+_UNSUPPORTED_RE = re.compile(
+    r"\b(SELECT|DISTINCT|OVER|JOIN|FILTER|WITHIN\s+GROUP|NOW|RANDOM|CURRENT_\w+|CLOCK_TIMESTAMP)\b|--|/\*|;",
+    re.IGNORECASE,
+)
+_AGGREGATE_CALL_RE = re.compile(r"\b(SUM|COUNT|AVG|MIN|MAX|STRING_AGG|ARRAY_AGG|JSON_AGG|JSONB_AGG|BOOL_\w+|STDDEV\w*|VAR\w*|PERCENTILE_\w+|MODE)\s*\(", re.IGNORECASE)
+_AGGREGATE_RE = re.compile(r"^(SUM|COUNT|AVG|MIN|MAX)\s*\(", re.IGNORECASE)
+_ALIAS_RE = re.compile(r"^(?P<expr>.+?)\s+AS\s+(?P<alias>[A-Za-z_][A-Za-z0-9_]*|\"[^\"]+\")$", re.IGNORECASE | re.DOTALL)
+_ORDER_ITEM_RE = re.compile(r"^(?P<ref>.+?)(?:\s+(?P<direction>ASC|DESC))?$", re.IGNORECASE | re.DOTALL)
+_LOSSLESS_CASTS = {"numeric", "decimal", "float", "float4", "float8", "real", "double precision"}
+
+
+def mask_sql(sql: str, nested: bool = True) -> str:
+    """Blank out quoted text (and, if nested, anything inside parentheses) keeping offsets intact"""
+    out = []
+    depth = 0
+    quote = None
+    for ch in sql:
+        if quote:
+            out.append(" " if ch != quote else ch)
+            if ch == quote:
+                quote = None
+            continue
+        if ch in ("'", '"'):
+            quote = ch
+            out.append(ch)
+        elif ch == "(":
+            out.append(ch if depth == 0 or not nested else " ")
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            out.append(ch if depth == 0 or not nested else " ")
+        else:
+            out.append(ch if depth == 0 or not nested else " ")
+    return "".join(out)
+
+
+def split_top_level(text: str) -> List[str]:
+    masked = mask_sql(text)
+    parts, start = [], 0
+    for i, ch in enumerate(masked):
+        if ch == ",":
+            parts.append(text[start:i].strip())
+            start = i + 1
+    parts.append(text[start:].strip())
+    return parts
+
+
+def _normalize(expr: str) -> str:
+    return re.sub(r"\s+", " ", expr.strip()).lower()
+
+
+@dataclass
+class Aggregate:
+    alias: str
+    func: str
+    arg: str
+
+
+@dataclass
+class AggregateQuery:
+    """A parsed decomposable chart query"""
+    key_alias: str
+    key_expr: str
+    where: Optional[str]
+    aggregates: List[Aggregate]
+    # Output columns in SELECT order, and (alias, descending) ORDER BY items
+    columns: List[str]
+    order: List[Tuple[str, bool]] = field(default_factory=list)
+
+    def partial_sql(self) -> str:
+        """SQL computing per-group partial state, to be run over a time slice of events"""
+        columns = [f"{self.key_expr} AS __key"]
+        for i, agg in enumerate(self.aggregates):
+            if agg.func in ("SUM", "AVG"):
+                columns.append(f"SUM({agg.arg}) AS __s{i}")
+            if agg.func in ("COUNT", "AVG"):
+                columns.append(f"COUNT({agg.arg}) AS __c{i}")
+            if agg.func in ("MIN", "MAX"):
+                columns.append(f"{agg.func}({agg.arg}) AS __m{i}")
+        where = f" WHERE {self.where}" if self.where else ""
+        return f"SELECT {', '.join(columns)} FROM events{where} GROUP BY {self.key_expr}"
+
+    def scan_key(self) -> Tuple[str, str]:
+        """Queries with equal scan keys read the same rows into the same groups"""
+        return _normalize(self.key_expr), _normalize(self.where or "")
+
+    def merge(self, groups: Dict[Any, list], partial_rows: List[Dict[str, Any]]):
+        """Fold partial_sql() result rows into the running per-group state"""
+        for row in partial_rows:
+            key = row.get("__key")
+            state = groups.get(key)
+            if state is None:
+                state = groups[key] = [None] * (2 * len(self.aggregates))
+            for i, agg in enumerate(self.aggregates):
+                if agg.func in ("SUM", "AVG"):
+                    state[2 * i] = _add(state[2 * i], row.get(f"__s{i}"))
+                if agg.func in ("COUNT", "AVG"):
+                    state[2 * i + 1] = _add(state[2 * i + 1], row.get(f"__c{i}"))
+                if agg.func == "MIN":
+                    state[2 * i] = _pick(min, state[2 * i], row.get(f"__m{i}"))
+                if agg.func == "MAX":
+                    state[2 * i] = _pick(max, state[2 * i], row.get(f"__m{i}"))
+
+    def finalize(self, groups: Dict[Any, list]) -> List[Dict[str, Any]]:
+        """Turn the running state into rows shaped like the original query's output"""
+        rows = []
+        for key, state in groups.items():
+            row = {self.key_alias: key}
+            for i, agg in enumerate(self.aggregates):
+                if agg.func == "COUNT":
+                    row[agg.alias] = state[2 * i + 1] or 0
+                elif agg.func == "AVG":
+                    total, count = state[2 * i], state[2 * i + 1]
+                    row[agg.alias] = total / count if count else None
+                else:
+                    row[agg.alias] = state[2 * i]
+            rows.append({column: row[column] for column in self.columns})
+
+        order = self.order or [(self.key_alias, False)]
+        for alias, descending in reversed(order):
+            # Postgres puts NULLs last ascending and first descending
+            rows.sort(key=lambda r: (r[alias] is None, r[alias] if r[alias] is not None else 0), reverse=descending)
+        return rows
+
+
+def combine_queries(queries: List[AggregateQuery]) -> AggregateQuery:
+    """One query whose partial_sql() computes the partial state of every query sharing a scan key"""
+    first = queries[0]
+    return AggregateQuery(
+        key_alias="__key",
+        key_expr=first.key_expr,
+        where=first.where,
+        aggregates=[agg for query in queries for agg in query.aggregates],
+        columns=[],
+    )
+
+
+def split_partial_rows(queries: List[AggregateQuery], rows: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Split combine_queries(queries).partial_sql() rows into each query's own partial_sql() rows"""
+    parts = []
+    offset = 0
+    for query in queries:
+        renamed = []
+        for row in rows:
+            part = {"__key": row.get("__key")}
+            for i in range(len(query.aggregates)):
+                for prefix in ("__s", "__c", "__m"):
+                    if f"{prefix}{offset + i}" in row:
+                        part[f"{prefix}{i}"] = row[f"{prefix}{offset + i}"]
+            renamed.append(part)
+        parts.append(renamed)
+        offset += len(query.aggregates)
+    return parts
+
+
+def _add(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a + b
+
+
+def _pick(fn, a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return fn(a, b)
+
+
+def _parse_aggregate(expr: str) -> Optional[Tuple[str, str]]:
+    """Split `AGG(arg)[::cast]` into (AGG, arg); None if expr is not a single decomposable aggregate"""
+    match = _AGGREGATE_RE.match(expr)
+    if not match:
+        return None
+    open_index = match.end() - 1
+    masked = mask_sql(expr, nested=False)
+    depth = 0
+    close_index = None
+    for i in range(open_index, len(masked)):
+        if masked[i] == "(":
+            depth += 1
+        elif masked[i] == ")":
+            depth -= 1
+            if depth == 0:
+                close_index = i
+                break
+    if close_index is None:
+        return None
+    rest = expr[close_index + 1:].strip()
+    if rest:
+        cast = re.match(r"^::\s*([A-Za-z ]+?)\s*$", rest)
+        if not cast or cast.group(1).lower() not in _LOSSLESS_CASTS:
+            return None
+    arg = expr[open_index + 1:close_index].strip()
+    if not arg or _AGGREGATE_CALL_RE.search(arg):
+        return None
+    func = match.group(1).upper()
+    if arg == "*" and func != "COUNT":
+        return None
+    return func, arg
+
+
+@lru_cache(maxsize=512)
+def parse_aggregate_query(sql: str) -> Optional[AggregateQuery]:
+    """Parse sql into an AggregateQuery, or None if it cannot be evaluated incrementally"""
+    sql = sql.strip().rstrip(";").strip()
+    unquoted = mask_sql(sql, nested=False)
+    if not re.match(r"SELECT\b", unquoted, re.IGNORECASE) or _UNSUPPORTED_RE.search(unquoted[6:]):
+        # Subquery, window, DISTINCT, join, comment or a second statement
+        return None
+
+    masked = mask_sql(sql)
+    clauses = [(m.start(), m.end(), re.sub(r"\s+", " ", m.group(1)).upper()) for m in _CLAUSE_RE.finditer(masked)]
+    names = [name for _, _, name in clauses]
+    if names not in (
+        ["SELECT", "FROM", "GROUP BY"],
+        ["SELECT", "FROM", "WHERE", "GROUP BY"],
+        ["SELECT", "FROM", "GROUP BY", "ORDER BY"],
+        ["SELECT", "FROM", "WHERE", "GROUP BY", "ORDER BY"],
+    ) or clauses[0][0] != 0:
+        return None
+
+    bodies = {}
+    for i, (_, end, name) in enumerate(clauses):
+        stop = clauses[i + 1][0] if i + 1 < len(clauses) else len(sql)
+        bodies[name] = sql[end:stop].strip()
+
+    if bodies["FROM"].lower() != "events":
+        return None
+
+    where = bodies.get("WHERE")
+    if where is not None and _AGGREGATE_CALL_RE.search(mask_sql(where, nested=False)):
+        return None
+
+    key = None
+    aggregates: List[Aggregate] = []
+    columns: List[str] = []
+    expressions: Dict[str, str] = {}
+    for item in split_top_level(bodies["SELECT"]):
+        match = _ALIAS_RE.match(item)
+        if not match or not _ALIAS_RE.match(mask_sql(item)):
+            return None
+        expr, alias = match.group("expr").strip(), match.group("alias").strip('"')
+        if alias in expressions:
+            return None
+        columns.append(alias)
+        expressions[alias] = expr
+        aggregate = _parse_aggregate(expr)
+        if aggregate:
+            aggregates.append(Aggregate(alias=alias, func=aggregate[0], arg=aggregate[1]))
+        elif _AGGREGATE_CALL_RE.search(mask_sql(expr, nested=False)) or key is not None:
+            return None
+        else:
+            key = (alias, expr)
+    if key is None or not aggregates:
+        return None
+
+    key_alias, key_expr = key
+    group_by = split_top_level(bodies["GROUP BY"])
+    if len(group_by) != 1:
+        return None
+    group = _normalize(group_by[0])
+    if group not in (_normalize(key_expr), key_alias.lower(), str(columns.index(key_alias) + 1)):
+        return None
+
+    order = []
+    if "ORDER BY" in bodies:
+        for item in split_top_level(bodies["ORDER BY"]):
+            match = _ORDER_ITEM_RE.match(item)
+            ref = _normalize(match.group("ref"))
+            descending = (match.group("direction") or "").upper() == "DESC"
+            target = None
+            for index, alias in enumerate(columns):
+                if ref in (alias.lower(), f'"{alias.lower()}"', str(index + 1), _normalize(expressions[alias])):
+                    target = alias
+                    break
+            if target is None:
+                return None
+            order.append((target, descending))
+
+    return AggregateQuery(
+        key_alias=key_alias,
+        key_expr=key_expr,
+        where=where,
+        aggregates=aggregates,
+        columns=columns,
+        order=order,
+    )
+
+
+@dataclass
+class _GraphState:
+    sql_query: str
+    cursor: int
+    groups: Dict[Any, list] = field(default_factory=dict)
+
+
+class IncrementalEngine:
+    """Keeps running partial aggregates per graph and folds in only new events"""
+
+    def __init__(self):
+        # Entries expire after the resync interval, forcing a periodic full rebuild
+        self._states = TTLCache(settings.INCREMENTAL_STATE_SIZE, settings.INCREMENTAL_RESYNC_INTERVAL)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Bumped for every reported write; a run keeps its state only if no write since
+        # it started could have landed at or before its cursor
+        self.epoch = 0
+        self._writes: deque = deque(maxlen=WRITE_HISTORY)
+        # Last write token seen in the shared cache
+        self._shared_written: Optional[bytes] = None
+        self.incremental_runs = 0
+        self.rebuilds = 0
+        self.fallbacks = 0
+        self.resets = 0
+
+    async def run(self, graph: Dict[str, Any], before: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """Return the rows of graph's query at before, or None if the query failed"""
+        query = None
+        if settings.INCREMENTAL_ENABLED and before is not None:
+            query = parse_aggregate_query(graph["sql_query"])
+        if query is None:
+            self.fallbacks += 1
+            return await db_service.run_chart_query(graph["sql_query"], before)
+
+        await self._check_shared_writes()
+        lock = self._locks.setdefault(graph["id"], asyncio.Lock())
+        async with lock:
+            epoch = self.epoch
+            state = self._states.get(graph["id"])
+            rebuild = state is MISSING or state.sql_query != graph["sql_query"] or before < state.cursor
+            if rebuild:
+                rows = await db_service.run_chart_query(query.partial_sql(), before)
+                if rows is None:
+                    return None
+                state = _GraphState(sql_query=graph["sql_query"], cursor=before)
+                query.merge(state.groups, rows)
+                self._states.set(graph["id"], state)
+                self.rebuilds += 1
+            elif before > state.cursor:
+                rows = await db_service.run_chart_query(query.partial_sql(), before, after=state.cursor)
+                if rows is None:
+                    return None
+                query.merge(state.groups, rows)
+                state.cursor = before
+                self.incremental_runs += 1
+            if self.written_since(epoch, before):
+                # The query may have missed rows written while it ran
+                self._states.delete(graph["id"])
+            return query.finalize(state.groups)
+
+    def is_warm(self, graph: Dict[str, Any], before: Optional[int]) -> bool:
+        """Whether run() would only aggregate events newer than the kept state"""
+        if not settings.INCREMENTAL_ENABLED or before is None:
+            return False
+        state = self._states.get(graph["id"])
+        return state is not MISSING and state.sql_query == graph["sql_query"] and before >= state.cursor
+
+    def seed(
+        self,
+        graph: Dict[str, Any],
+        before: Optional[int],
+        query: AggregateQuery,
+        partial_rows: List[Dict[str, Any]],
+        epoch: int,
+    ) -> List[Dict[str, Any]]:
+        """Start graph's running state from partial rows computed elsewhere; returns the finished rows.
+
+        epoch is the value of self.epoch before the rows were queried.
+        """
+        state = _GraphState(sql_query=graph["sql_query"], cursor=before)
+        query.merge(state.groups, partial_rows)
+        if settings.INCREMENTAL_ENABLED and before is not None and not self.written_since(epoch, before):
+            self._states.set(graph["id"], state)
+            self.rebuilds += 1
+        return query.finalize(state.groups)
+
+    def written_since(self, epoch: int, before: int) -> bool:
+        """Whether events with time <= before were reported written after epoch"""
+        if epoch == self.epoch:
+            return False
+        if len(self._writes) == self._writes.maxlen and self._writes[0][0] > epoch + 1:
+            # Older writes have been forgotten; assume the worst
+            return True
+        return any(write_epoch > epoch and oldest <= before for write_epoch, oldest in self._writes)
+
+    def _reset_since(self, oldest: int) -> int:
+        self.epoch += 1
+        self._writes.append((self.epoch, oldest))
+        stale = [graph_id for graph_id, state in self._states.items() if state.cursor >= oldest]
+        for graph_id in stale:
+            self._states.delete(graph_id)
+        self.resets += len(stale)
+        return len(stale)
+
+    async def events_written(self, oldest: int):
+        """Drop every state, here and in other workers, whose cursor is at or after oldest"""
+        dropped = self._reset_since(oldest)
+        if dropped:
+            logger.debug(f"Dropped {dropped} incremental states for events written at time {oldest}")
+        if shared_cache.shared:
+            token = f"{uuid.uuid4().hex}:{int(oldest)}".encode()
+            await shared_cache.set(WRITTEN_KEY, token, settings.INCREMENTAL_RESYNC_INTERVAL)
+            self._shared_written = token
+
+    async def _check_shared_writes(self):
+        if not shared_cache.shared:
+            return
+        token = (await shared_cache.get_many([WRITTEN_KEY])).get(WRITTEN_KEY)
+        if token is not None and token != self._shared_written:
+            # Another worker wrote events since we last looked. Only its latest write is
+            # visible; one overwritten in between is covered by the periodic resync.
+            self._shared_written = token
+            self._reset_since(int(token.rpartition(b":")[2]))
+
+    def reset(self, graph_id: str):
+        """Forget the running state for graph_id.
+
+        The lock is kept: a run() holding it finishes before the next one starts.
+        """
+        self._states.delete(graph_id)
+
+
+# Global incremental engine instance
+incremental_engine = IncrementalEngine()
+metrics.counter(
+    "incremental_chart_runs_total", "Chart evaluations by incremental mode", ("mode",),
+    fn=lambda: {
+        ("incremental",): incremental_engine.incremental_runs,
+        ("rebuild",): incremental_engine.rebuilds,
+        ("full",): incremental_engine.fallbacks,
+    },
+)
+metrics.counter(
+    "incremental_state_resets_total", "Incremental states dropped because events were written at or before their cursor",
+    fn=lambda: incremental_engine.resets,
+)
@@ -0,0 +1,201 @@
+"""
+Bulk event ingestion: streaming request parsing and a shared, back-pressured batch writer.
+"""
+import asyncio
+import codecs
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from config import settings
+from database import db_service
+from incremental import incremental_engine
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# A single record larger than this is treated as malformed instead of buffered indefinitely
+MAX_RECORD_CHARS = 1 << 20
+_NUMBER_CHARS = "0123456789.eE+-"
+
+# (index, record, error): exactly one of record / error is set
+ParsedRecord = Tuple[int, Any, Optional[str]]
+
+
+async def iter_json_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[ParsedRecord]:
+    """Incrementally parse a JSON array or NDJSON body without buffering all of it.
+
+    The format is picked from the first non-whitespace character. A malformed or
+    oversized NDJSON line rejects only that record; in a JSON array either stops
+    parsing. Results do not depend on where the body is split into chunks.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    mode = None
+    index = 0
+    # Dropping the rest of an NDJSON line already rejected as too large
+    oversized = False
+
+    async for chunk in chunks:
+        buffer += text.decode(chunk)
+        if mode is None:
+            buffer = buffer.lstrip()
+            if not buffer:
+                continue
+            mode = "array" if buffer[0] == "[" else "ndjson"
+            if mode == "array":
+                buffer = buffer[1:]
+
+        if mode == "ndjson":
+            *lines, buffer = buffer.split("\n")
+            if oversized and lines:
+                lines.pop(0)
+                oversized = False
+            for line in lines:
+                if line.strip():
+                    yield _parse_line(index, line)
+                    index += 1
+            if oversized:
+                buffer = ""
+            elif len(buffer) > MAX_RECORD_CHARS:
+                yield index, None, "Record too large"
+                index += 1
+                buffer = ""
+                oversized = True
+            continue
+
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position >= len(buffer):
+                break
+            if buffer[position] == "]":
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if len(buffer) - position > MAX_RECORD_CHARS:
+                    yield index, None, "Malformed JSON array or record too large"
+                    return
+                # Most likely a record split across chunks; wait for more data
+                break
+            if end - position > MAX_RECORD_CHARS:
+                yield index, None, "Malformed JSON array or record too large"
+                return
+            if buffer[position] in "-0123456789" and not buffer[end:].lstrip(_NUMBER_CHARS):
+                # A number running to the end of the chunk may continue in the next one
+                break
+            position = end
+            yield index, record, None
+            index += 1
+        buffer = buffer[position:]
+
+    buffer += text.decode(b"", final=True)
+    if mode == "ndjson" and buffer.strip():
+        yield _parse_line(index, buffer)
+    elif mode == "array" and buffer.strip():
+        yield index, None, "Malformed or unterminated JSON array"
+
+
+def _parse_line(index: int, line: str) -> ParsedRecord:
+    if len(line) > MAX_RECORD_CHARS:
+        return index, None, "Record too large"
+    try:
+        return index, json.loads(line), None
+    except json.JSONDecodeError as e:
+        return index, None, f"Invalid JSON: {e}"
+
+
+class EventBatcher:
+    """Coalesces submitted events into multi-row inserts bounded by size and time.
+
+    Requests submit chunks of validated rows and get a future resolving to how many of
+    them were written. The pending queue is bounded, so when the database falls behind
+    `submit` blocks and ingestion requests stop reading their bodies.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, queue_batches: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_batches)
+        self._task: Optional[asyncio.Task] = None
+        self.flushed = 0
+        self.failed = 0
+        self.batches = 0
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, events: List[Dict[str, Any]]) -> asyncio.Future:
+        """Queue events for writing, waiting while the queue is full"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((events, future))
+        return future
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    async def _run(self):
+        while True:
+            pending = [await self._queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self.flush_interval
+            while size < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                size += len(item[0])
+            await self._flush(pending)
+
+    async def _flush(self, pending):
+        rows = [event for events, _ in pending for event in events]
+        # Storage writes rows in order, so a partial write covers the first `written` rows
+        written = await db_service.insert_events(rows)
+        if written:
+            # Rows at or before a chart's incremental cursor would otherwise never reach it
+            await incremental_engine.events_written(min(event["time"] for event in rows[:written]))
+        self.batches += 1
+        self.flushed += written
+        self.failed += len(rows) - written
+        remaining = written
+        for events, future in pending:
+            if not future.done():
+                future.set_result(min(len(events), remaining))
+            remaining = max(remaining - len(events), 0)
+            self._queue.task_done()
+
+    async def stop(self):
+        """Flush whatever is queued and stop the writer"""
+        if self._task is None:
+            return
+        if not self._task.done():
+            await self._queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+
+# Global event batcher instance
+event_batcher = EventBatcher(
+    settings.INGEST_BATCH_SIZE,
+    settings.INGEST_FLUSH_INTERVAL,
+    settings.INGEST_QUEUE_BATCHES,
+)
+metrics.gauge("ingest_queue_batches", "Event chunks waiting to be written", fn=event_batcher.queue_depth)
+metrics.counter(
+    "ingest_events_total", "Events handed to the database by outcome", ("outcome",),
+    fn=lambda: {("written",): event_batcher.flushed, ("failed",): event_batcher.failed},
+)
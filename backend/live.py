@@ -0,0 +1,191 @@
+"""
+Server-sent live updates: one shared producer polls for new events and recomputes
+chart results once per interval, then fans the serialized updates out to every
+connected subscriber.
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional, Set
+
+from charts import chart_service
+from config import settings
+from database import db_service, encode_cursor
+from graph_registry import graph_registry
+from metrics import metrics
+from responses import dumps_text
+
+logger = logging.getLogger(__name__)
+
+
+def _sse(event: str, payload: str) -> str:
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class Subscriber:
+    """Per-connection buffer.
+
+    New-event batches queue up to `max_batches`; beyond that the oldest are dropped and
+    a `gap` message tells the client how many rows it missed. Chart updates are
+    coalesced per graph, so a slow consumer only ever receives the latest result.
+    """
+
+    def __init__(self, max_batches: int, graph_ids: Optional[Set[str]] = None, include_events: bool = True):
+        self.graph_ids = graph_ids
+        self.include_events = include_events
+        self._event_batches: deque = deque()
+        self._max_batches = max_batches
+        self._charts: Dict[str, str] = {}
+        self._dropped = 0
+        self._wakeup = asyncio.Event()
+
+    def push_events(self, count: int, message: str):
+        if not self.include_events:
+            return
+        if len(self._event_batches) >= self._max_batches:
+            dropped_count, _ = self._event_batches.popleft()
+            self._dropped += dropped_count
+        self._event_batches.append((count, message))
+        self._wakeup.set()
+
+    def push_chart(self, graph_id: str, message: str):
+        if self.graph_ids is not None and graph_id not in self.graph_ids:
+            return
+        self._charts[graph_id] = message
+        self._wakeup.set()
+
+    async def drain(self, timeout: float) -> List[str]:
+        """Wait up to timeout for updates and return them as SSE frames (empty on timeout)"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._wakeup.clear()
+        frames = []
+        if self._dropped:
+            frames.append(_sse("gap", json.dumps({"dropped_events": self._dropped})))
+            self._dropped = 0
+        frames += [message for _, message in self._event_batches]
+        self._event_batches.clear()
+        frames += list(self._charts.values())
+        self._charts.clear()
+        return frames
+
+
+class LiveHub:
+    """Shared producer: one events query and one chart refresh per interval for all subscribers"""
+
+    def __init__(self, poll_interval: float, heartbeat_interval: float, buffer_batches: int, max_events_per_tick: int):
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.buffer_batches = buffer_batches
+        self.max_events_per_tick = max_events_per_tick
+        self.subscribers: Set[Subscriber] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._cursor: Optional[str] = None
+        self._before: Optional[int] = None
+        # Whether no events existed on the first lookup, so the first ones found are all new
+        self._started_empty = False
+        # Latest serialized result per graph, replayed to new subscribers
+        self._charts: Dict[str, str] = {}
+
+    def subscribe(self, graph_ids: Optional[Set[str]] = None, include_events: bool = True) -> Subscriber:
+        subscriber = Subscriber(self.buffer_batches, graph_ids, include_events)
+        for graph_id, message in self._charts.items():
+            subscriber.push_chart(graph_id, message)
+        self.subscribers.add(subscriber)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._produce())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def stream(self, graph_ids: Optional[Set[str]] = None, include_events: bool = True):
+        """SSE frames for a new subscriber, with a comment heartbeat when idle.
+
+        The subscriber is registered on the first frame, not when the generator is
+        created, so a response that is never started leaves nothing behind.
+        """
+        subscriber = self.subscribe(graph_ids, include_events)
+        try:
+            yield ": connected\n\n"
+            while True:
+                frames = await subscriber.drain(self.heartbeat_interval)
+                yield "".join(frames) if frames else ": heartbeat\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def _new_rows(self) -> Optional[List[Dict[str, Any]]]:
+        """Events since the last tick, oldest first; None until the starting point is known"""
+        if self._cursor is not None:
+            return await db_service.agent_query(self.max_events_per_tick, after=self._cursor)
+        latest = await db_service.agent_query(self.max_events_per_tick)
+        if latest is None:
+            # Lookup failed; try again next tick
+            return None
+        if not self._started_empty:
+            if latest:
+                # Events already stored are history: only what arrives after them is pushed
+                self._cursor = encode_cursor(latest[0])
+                self._before = latest[0]["time"]
+                return []
+            self._started_empty = True
+        # The table was empty when we started, so every event found now is new
+        return list(reversed(latest))
+
+    async def _produce(self):
+        refresh_charts = True
+        while self.subscribers:
+            try:
+                rows = await self._new_rows()
+                if rows:
+                    self._cursor = encode_cursor(rows[-1])
+                    self._before = rows[-1]["time"]
+                    message = _sse("events", dumps_text({"events": rows, "cursor": self._cursor}))
+                    for subscriber in list(self.subscribers):
+                        subscriber.push_events(len(rows), message)
+                    refresh_charts = True
+                if refresh_charts:
+                    await self._refresh_charts()
+                    refresh_charts = False
+            except Exception as e:
+                logger.error(f"Live update tick failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+        self._task = None
+
+    async def _refresh_charts(self):
+        graphs = await graph_registry.list()
+        # Bounded by CHART_BATCH_CONCURRENCY, with compatible graphs evaluated in shared scans
+        results = await chart_service.get_many_graph_data(graphs, self._before)
+        for graph in graphs:
+            data = results.get(graph["id"])
+            if data is None or isinstance(data, BaseException):
+                continue
+            message = _sse("chart", dumps_text({"graph_id": graph["id"], "before": self._before, "data": data}))
+            if self._charts.get(graph["id"]) == message:
+                continue
+            self._charts[graph["id"]] = message
+            for subscriber in list(self.subscribers):
+                subscriber.push_chart(graph["id"], message)
+
+    async def stop(self):
+        self.subscribers.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global live update hub instance
+live_hub = LiveHub(
+    settings.LIVE_POLL_INTERVAL,
+    settings.LIVE_HEARTBEAT_INTERVAL,
+    settings.LIVE_BUFFER_BATCHES,
+    settings.LIVE_MAX_EVENTS_PER_TICK,
+)
+metrics.gauge("live_subscribers", "Open /api/live streams", fn=lambda: len(live_hub.subscribers))
@@ -1,14 +1,45 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from routers import api_router, graphs_router
-import uvicorn
+from database import db_service
+from generate_new_graph import close_anthropic_client
+from ingest import event_batcher
+from live import live_hub
+from metrics import MetricsMiddleware, metrics
+from responses import CompressionMiddleware, FastJSONResponse
+from config import settings
+from readiness import readiness
+from reports import report_jobs
+from shared_cache import shared_cache
+import run
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create clients and warm connections before taking traffic
+    await db_service.start()
+    await shared_cache.start()
+    await db_service.migrate()
+    report_jobs.start()
+    readiness.start()
+    yield
+    await readiness.stop()
+    await live_hub.stop()
+    await report_jobs.stop()
+    await event_batcher.stop()
+    db_service.shutdown()
+    shared_cache.close()
+    await close_anthropic_client()
 
 # Create FastAPI instance
 app = FastAPI(
     title="HackMIT 2025 Backend API",
     description="Backend API for HackMIT 2025 project",
     version="1.0.0",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -26,6 +57,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses; added before the metrics middleware so timings include it
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.RESPONSE_COMPRESSION_MIN_BYTES,
+    gzip_level=settings.RESPONSE_GZIP_LEVEL,
+    brotli_quality=settings.RESPONSE_BROTLI_QUALITY,
+)
+
+# Per-route request counts and latency for /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(api_router)
 app.include_router(graphs_router)
@@ -35,5 +77,23 @@ app.include_router(graphs_router)
 async def root():
     return {"message": "Welcome to HackMIT 2025 Backend API"}
 
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Live updates: new events and recomputed chart results as server-sent events
+@app.get("/api/live")
+async def live_updates(
+    graphs: Optional[str] = Query(None, description="Comma-separated graph ids to receive; all graphs by default"),
+    events: bool = Query(True, description="Whether to receive new event rows"),
+):
+    graph_ids = {graph_id.strip() for graph_id in graphs.split(",") if graph_id.strip()} if graphs else None
+    return StreamingResponse(
+        live_hub.stream(graph_ids, include_events=events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    run.serve()
@@ -0,0 +1,224 @@
+"""
+In-process metrics exposed in the Prometheus text format at /metrics.
+
+Counters, gauges and histograms are plain Python objects updated under a per-series
+lock, cheap enough to leave on for every request, DB call and LLM call. Gauges and
+counters can also be read from a callback at scrape time, which is how queue depths,
+in-flight counts and cache hit counters owned by other modules are exported without
+touching their hot paths.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Seconds; spans sub-millisecond cache hits to multi-minute report renders
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), fn: Optional[Callable[[], Any]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Scrape-time source: a number, or {label values tuple: number} for labelled metrics
+        self.fn = fn
+        self._lock = threading.Lock()
+
+    def _samples(self) -> List[Tuple[str, Labels, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class _ValueMetric(_Metric):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Labels, float] = {}
+
+    def _add(self, amount: float, labels: Labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        if self.fn is not None:
+            value = self.fn()
+            items = value.items() if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [("", tuple(labels), "", value) for labels, value in items if value is not None]
+
+
+class Counter(_ValueMetric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._add(amount, labels)
+
+
+class Gauge(_ValueMetric):
+    kind = "gauge"
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._add(amount, labels)
+
+    def dec(self, *labels: str, amount: float = 1):
+        self._add(-amount, labels)
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: [per-bucket counts..., +Inf count], sum
+        self._series: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Observe the duration of the with-block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            series = [(labels, list(counts), total[0]) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append(("_bucket", labels, f'le="{_format_value(float(bound))}"', cumulative))
+            samples.append(("_sum", labels, "", total))
+            samples.append(("_count", labels, "", cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """Named metrics rendered together for a scrape"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._caches: Dict[str, Any] = {}
+
+    def _register(self, metric: _Metric) -> Any:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            # Re-importing a module (e.g. under a reloader) must not duplicate a metric
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (), fn=None) -> Counter:
+        return self._register(Counter(name, documentation, labelnames, fn))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), fn=None) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, fn))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets=buckets))
+
+    def track_cache(self, name: str, cache: Any):
+        """Export hits, misses and size of a cache exposing stats() (TTLCache, GenerationCache)"""
+        if not self._caches:
+            def read(field):
+                return lambda: {(cache_name,): c.stats()[field] for cache_name, c in self._caches.items()}
+            self.counter("cache_hits_total", "Cache lookups served from the cache", ("cache",), fn=read("hits"))
+            self.counter("cache_misses_total", "Cache lookups that missed", ("cache",), fn=read("misses"))
+            self.gauge("cache_entries", "Entries currently held", ("cache",), fn=read("size"))
+        self._caches[name] = cache
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+# Global metrics registry instance
+metrics = MetricsRegistry()
+
+http_requests = metrics.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_request_seconds = metrics.histogram(
+    "http_request_duration_seconds", "Time until the response started, by route", ("method", "route")
+)
+http_in_flight = metrics.gauge("http_requests_in_flight", "HTTP requests being handled")
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route request counts and latency.
+
+    Routes are labelled by their path template (`/api/graphs/{graph_id}`), so label
+    cardinality stays bounded. Latency is measured to the start of the response, which
+    for streaming endpoints like /api/live is the time to first byte.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                route = scope.get("route")
+                http_request_seconds.observe(
+                    time.perf_counter() - started, scope["method"], getattr(route, "path", "unmatched")
+                )
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            route = scope.get("route")
+            http_requests.inc(scope["method"], getattr(route, "path", "unmatched"), str(status[0]))
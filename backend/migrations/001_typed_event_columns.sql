@@ -0,0 +1,23 @@
+-- Typed projections of hot events.properties keys.
+-- Stored generated columns are filled by Postgres on insert and kept in sync with
+-- properties; chart SQL is rewritten by the backend to read them (typed_columns.py).
+-- Run once in the Supabase SQL editor. Safe to re-run.
+
+ALTER TABLE public.events
+    ADD COLUMN IF NOT EXISTS amount NUMERIC GENERATED ALWAYS AS ((properties->>'amount')::NUMERIC) STORED,
+    ADD COLUMN IF NOT EXISTS step INTEGER GENERATED ALWAYS AS ((properties->>'step')::INTEGER) STORED,
+    ADD COLUMN IF NOT EXISTS is_fraud SMALLINT GENERATED ALWAYS AS ((properties->>'isFraud')::SMALLINT) STORED,
+    ADD COLUMN IF NOT EXISTS is_flagged_fraud SMALLINT GENERATED ALWAYS AS ((properties->>'isFlaggedFraud')::SMALLINT) STORED,
+    ADD COLUMN IF NOT EXISTS name_orig TEXT GENERATED ALWAYS AS (properties->>'nameOrig') STORED,
+    ADD COLUMN IF NOT EXISTS name_dest TEXT GENERATED ALWAYS AS (properties->>'nameDest') STORED,
+    ADD COLUMN IF NOT EXISTS old_balance_org NUMERIC GENERATED ALWAYS AS ((properties->>'oldbalanceOrg')::NUMERIC) STORED,
+    ADD COLUMN IF NOT EXISTS new_balance_orig NUMERIC GENERATED ALWAYS AS ((properties->>'newbalanceOrig')::NUMERIC) STORED,
+    ADD COLUMN IF NOT EXISTS old_balance_dest NUMERIC GENERATED ALWAYS AS ((properties->>'oldbalanceDest')::NUMERIC) STORED,
+    ADD COLUMN IF NOT EXISTS new_balance_dest NUMERIC GENERATED ALWAYS AS ((properties->>'newbalanceDest')::NUMERIC) STORED;
+
+CREATE INDEX IF NOT EXISTS events_step_idx ON public.events (step);
+CREATE INDEX IF NOT EXISTS events_is_fraud_idx ON public.events (is_fraud);
+CREATE INDEX IF NOT EXISTS events_name_orig_idx ON public.events (name_orig);
+CREATE INDEX IF NOT EXISTS events_name_dest_idx ON public.events (name_dest);
+
+ANALYZE public.events;
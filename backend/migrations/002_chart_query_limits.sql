@@ -0,0 +1,28 @@
+-- Limits for chart SQL run through the `sql` RPC (see query_guard.py).
+-- A statement timeout on the function makes Postgres cancel runaway chart queries
+-- server-side; PostgREST applies function-level statement_timeout to the RPC call.
+-- `sql_cost` returns the planner's total cost so the backend can reject expensive
+-- queries before running them. It returns a one-row table rather than a scalar
+-- because PostgREST hands scalar function results back as a bare value, which the
+-- postgrest client cannot parse. Keep the timeout in line with QUERY_TIMEOUT.
+-- Once applied, set QUERY_COST_REQUIRED=true to refuse queries that get no estimate.
+-- Run once in the Supabase SQL editor. Safe to re-run.
+
+ALTER FUNCTION public.sql(text) SET statement_timeout = '10s';
+
+-- The return type changed from a scalar, which CREATE OR REPLACE cannot do in place
+DROP FUNCTION IF EXISTS public.sql_cost(text);
+
+CREATE FUNCTION public.sql_cost(modifiedquery text)
+RETURNS TABLE (cost double precision)
+LANGUAGE plpgsql
+SET statement_timeout = '2s'
+AS $$
+DECLARE
+    plan json;
+BEGIN
+    EXECUTE 'EXPLAIN (FORMAT JSON) ' || modifiedquery INTO plan;
+    cost := (plan -> 0 -> 'Plan' ->> 'Total Cost')::double precision;
+    RETURN NEXT;
+END;
+$$;
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List, Any
 from datetime import datetime
 
@@ -21,8 +21,55 @@ class GraphCreate(GraphBase):
 class Graph(GraphBase):
     id: str
 
+class GraphData(BaseModel):
+    graph_id: str
+    before: Optional[int] = None
+    data: List[dict[str, Any]]
+    # Rows the query produced when data was downsampled
+    source_points: Optional[int] = None
+
+class GraphDataBatchRequest(BaseModel):
+    graph_ids: List[str]
+    before: Optional[int] = None
+    max_points: Optional[int] = Field(None, ge=3)
+
+class GraphDataResult(BaseModel):
+    graph_id: str
+    status: int
+    data: Optional[List[dict[str, Any]]] = None
+    source_points: Optional[int] = None
+    error: Optional[str] = None
+
+class GraphDataBatchResponse(BaseModel):
+    before: Optional[int] = None
+    results: List[GraphDataResult]
+
+class EventIn(BaseModel):
+    time: int
+    type: str
+    properties: dict[str, Any] = {}
+    id: Optional[int] = None
+
+class EventBatchResponse(BaseModel):
+    accepted: int
+    flushed: int
+    rejected: int
+    errors: List[dict[str, Any]] = []
+
 class AgentQueryResponse(BaseModel):
     events: List[dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+class ReportJob(BaseModel):
+    job_id: str
+    status: str  # queued | running | succeeded | failed
+    files: int
+    attempts: int = 0
+    created_at: datetime
+    updated_at: datetime
+    timings: dict[str, float] = {}
+    error: Optional[str] = None
+    report_url: Optional[str] = None
 
 # User models
 class UserBase(BaseModel):
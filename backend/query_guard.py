@@ -0,0 +1,179 @@
+"""
+Validation and cost guard for chart SQL.
+
+Graph SQL comes from the LLM or from API clients and runs against the whole events
+table, so it is checked before it is stored or executed: a single plain SELECT over
+`events`, no joins or side effects, the output aliases the chart type needs, and a
+planner estimate under QUERY_MAX_COST. A query whose cost cannot be estimated (e.g.
+Supabase without migrations/002 applied) is accepted and counted, or refused once
+QUERY_COST_REQUIRED is turned on; either way the statement timeout and row cap still
+apply when it runs (DatabaseService.run_chart_query).
+"""
+import hashlib
+import logging
+import re
+from typing import List, Optional
+
+from cache import MISSING, TTLCache
+from config import settings
+from database import db_service
+from incremental import mask_sql, split_top_level
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Output columns the frontend reads for each chart type
+REQUIRED_ALIASES = {
+    "bar": ("category", "value"),
+    "line": ("time", "value"),
+    "area": ("time", "value"),
+    "pie": ("slice", "value"),
+    "scatter": ("x_value", "y_value"),
+}
+
+# WITH is rejected because storage prepends its own time-window CTE shadowing `events`
+_FORBIDDEN_RE = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|UPSERT|DROP|ALTER|CREATE|TRUNCATE|GRANT|REVOKE|COPY|CALL|DO|EXECUTE|"
+    r"PREPARE|DEALLOCATE|VACUUM|ANALYZE|LOCK|SET|RESET|LISTEN|NOTIFY|ATTACH|DETACH|INSTALL|LOAD|PRAGMA|"
+    r"EXPORT|IMPORT|CHECKPOINT|INTO|WITH|RECURSIVE|LATERAL|JOIN)\b",
+    re.IGNORECASE,
+)
+# Functions that sleep, touch files or other databases, or change session state
+_FORBIDDEN_CALL_RE = re.compile(
+    r"\b(pg_sleep\w*|pg_read\w*|pg_ls\w*|pg_stat_file|pg_terminate_backend|pg_cancel_backend|lo_\w+|dblink\w*|"
+    r"set_config|current_setting|query_to_\w+|generate_series|read_\w+|glob|\w+_scan|getenv)\s*\(",
+    re.IGNORECASE,
+)
+_SOURCE_RE = re.compile(r"\b(?:FROM|JOIN)\s+(?P<source>\(|[A-Za-z_][\w.\"]*)", re.IGNORECASE)
+# `FROM events, ...` or `FROM events e, ...` is an implicit cross join
+_CROSS_JOIN_RE = re.compile(
+    r"\bFROM\s+events(?:\s+(?:AS\s+)?(?!WHERE\b|GROUP\b|ORDER\b|HAVING\b|LIMIT\b|UNION\b|EXCEPT\b|INTERSECT\b)\w+)?\s*,",
+    re.IGNORECASE,
+)
+_SUBQUERY_START_RE = re.compile(r"\s*SELECT\b", re.IGNORECASE)
+_TOP_FROM_RE = re.compile(r"\bFROM\b", re.IGNORECASE)
+_DISTINCT_RE = re.compile(r"^DISTINCT(?:\s+ON\s*\([^)]*\))?\s+", re.IGNORECASE)
+_OUTPUT_NAME_RE = re.compile(r"(?:\bAS\s+)?(?:\"(?P<quoted>[^\"]+)\"|(?P<name>[A-Za-z_][A-Za-z0-9_]*))\s*$", re.IGNORECASE)
+
+
+class QueryRejected(ValueError):
+    """Chart SQL failed validation or exceeded the cost limit"""
+
+
+class QueryCostUnavailable(RuntimeError):
+    """The planner estimate for chart SQL could not be obtained, so it was not accepted"""
+
+
+def _output_names(select_list: str) -> List[str]:
+    names = []
+    for item in split_top_level(_DISTINCT_RE.sub("", select_list.strip())):
+        match = _OUTPUT_NAME_RE.search(mask_sql(item))
+        if match:
+            # Offsets are shared with the unmasked item, so quoted aliases keep their text
+            quoted = match.group("quoted")
+            names.append(item[match.start("quoted"):match.end("quoted")] if quoted else match.group("name").lower())
+    return names
+
+
+def _clause_levels(unquoted: str) -> List[bool]:
+    """Per character, whether it sits directly in a SELECT rather than in a call like EXTRACT(x FROM y)"""
+    levels, stack = [], [True]
+    for i, ch in enumerate(unquoted):
+        if ch == "(":
+            stack.append(bool(_SUBQUERY_START_RE.match(unquoted, i + 1)))
+        elif ch == ")" and len(stack) > 1:
+            stack.pop()
+        levels.append(stack[-1])
+    return levels
+
+
+def validation_error(sql_query: str, chart_type: str) -> Optional[str]:
+    """Why sql_query cannot back a chart of chart_type, or None if it is acceptable"""
+    if chart_type not in REQUIRED_ALIASES:
+        return f"Unsupported chart type {chart_type!r}; expected one of {', '.join(REQUIRED_ALIASES)}"
+    sql = sql_query.strip()
+    unquoted = mask_sql(sql, nested=False).rstrip()
+    if unquoted.endswith(";"):
+        sql = sql[:len(unquoted) - 1].rstrip()
+        unquoted = unquoted[:-1].rstrip()
+    if ";" in unquoted:
+        return "Only a single statement is allowed"
+    if "--" in unquoted or "/*" in unquoted:
+        return "Comments are not allowed"
+    if not re.match(r"SELECT\b", unquoted, re.IGNORECASE):
+        return "Query must be a SELECT statement"
+    forbidden = _FORBIDDEN_RE.search(unquoted)
+    if forbidden:
+        return f"{forbidden.group(1).upper()} is not allowed in chart queries"
+    call = _FORBIDDEN_CALL_RE.search(unquoted)
+    if call:
+        return f"Function {call.group(1)}() is not allowed in chart queries"
+    levels = _clause_levels(unquoted)
+    for match in _SOURCE_RE.finditer(unquoted):
+        source = match.group("source")
+        if levels[match.start()] and source != "(" and source.lower() != "events":
+            return f"Queries may only read from events, not {source}"
+    if _CROSS_JOIN_RE.search(unquoted):
+        return "Cross joins are not allowed"
+
+    # The output columns are the top-level select list, up to the first top-level FROM
+    top_from = _TOP_FROM_RE.search(mask_sql(sql))
+    if not top_from:
+        return "Query must read FROM events"
+    select_list = sql[len("SELECT"):top_from.start()]
+    if re.search(r"(^|,)\s*(?:\w+\.)?\*\s*(,|$)", mask_sql(select_list)):
+        return "SELECT * is not allowed; name the chart's output columns"
+    missing = [alias for alias in REQUIRED_ALIASES[chart_type] if alias not in _output_names(select_list)]
+    if missing:
+        return f"A {chart_type} chart query must return columns named {', '.join(REQUIRED_ALIASES[chart_type])} (missing {', '.join(missing)})"
+    return None
+
+
+class QueryGuard:
+    """Validates chart SQL and checks its planner cost, caching outcomes by query hash"""
+
+    def __init__(self, max_cost: float, cache_size: int, cache_ttl: float, cost_required: bool = False):
+        self.max_cost = max_cost
+        self.cost_required = cost_required
+        self._results = TTLCache(cache_size, cache_ttl)
+        self.rejections = 0
+        # Checks that found no cost estimate, whether refused or (cost_required off) let through
+        self.cost_unavailable = 0
+
+    async def check(self, sql_query: str, chart_type: str):
+        """Raise QueryRejected if sql_query may not back a chart of chart_type.
+
+        Raises QueryCostUnavailable if the cost could not be estimated and cost_required is set.
+        """
+        key = hashlib.sha1(f"{chart_type}\0{sql_query}".encode()).hexdigest()
+        reason = self._results.get(key)
+        if reason is MISSING:
+            reason = validation_error(sql_query, chart_type)
+            if reason is None and self.max_cost > 0:
+                cost = await db_service.explain_cost(sql_query)
+                if cost is None:
+                    # Usually transient (database unreachable), so the outcome is not cached
+                    self.cost_unavailable += 1
+                    if self.cost_required:
+                        logger.warning("Refused chart query: cost estimate unavailable")
+                        raise QueryCostUnavailable("Could not estimate the query's cost; try again later")
+                    logger.warning("Accepting chart query without a cost estimate")
+                    return
+                if cost > self.max_cost:
+                    reason = f"Estimated query cost {cost:.3g} exceeds the limit of {self.max_cost:.3g}"
+            self._results.set(key, reason)
+        if reason is not None:
+            self.rejections += 1
+            logger.info(f"Rejected chart query: {reason}")
+            raise QueryRejected(reason)
+
+
+# Global query guard instance
+query_guard = QueryGuard(
+    settings.QUERY_MAX_COST, settings.QUERY_GUARD_CACHE_SIZE, settings.QUERY_GUARD_CACHE_TTL, settings.QUERY_COST_REQUIRED
+)
+metrics.track_cache("query_guard", query_guard._results)
+metrics.counter("chart_queries_rejected_total", "Chart queries refused by the query guard", fn=lambda: query_guard.rejections)
+metrics.counter(
+    "chart_query_cost_unavailable_total", "Chart query checks that got no cost estimate", fn=lambda: query_guard.cost_unavailable
+)
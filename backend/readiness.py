@@ -0,0 +1,90 @@
+"""
+Startup warm-up and the readiness probe behind /api/ready.
+
+/api/health only says the process is up. An instance is ready once startup has
+finished, the warm-up has primed graph definitions, the schema digest and the
+Anthropic client, and a real round-trip to the database succeeds. The database check
+is cached for READY_CACHE_TTL seconds so frequent load-balancer probes cost at most
+one query per interval.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from config import settings
+from database import db_service
+from graph_registry import graph_registry
+from schema_digest import schema_digest
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """Tracks warm-up progress and answers readiness probes"""
+
+    def __init__(self, cache_ttl: float):
+        self.cache_ttl = cache_ttl
+        self.started = False
+        self.warm = False
+        self._task: Optional[asyncio.Task] = None
+        self._db_ok = False
+        self._checked_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def start(self):
+        """Mark startup complete and prime caches in the background"""
+        self.started = True
+        if not settings.STARTUP_WARMUP:
+            self.warm = True
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._warm_up())
+
+    async def _warm_up(self):
+        started = time.perf_counter()
+        try:
+            graphs = await graph_registry.list()
+            await schema_digest.get_text()
+            if settings.ANTHROPIC_API_KEY:
+                # Imports the SDK and builds the shared client off the event loop
+                from generate_new_graph import get_anthropic_client
+                await asyncio.to_thread(get_anthropic_client)
+            logger.info(f"Warm-up primed {len(graphs)} graphs in {time.perf_counter() - started:.2f} s")
+        except Exception as e:
+            # Whatever was not primed loads on first use instead
+            logger.error(f"Warm-up failed: {e}")
+        self.warm = True
+
+    async def _database_ok(self) -> bool:
+        if self._checked_at is not None and time.monotonic() - self._checked_at < self.cache_ttl:
+            return self._db_ok
+        async with self._lock:
+            # Concurrent probes share the round-trip made by the first one
+            if self._checked_at is None or time.monotonic() - self._checked_at >= self.cache_ttl:
+                self._db_ok = await db_service.ping()
+                self._checked_at = time.monotonic()
+            return self._db_ok
+
+    async def check(self) -> Dict[str, Any]:
+        database = await self._database_ok() if self.started else False
+        return {
+            "ready": self.started and self.warm and database,
+            "started": self.started,
+            "warm": self.warm,
+            "database": database,
+        }
+
+    async def stop(self):
+        self.started = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global readiness instance
+readiness = Readiness(settings.READY_CACHE_TTL)
@@ -0,0 +1,421 @@
+"""
+Background financial report jobs.
+
+Jobs are persisted in a local SQLite table, so their status survives restarts and
+unfinished jobs are picked up again. A fixed set of asyncio workers drives each job
+through its stages: the LLM stage is bounded by a semaphore and the CPU-bound pandoc
+render runs on a process pool. The LLM stage's markdown is saved next to the uploads,
+so retrying a failed render does not repeat the LLM call.
+
+Every worker process shares the table. A job is run by whichever process claims its
+row (queued -> running, stamped with the process's owner id); the owner refreshes a
+heartbeat on its running jobs, and a running job whose heartbeat lapses is put back
+in the queue for any process to claim.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from metrics import metrics
+from uploads import remove_spool
+
+logger = logging.getLogger(__name__)
+
+report_stage_seconds = metrics.histogram(
+    "report_stage_duration_seconds", "Report job time by stage (queue, llm, render)", ("stage",),
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    files TEXT NOT NULL,
+    spool_dir TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    report_path TEXT,
+    timings TEXT NOT NULL DEFAULT '{}',
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    owner TEXT,
+    heartbeat REAL
+);
+CREATE INDEX IF NOT EXISTS report_jobs_status ON report_jobs (status);
+"""
+# Columns added after the table was first created, for job databases that predate them
+ADDED_COLUMNS = {"owner": "TEXT", "heartbeat": "REAL"}
+
+_JSON_FIELDS = ("files", "timings")
+STAGES = ("queue", "llm", "render")
+# The LLM stage's output, saved in the job's spool directory
+MARKDOWN_FILE = "report.md"
+
+
+class ReportUnavailable(RuntimeError):
+    """The report pipeline cannot run in this deployment; retrying will not help"""
+
+
+class ReportJobStore:
+    """SQLite job table. Each call is a single small local statement guarded by a lock"""
+
+    def __init__(self, path: str):
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Other worker processes write the same file; wait for their short transactions
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            present = {row["name"] for row in self._conn.execute("PRAGMA table_info(report_jobs)")}
+            for name, column_type in ADDED_COLUMNS.items():
+                if name not in present:
+                    try:
+                        with self._conn:
+                            self._conn.execute(f"ALTER TABLE report_jobs ADD COLUMN {name} {column_type}")
+                    except sqlite3.OperationalError as e:
+                        # Another worker process added it first
+                        if "duplicate column" not in str(e):
+                            raise
+
+    @staticmethod
+    def _to_job(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        for name in _JSON_FIELDS:
+            job[name] = json.loads(job[name])
+        return job
+
+    def insert(self, job: Dict[str, Any]):
+        values = {k: json.dumps(v) if k in _JSON_FIELDS else v for k, v in job.items()}
+        names = list(values)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO report_jobs ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)})",
+                [values[name] for name in names],
+            )
+
+    def update(self, job_id: str, **fields):
+        fields["updated_at"] = datetime.now().isoformat()
+        values = {k: json.dumps(v) if k in _JSON_FIELDS else v for k, v in fields.items()}
+        assignments = ", ".join(f"{name} = ?" for name in values)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE report_jobs SET {assignments} WHERE job_id = ?",
+                list(values.values()) + [job_id],
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM report_jobs WHERE job_id = ?", [job_id]).fetchone()
+        return self._to_job(row) if row else None
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """Atomically move a queued job to running under owner; False if another process has it"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE report_jobs SET status = 'running', owner = ?, heartbeat = ?, updated_at = ? "
+                "WHERE job_id = ? AND status = 'queued'",
+                [owner, time.time(), datetime.now().isoformat(), job_id],
+            )
+        return cursor.rowcount == 1
+
+    def heartbeat(self, owner: str) -> int:
+        """Mark every job owner is running as alive"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE report_jobs SET heartbeat = ? WHERE owner = ? AND status = 'running'", [time.time(), owner]
+            )
+        return cursor.rowcount
+
+    def requeue_expired(self, timeout: float) -> int:
+        """Queue again running jobs whose owner has not sent a heartbeat for timeout seconds"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE report_jobs SET status = 'queued', owner = NULL, updated_at = ? "
+                "WHERE status = 'running' AND (heartbeat IS NULL OR heartbeat < ?)",
+                [datetime.now().isoformat(), time.time() - timeout],
+            )
+        return cursor.rowcount
+
+    def release(self, owner: str) -> int:
+        """Queue again every job owner is running, for another process to pick up"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE report_jobs SET status = 'queued', owner = NULL, updated_at = ? "
+                "WHERE owner = ? AND status = 'running'",
+                [datetime.now().isoformat(), owner],
+            )
+        return cursor.rowcount
+
+    def list_queued(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM report_jobs WHERE status = 'queued' ORDER BY created_at"
+            ).fetchall()
+        return [row["job_id"] for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM report_jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ReportJobs:
+    """Queue and worker pool for report jobs"""
+
+    def __init__(
+        self,
+        store_path: str,
+        workers: int,
+        llm_concurrency: int,
+        render_processes: int,
+        max_attempts: int,
+        retry_backoff: float,
+        output_dir: str,
+        heartbeat_interval: float,
+        heartbeat_timeout: float,
+    ):
+        self.store_path = store_path
+        self._store: Optional[ReportJobStore] = None
+        self.workers = workers
+        self.render_processes = render_processes
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.output_dir = output_dir
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        # Identifies this process's claims in the shared job table
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue: asyncio.Queue = asyncio.Queue()
+        # Job ids in _queue, so the sweep does not queue one twice
+        self._queued: set = set()
+        self._llm = asyncio.Semaphore(llm_concurrency)
+        self._render_pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running = 0
+        self._stage_stats = {stage: {"count": 0, "total": 0.0, "max": 0.0} for stage in STAGES}
+
+    @property
+    def store(self) -> ReportJobStore:
+        """The job table, opened on first use (normally start()) so importing the app opens nothing"""
+        if self._store is None:
+            self._store = ReportJobStore(self.store_path)
+        return self._store
+
+    def start(self):
+        """Open the job table and start the workers and the sweep that heartbeats and recovers jobs"""
+        if self._tasks:
+            return
+        self.store
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweep()))
+
+    def _enqueue(self, job_id: str):
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def _sweep(self):
+        """Heartbeat this process's jobs, re-queue jobs whose owner died and pick up queued ones.
+
+        Queued jobs include those another process accepted but has not started; whichever
+        process claims a job first runs it.
+        """
+        while True:
+            try:
+                self.store.heartbeat(self.owner)
+                recovered = self.store.requeue_expired(self.heartbeat_timeout)
+                if recovered:
+                    logger.warning(f"Re-queued {recovered} report jobs whose worker stopped responding")
+                for job_id in self.store.list_queued():
+                    self._enqueue(job_id)
+            except Exception as e:
+                logger.error(f"Report job sweep failed: {e}")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    def submit(self, spool_dir: str, images: List[Dict[str, Any]]) -> Dict[str, Any]:
+        now = datetime.now().isoformat()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "queued",
+            "files": images,
+            "spool_dir": spool_dir,
+            "attempts": 0,
+            "timings": {},
+            "created_at": now,
+            "updated_at": now,
+        }
+        self.store.insert(job)
+        self.start()
+        self._enqueue(job["job_id"])
+        return self.store.get(job["job_id"])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "running": self._running,
+            "workers": self.workers,
+            "jobs": self.store.counts(),
+            "stages": {
+                stage: {
+                    "count": s["count"],
+                    "avg_seconds": s["total"] / s["count"] if s["count"] else 0.0,
+                    "max_seconds": s["max"],
+                }
+                for stage, s in self._stage_stats.items()
+            },
+        }
+
+    def _record(self, timings: Dict[str, float], stage: str, seconds: float):
+        timings[stage] = round(seconds, 3)
+        report_stage_seconds.observe(seconds, stage)
+        stats = self._stage_stats[stage]
+        stats["count"] += 1
+        stats["total"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+
+    def _get_render_pool(self) -> ProcessPoolExecutor:
+        if self._render_pool is None:
+            # spawn: forking a process that already runs threads and an event loop is unsafe
+            self._render_pool = ProcessPoolExecutor(
+                max_workers=self.render_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._render_pool
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            self._running += 1
+            try:
+                await self._process(job_id)
+            except Exception as e:
+                logger.error(f"Report job {job_id} crashed: {e}")
+            finally:
+                self._running -= 1
+                self._queue.task_done()
+
+    async def _process(self, job_id: str):
+        if not self.store.claim(job_id, self.owner):
+            # Finished, or running in another process
+            return
+        job = self.store.get(job_id)
+        timings = job["timings"]
+        if "queue" not in timings:
+            waited = (datetime.now() - datetime.fromisoformat(job["created_at"])).total_seconds()
+            self._record(timings, "queue", waited)
+
+        error = None
+        for attempt in range(job["attempts"] + 1, self.max_attempts + 1):
+            self.store.update(job_id, attempts=attempt, timings=timings)
+            try:
+                report_path = await self._run_pipeline(job, timings)
+            except ReportUnavailable as e:
+                error = str(e)
+                break
+            except Exception as e:
+                error = str(e)
+                logger.error(f"Report job {job_id} attempt {attempt} failed: {e}")
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+                continue
+            self.store.update(job_id, status="succeeded", report_path=report_path, error=None, timings=timings)
+            remove_spool(job["spool_dir"])
+            return
+
+        logger.error(f"Report job {job_id} failed: {error}")
+        self.store.update(job_id, status="failed", error=error or "Retry limit reached", timings=timings)
+        remove_spool(job["spool_dir"])
+
+    async def _run_pipeline(self, job: Dict[str, Any], timings: Dict[str, float]) -> str:
+        try:
+            from generate_financial_reports import save_financial_report_to_pdf, write_financial_report
+        except ImportError as e:
+            raise ReportUnavailable(f"Report generation unavailable: {e}")
+
+        # Kept with the uploads, so a retry after a render failure (or a restart) skips the LLM call
+        markdown_path = os.path.join(job["spool_dir"], MARKDOWN_FILE)
+        if os.path.exists(markdown_path):
+            with open(markdown_path, encoding="utf-8") as f:
+                markdown_text = f.read()
+        else:
+            started = time.perf_counter()
+            async with self._llm:
+                markdown_text = await write_financial_report(settings.ANTHROPIC_API_KEY, job["files"])
+            self._record(timings, "llm", time.perf_counter() - started)
+            partial_path = f"{markdown_path}.partial"
+            with open(partial_path, "w", encoding="utf-8") as f:
+                f.write(markdown_text)
+            os.replace(partial_path, markdown_path)
+
+        started = time.perf_counter()
+        pdf_path = os.path.join(self.output_dir, f"financial_report_{job['job_id']}.pdf")
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(
+                self._get_render_pool(), save_financial_report_to_pdf, markdown_text, job["files"], pdf_path
+            )
+        except BrokenProcessPool:
+            # A render process died; replace the pool so the retry gets fresh processes
+            self._render_pool = None
+            raise
+        self._record(timings, "render", time.perf_counter() - started)
+        return pdf_path
+
+    async def stop(self):
+        """Stop the workers and hand their interrupted jobs back to the queue"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = asyncio.Queue()
+        self._queued.clear()
+        if self._store is not None:
+            self._store.release(self.owner)
+            self._store.close()
+            self._store = None
+        if self._render_pool is not None:
+            self._render_pool.shutdown(wait=False, cancel_futures=True)
+            self._render_pool = None
+        # The pipeline module is only imported once a job has run
+        pipeline = sys.modules.get("generate_financial_reports")
+        if pipeline is not None:
+            await pipeline.close_http_client()
+
+
+# Global report jobs instance
+report_jobs = ReportJobs(
+    settings.REPORT_JOBS_DB,
+    settings.REPORT_WORKERS,
+    settings.REPORT_LLM_CONCURRENCY,
+    settings.REPORT_RENDER_PROCESSES,
+    settings.REPORT_MAX_ATTEMPTS,
+    settings.REPORT_RETRY_BACKOFF,
+    settings.REPORT_OUTPUT_DIR,
+    settings.REPORT_HEARTBEAT_INTERVAL,
+    settings.REPORT_HEARTBEAT_TIMEOUT,
+)
+metrics.gauge("report_queue_depth", "Report jobs waiting for a worker", fn=lambda: report_jobs._queue.qsize())
+metrics.gauge("report_jobs_running", "Report jobs being processed", fn=lambda: report_jobs._running)
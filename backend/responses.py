@@ -0,0 +1,144 @@
+"""
+Fast JSON encoding and response compression.
+
+Event pages and chart results are plain JSON-compatible rows straight from storage, so
+large endpoints return them in a FastJSONResponse instead of re-validating every row
+through a pydantic response model and the stdlib encoder. orjson is used when
+installed; the stdlib encoder is the fallback.
+
+CompressionMiddleware gzips (or, with the `brotli` package installed and accepted by
+the client, brotli-compresses) responses above a size threshold. Server-sent event
+streams are passed through untouched so events are not held back in a compressor.
+"""
+import json
+import zlib
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # Falls back to the stdlib encoder
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None  # gzip only
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY if orjson else 0
+# Already-compressed or streamed-as-events content is never recompressed
+_SKIP_TYPES = ("text/event-stream", "image/", "application/pdf", "application/zip", "application/gzip")
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode obj as compact UTF-8 JSON; values JSON cannot represent are stringified"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=_ORJSON_OPTIONS)
+    return json.dumps(obj, default=str, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_text(obj: Any) -> str:
+    return dumps(obj).decode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson; content is serialised as-is, without validation"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class _Encoder:
+    """Streaming gzip or brotli compressor"""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._compressor.process(data)
+            return out + (self._compressor.finish() if final else self._compressor.flush())
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses of at least minimum_size bytes"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose(self, scope: Scope) -> Optional[str]:
+        accepted = Headers(scope=scope).get("accept-encoding", "")
+        tokens = {token.split(";")[0].strip().lower() for token in accepted.split(",")}
+        if brotli is not None and "br" in tokens:
+            return "br"
+        if "gzip" in tokens:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        encoding = self._choose(scope) if scope["type"] == "http" and self.minimum_size > 0 else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        encoder: Optional[_Encoder] = None
+        passthrough = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                passthrough = "content-encoding" in headers or content_type.startswith(_SKIP_TYPES)
+                if passthrough:
+                    await send(message)
+                else:
+                    # Hold the headers until the first body chunk shows whether compression pays off
+                    start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start)
+                    start = None
+                    passthrough = True
+                    await send(message)
+                    return
+                encoder = _Encoder(encoding, self.brotli_quality if encoding == "br" else self.gzip_level)
+                compressed = encoder.compress(body, final=not more_body)
+                headers = MutableHeaders(raw=start["headers"])
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(compressed))
+                await send(start)
+                start = None
+            else:
+                compressed = encoder.compress(body, final=not more_body)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,20 +1,40 @@
-from fastapi import APIRouter, HTTPException, status, Query, UploadFile, File
-from typing import List, Dict, Any
+from fastapi import APIRouter, HTTPException, status, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from typing import List, Dict, Any, Optional
 from models import (
     AgentQueryResponse,
-    Graph, GraphCreate, GraphBase,
+    Graph, GraphCreate, GraphBase, GraphData,
+    GraphDataBatchRequest, GraphDataBatchResponse,
+    EventIn, EventBatchResponse, ReportJob,
     BaseResponse, HealthResponse, EchoResponse
 )
-from database import db_service
+from database import db_service, encode_cursor
+from config import settings
+from charts import chart_service
+from downsample import SERIES_CHART_TYPES, downsample_series
+from query_guard import QueryCostUnavailable, QueryRejected, query_guard
+from storage import QueryTimeout, QueryTooLarge
+from graph_registry import graph_registry
+from ingest import event_batcher, iter_json_records
+from event_summary import event_summary
+from anomalies import DETECTORS, anomaly_detector
+from reports import report_jobs
+from uploads import MalformedUpload, UploadTooLarge, remove_spool, spool_uploads
+from responses import FastJSONResponse, dumps
+from readiness import readiness
+from pydantic import ValidationError
 from datetime import datetime
+import asyncio
 import logging
-import base64
 # from generate_financial_reports import run_graph_management_agent  # Temporarily disabled - strands not installed
 from generate_new_graph import generate_graph_from_request
 import os
 
 logger = logging.getLogger(__name__)
 
+# Per-row validation errors echoed back by the ingestion endpoint
+MAX_REPORTED_ERRORS = 20
+
 # Create router instances
 api_router = APIRouter(prefix="/api", tags=["API"])
 graphs_router = APIRouter(prefix="/api/graphs", tags=["Graphs"])
@@ -41,20 +61,167 @@ async def health_check():
         database_connected=db_connected
     )
 
-@api_router.get("/agent-query")
-async def agent_query(limit: int = 100) -> AgentQueryResponse:
-    result = await db_service.agent_query(limit)
-    return AgentQueryResponse(events=result)
+@api_router.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe: 200 once startup and warm-up have finished and the database
+    answers a real query (result cached for READY_CACHE_TTL seconds), 503 otherwise.
+    """
+    result = await readiness.check()
+    code = status.HTTP_200_OK if result["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE
+    return FastJSONResponse(result, status_code=code, headers={"Cache-Control": "no-store"})
+
+@api_router.get("/agent-query", response_model=AgentQueryResponse)
+async def agent_query(
+    limit: Optional[int] = Query(None, ge=1),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """
+    Page through events by (time, id) keyset.
+    Pass the returned next_cursor as `before` (newest first, default) or `after`
+    (oldest first) to resume. `fields` is a comma-separated projection of columns or
+    properties keys. With format=ndjson every matching event is streamed page by page,
+    up to `limit` if given.
+    """
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Pass only one of 'before' or 'after'")
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+    page_size = min(limit or 100, settings.AGENT_QUERY_MAX_LIMIT)
+    if format == "ndjson":
+        page_size = min(limit or settings.AGENT_QUERY_PAGE_SIZE, settings.AGENT_QUERY_PAGE_SIZE)
+    try:
+        events = await db_service.agent_query(page_size, before=before, after=after, fields=field_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if events is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to query events"
+        )
+
+    if format == "ndjson":
+        return StreamingResponse(
+            _stream_event_pages(events, page_size, limit, after is not None, field_list),
+            media_type="application/x-ndjson",
+        )
+    next_cursor = encode_cursor(events[-1]) if len(events) == page_size else None
+    # Rows come straight from storage; skip per-row model validation and the stdlib encoder
+    return FastJSONResponse({"events": events, "next_cursor": next_cursor})
+
+async def _stream_event_pages(page, page_size, limit, ascending, fields):
+    """Yield NDJSON lines one page at a time so memory stays bounded by the page size"""
+    sent = 0
+    while page:
+        yield b"".join(dumps(event) + b"\n" for event in page)
+        sent += len(page)
+        if len(page) < page_size or (limit is not None and sent >= limit):
+            return
+        cursor = encode_cursor(page[-1])
+        size = page_size if limit is None else min(page_size, limit - sent)
+        if ascending:
+            page = await db_service.agent_query(size, after=cursor, fields=fields)
+        else:
+            page = await db_service.agent_query(size, before=cursor, fields=fields)
+        if page is None:
+            logger.error(f"Event stream aborted after {sent} rows")
+            return
+        page_size = size
+
+@api_router.post("/events:batch", response_model=EventBatchResponse)
+async def ingest_events(request: Request):
+    """
+    Bulk-insert events from a JSON array or NDJSON body, parsed as it streams in.
+    Valid rows are handed to the shared batch writer in chunks; invalid rows are
+    reported by index and skipped.
+    """
+    accepted = rejected = 0
+    errors: List[Dict[str, Any]] = []
+    pending = []
+    chunk: List[Dict[str, Any]] = []
+
+    async for index, record, error in iter_json_records(request.stream()):
+        if error is None:
+            try:
+                chunk.append(EventIn.model_validate(record).model_dump(exclude_none=True))
+            except ValidationError as e:
+                error = e.errors(include_url=False)[0]["msg"]
+        if error is not None:
+            rejected += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"index": index, "error": error})
+            continue
+        accepted += 1
+        if len(chunk) >= settings.INGEST_BATCH_SIZE:
+            pending.append(await event_batcher.submit(chunk))
+            chunk = []
+    if chunk:
+        pending.append(await event_batcher.submit(chunk))
+
+    flushed = sum(await asyncio.gather(*pending))
+    return EventBatchResponse(accepted=accepted, flushed=flushed, rejected=rejected, errors=errors)
+
+@api_router.get("/events/summary")
+async def get_event_summary():
+    """Statistical summary of the newest EVENT_WINDOW_SIZE events, recomputed only when new events arrive"""
+    return await event_summary.get()
+
+@api_router.get("/anomalies")
+async def get_anomalies(
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of anomalies to return, newest first"),
+    detector: Optional[str] = Query(None, description="zscore, mad, rolling or balance"),
+    type: Optional[str] = Query(None, description="Only anomalies for this transaction type"),
+):
+    """Anomalous amounts and balances in the event window, scored incrementally as events arrive"""
+    if detector is not None and detector not in DETECTORS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown detector {detector!r}; expected one of {', '.join(DETECTORS)}"
+        )
+    return FastJSONResponse(await anomaly_detector.get(limit, detector=detector, event_type=type))
 
 # Graph Routes
+# Status codes for chart queries the guard or the execution limits refused
+QUERY_ERRORS = {
+    QueryRejected: status.HTTP_422_UNPROCESSABLE_ENTITY,
+    QueryTooLarge: status.HTTP_422_UNPROCESSABLE_ENTITY,
+    QueryTimeout: status.HTTP_504_GATEWAY_TIMEOUT,
+    QueryCostUnavailable: status.HTTP_503_SERVICE_UNAVAILABLE,
+}
+
+async def _downsample(graph: Dict[str, Any], data: List[Dict[str, Any]], max_points: Optional[int]):
+    """Reduce line/area rows to the requested resolution; returns (rows, source row count or None)"""
+    limit = min(filter(None, (max_points, settings.GRAPH_MAX_POINTS)), default=None)
+    if limit and graph["type"] in SERIES_CHART_TYPES and len(data) > limit:
+        # The cached result stays full resolution; each viewer gets its own reduction
+        return await asyncio.to_thread(downsample_series, data, limit), len(data)
+    return data, None
+
+async def _check_graph_query(graph: GraphBase):
+    """Reject graph SQL that fails the query guard before it is stored or returned"""
+    try:
+        await query_guard.check(graph.sql_query, graph.type)
+    except QueryRejected as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Invalid graph query: {e}")
+    except QueryCostUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
 @graphs_router.get("/", response_model=List[Graph])
-async def get_graphs():
-    graphs = await db_service.get_all_graphs()
-    return graphs
+async def get_graphs(request: Request):
+    etag = await graph_registry.etag()
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    graphs = await graph_registry.list()
+    # Stored graphs were validated when written
+    return FastJSONResponse(graphs, headers={"ETag": etag})
 
 @graphs_router.get("/{graph_id}", response_model=Graph)
 async def get_graph(graph_id: str):
-    graph = await db_service.get_graph(graph_id)
+    graph = await graph_registry.get(graph_id)
     if not graph:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -62,8 +229,65 @@ async def get_graph(graph_id: str):
         )
     return graph
 
+@graphs_router.get("/{graph_id}/data", response_model=GraphData)
+async def get_graph_data(
+    graph_id: str,
+    before: Optional[int] = None,
+    max_points: Optional[int] = Query(None, ge=3, description="Most points per series for line/area graphs, e.g. the chart's pixel width"),
+):
+    """Run the graph's stored query over events with time <= before, served from a shared cache"""
+    graph = await graph_registry.get(graph_id)
+    if not graph:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Graph not found"
+        )
+
+    try:
+        data = await chart_service.get_graph_data(graph, before)
+    except tuple(QUERY_ERRORS) as e:
+        raise HTTPException(status_code=QUERY_ERRORS[type(e)], detail=str(e))
+    if data is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to execute graph query"
+        )
+    data, source_points = await _downsample(graph, data, max_points)
+    return FastJSONResponse({"graph_id": graph_id, "before": before, "data": data, "source_points": source_points})
+
+@graphs_router.post("/data:batch", response_model=GraphDataBatchResponse)
+async def get_graphs_data(batch: GraphDataBatchRequest):
+    """Evaluate many graphs at one cursor in a single round-trip; graphs sharing a scan run as one query"""
+    graph_ids = list(dict.fromkeys(batch.graph_ids))
+    if len(graph_ids) > settings.CHART_BATCH_MAX_GRAPHS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.CHART_BATCH_MAX_GRAPHS} graphs per batch"
+        )
+    graphs = {graph_id: await graph_registry.get(graph_id) for graph_id in graph_ids}
+    outcomes = await chart_service.get_many_graph_data([g for g in graphs.values() if g], batch.before)
+
+    # Shaped like GraphDataResult, built as plain dicts so chart rows are not re-validated
+    results = []
+    for graph_id, graph in graphs.items():
+        outcome = outcomes.get(graph_id)
+        result = {"graph_id": graph_id, "status": status.HTTP_200_OK, "data": None, "source_points": None, "error": None}
+        if graph is None:
+            result.update(status=status.HTTP_404_NOT_FOUND, error="Graph not found")
+        elif isinstance(outcome, tuple(QUERY_ERRORS)):
+            result.update(status=QUERY_ERRORS[type(outcome)], error=str(outcome))
+        elif outcome is None or isinstance(outcome, Exception):
+            if outcome is not None:
+                logger.error(f"Batch evaluation of graph {graph_id} failed: {outcome}")
+            result.update(status=status.HTTP_500_INTERNAL_SERVER_ERROR, error="Failed to execute graph query")
+        else:
+            result["data"], result["source_points"] = await _downsample(graph, outcome, batch.max_points)
+        results.append(result)
+    return FastJSONResponse({"before": batch.before, "results": results})
+
 @graphs_router.post("/", response_model=Graph, status_code=status.HTTP_201_CREATED)
 async def create_graph(graph: GraphCreate):
+    await _check_graph_query(graph)
     graph_data = {
         "type": graph.type,
         "title": graph.title,
@@ -71,7 +295,7 @@ async def create_graph(graph: GraphCreate):
         "extra": graph.extra,
         "justification": graph.justification
     }
-    new_graph = await db_service.create_graph(graph_data)
+    new_graph = await graph_registry.create(graph_data)
     if not new_graph:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -81,60 +305,126 @@ async def create_graph(graph: GraphCreate):
 
 @graphs_router.put("/{graph_id}", response_model=Graph)
 async def update_graph(graph_id: str, graph_update: GraphCreate):
-    existing_graph = await db_service.get_graph(graph_id)
-    if not existing_graph:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Graph not found"
-        )
-
+    await _check_graph_query(graph_update)
     update_data = {k: v for k, v in graph_update.dict().items() if v is not None}
 
-    updated_graph = await db_service.update_graph(graph_id, update_data)
+    # The write itself tells us whether the graph exists; no separate lookup round-trip
+    updated_graph = await graph_registry.update(graph_id, update_data)
     if not updated_graph:
+        if not await graph_registry.knows(graph_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Graph not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to update graph"
         )
+    await chart_service.invalidate(graph_id)
     return updated_graph
 
 @graphs_router.delete("/{graph_id}", response_model=BaseResponse)
 async def delete_graph(graph_id: str):
-    existing_graph = await db_service.get_graph(graph_id)
-    if not existing_graph:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Graph not found"
-        )
-
-    success = await db_service.delete_graph(graph_id)
+    success = await graph_registry.delete(graph_id)
     if not success:
+        if not await graph_registry.knows(graph_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Graph not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to delete graph"
         )
+    await chart_service.invalidate(graph_id)
 
     return BaseResponse(success=True, message="Graph deleted successfully")
 
 
-@api_router.post("/generate-report")
-async def generate_report(files: List[UploadFile] = File(...)):
-    # Encode screenshots
-    encoded_screenshots = []
-    for f in files:
-        content = await f.read()
-        encoded_screenshots.append({
-            "filename": f.filename,
-            "content_base64": base64.b64encode(content).decode("utf-8")
-        })
+# The body is parsed by spool_uploads rather than a File() parameter; describe it for the docs
+REPORT_UPLOAD_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+                    "required": ["files"],
+                }
+            }
+        },
+    }
+}
+
+@api_router.post(
+    "/generate-report",
+    response_model=ReportJob,
+    status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra=REPORT_UPLOAD_BODY,
+)
+async def generate_report(request: Request):
+    """Spool screenshots to disk as they stream in and start a report job; poll /api/reports/{job_id} for its status"""
+    try:
+        spool_dir, images = await spool_uploads(
+            request.headers,
+            request.stream(),
+            settings.REPORT_SPOOL_DIR,
+            settings.REPORT_MAX_FILE_BYTES,
+            settings.REPORT_MAX_REQUEST_BYTES,
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except MalformedUpload as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not images:
+        remove_spool(spool_dir)
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="No files uploaded")
+
+    return _report_job_response(report_jobs.submit(spool_dir, images))
 
-    # Temporarily disabled - strands not installed
+def _report_job_response(job: Dict[str, Any]) -> Dict[str, Any]:
     return {
-        "success": False,
-        "message": "Report generation temporarily disabled",
-        "report_url": None
+        **job,
+        "files": len(job["files"]),
+        "report_url": f"/api/reports/{job['job_id']}/download" if job["status"] == "succeeded" else None,
     }
-    
+
+@api_router.get("/reports/stats")
+async def get_report_stats():
+    """Queue depth, job counts and per-stage timings for sizing the report workers"""
+    return report_jobs.stats()
+
+@api_router.get("/reports/{job_id}", response_model=ReportJob)
+async def get_report_job(job_id: str):
+    job = report_jobs.get(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Report job not found"
+        )
+    return _report_job_response(job)
+
+@api_router.get("/reports/{job_id}/download")
+async def download_report(job_id: str):
+    job = report_jobs.get(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Report job not found"
+        )
+    if job["status"] != "succeeded":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Report is not ready (status: {job['status']})"
+        )
+    if not os.path.exists(job["report_path"]):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Report file is no longer available"
+        )
+    return FileResponse(job["report_path"], media_type="application/pdf", filename=os.path.basename(job["report_path"]))
+
 @api_router.post("/generate-graph", response_model=Graph)
 async def generate_graph(request: Dict[str, Any]) -> Graph:
     """
@@ -146,14 +436,12 @@ async def generate_graph(request: Dict[str, Any]) -> Graph:
     if not user_request:
         raise HTTPException(status_code=400, detail="Missing 'request' in body")
 
-    # Fetch a small sample of recent events and all existing graphs to provide context
-    recent_events = await db_service.agent_query(20)
-
-    # Call Anthropic to obtain a new graph definition
+    # Call Anthropic to obtain a new graph definition; schema context comes from the cached digest
     try:
-        generated: GraphBase = generate_graph_from_request(user_request, recent_events)
+        generated: GraphBase = await generate_graph_from_request(user_request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM generation failed: {e}")
+    await _check_graph_query(generated)
 
     # Return the graph WITHOUT saving to database
     # Generate a temporary ID for the response
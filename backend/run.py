@@ -1,15 +1,40 @@
 #!/usr/bin/env python3
 """
-Development server runner for HackMIT 2025 Backend API
+Server runner for HackMIT 2025 Backend API
+
+With DEBUG on this is the auto-reloading development server. With DEBUG off it is
+the production mode: WEB_CONCURRENCY worker processes (one per available CPU by
+default) and no reloader. Set SHARED_CACHE_BACKEND=sqlite or redis so the workers
+share chart results and generated graphs.
 """
+import logging
 import uvicorn
 from config import settings
 
-if __name__ == "__main__":
+logger = logging.getLogger(__name__)
+
+
+def worker_count() -> int:
+    if settings.DEBUG:
+        # The reloader supervises a single process
+        return 1
+    if settings.STORAGE_BACKEND.lower() == "duckdb" and settings.WEB_CONCURRENCY > 1:
+        # A DuckDB database file can only be opened for writing by one process
+        logger.warning("STORAGE_BACKEND=duckdb supports a single worker; ignoring WEB_CONCURRENCY")
+        return 1
+    return max(settings.WEB_CONCURRENCY, 1)
+
+
+def serve():
     uvicorn.run(
         "main:app",
         host=settings.HOST,
         port=settings.PORT,
         reload=settings.DEBUG,
+        workers=worker_count(),
         log_level="info" if not settings.DEBUG else "debug"
     )
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from database import db_service
+
+logger = logging.getLogger(__name__)
+
+# Text columns with at most this many distinct sampled values are listed exhaustively
+_ENUM_LIMIT = 8
+_EXAMPLES = 3
+
+
+def _infer_type(values: List[Any]) -> str:
+    """Classify sampled values (properties are stored as strings) as flag, integer, numeric or text"""
+    kinds = set()
+    for value in values:
+        if isinstance(value, bool):
+            kinds.add("flag")
+            continue
+        text = str(value).strip()
+        try:
+            int(text)
+            kinds.add("integer")
+            continue
+        except ValueError:
+            pass
+        try:
+            float(text)
+            kinds.add("numeric")
+        except ValueError:
+            kinds.add("text")
+    if kinds == {"integer"} and {str(v).strip() for v in values} == {"0", "1"}:
+        return "flag"
+    if kinds <= {"integer"}:
+        return "integer"
+    if kinds <= {"integer", "numeric"}:
+        return "numeric"
+    return "text"
+
+
+def _describe(name: str, values: List[Any]) -> str:
+    kind = _infer_type(values)
+    if kind == "flag":
+        return f"{name}: 0/1 flag"
+    counts = Counter(str(v) for v in values)
+    if kind == "text" and len(counts) <= _ENUM_LIMIT:
+        return f"{name}: text, one of {', '.join(sorted(counts))}"
+    examples = ", ".join(value for value, _ in counts.most_common(_EXAMPLES))
+    return f"{name}: {kind}, e.g. {examples}"
+
+
+def summarize_events(rows: List[Dict[str, Any]]) -> str:
+    """Compact description of the events columns and observed properties keys"""
+    columns: Dict[str, List[Any]] = {}
+    properties: Dict[str, List[Any]] = {}
+    for row in rows:
+        for name, value in row.items():
+            if name == "properties":
+                for key, prop in (value or {}).items():
+                    if prop is not None:
+                        properties.setdefault(key, []).append(prop)
+            elif value is not None:
+                columns.setdefault(name, []).append(value)
+
+    lines = [f"Table events ({len(rows)} recent rows sampled)", "Columns:"]
+    if columns:
+        lines += [f"- {_describe(name, values)}" for name, values in columns.items()]
+    else:
+        lines += ["- id: integer", "- time: integer", "- type: text"]
+    lines.append("- properties: JSONB")
+    if properties:
+        lines.append("properties keys (values are stored as text; cast numbers with ::NUMERIC):")
+        lines += [f"- {_describe(key, values)}" for key, values in sorted(properties.items())]
+    return "\n".join(lines)
+
+
+class SchemaDigest:
+    """Periodically refreshed summary of the events schema for LLM prompts.
+
+    Replaces fetching and pasting raw rows on every generation request. A stale digest
+    is served immediately while a single background refresh replaces it.
+    """
+
+    def __init__(self, ttl: float, sample_size: int):
+        self.ttl = ttl
+        self.sample_size = sample_size
+        self._text: Optional[str] = None
+        self._refreshed_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def get_text(self) -> str:
+        if time.monotonic() - self._refreshed_at > self.ttl and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_once())
+        if self._text is None:
+            await asyncio.shield(self._refresh_task)
+        return self._text
+
+    async def _refresh_once(self):
+        try:
+            await self.refresh()
+        finally:
+            self._refresh_task = None
+
+    async def refresh(self):
+        rows = await db_service.agent_query(self.sample_size)
+        if rows is None and self._text is not None:
+            # Keep serving the previous digest until the database is back
+            logger.warning("Schema digest refresh failed; keeping previous digest")
+            return
+        self._text = summarize_events(rows or [])
+        self._refreshed_at = time.monotonic()
+
+
+# Global schema digest instance
+schema_digest = SchemaDigest(settings.SCHEMA_DIGEST_TTL, settings.SCHEMA_DIGEST_SAMPLE_SIZE)
@@ -0,0 +1,357 @@
+"""
+Cache tier shared by every worker process, with cross-worker request coalescing.
+
+Each worker keeps its own in-process caches (chart results, generated graphs); this
+tier sits behind them so that with WEB_CONCURRENCY workers an entry computed by one
+worker is served to the others, and concurrent misses on the same key run one
+computation in total. The worker that misses first takes a lease on the key; the
+others poll for its result until it appears or the lease lapses, then compute
+themselves.
+
+Backends, picked by `settings.SHARED_CACHE_BACKEND`:
+- "memory" (default): nothing is shared; each worker relies on its own caches
+- "sqlite": a WAL-mode SQLite file, for workers on one host
+- "redis": any Redis-compatible server (`redis` package), for workers on many hosts
+
+Values are opaque bytes; callers pass encode/decode functions. Backends connect on
+first use (normally start() in the app lifespan), so importing the app opens nothing.
+"""
+import asyncio
+import importlib.util
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import settings
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+shared_cache_lookups = metrics.counter(
+    "shared_cache_lookups_total", "Shared cache lookups by namespace and outcome (hit, miss, waited)", ("namespace", "outcome")
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_entries_expires_at_idx ON cache_entries (expires_at);
+CREATE TABLE IF NOT EXISTS cache_leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class SharedCache(ABC):
+    """Interface every shared cache backend provides.
+
+    Backends implement the synchronous primitives; the async methods run them on a
+    thread so a slow cache server never blocks the event loop. Failures are logged
+    and treated as misses: the shared tier only ever saves work.
+    """
+
+    name = "base"
+    # Whether entries are visible to other worker processes
+    shared = True
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+
+    @abstractmethod
+    def _get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        ...
+
+    @abstractmethod
+    def _set(self, key: str, value: bytes, ttl: float):
+        ...
+
+    @abstractmethod
+    def _delete_prefix(self, prefix: str) -> int:
+        ...
+
+    @abstractmethod
+    def _acquire(self, key: str, owner: str, ttl: float) -> bool:
+        """Take the computation lease on key unless another live owner holds it"""
+
+    @abstractmethod
+    def _release(self, key: str, owner: str):
+        ...
+
+    def connect(self):
+        """Open the connection if it is not open yet"""
+
+    def close(self):
+        pass
+
+    async def start(self):
+        """Connect off the event loop; a failure is logged and retried on first use"""
+        await self._call(self.connect)
+
+    async def _call(self, fn, *args, default=None):
+        try:
+            return await asyncio.to_thread(fn, *args)
+        except Exception as e:
+            logger.error(f"{self.name} shared cache {fn.__name__.lstrip('_')} failed: {e}")
+            return default
+
+    async def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        """Stored values of keys that are present, by key"""
+        if not keys:
+            return {}
+        return await self._call(self._get_many, keys, default={})
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self._call(self._set, key, value, ttl)
+
+    async def invalidate(self, prefix: str) -> int:
+        """Drop every entry whose key starts with prefix"""
+        return await self._call(self._delete_prefix, prefix, default=0)
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: float,
+        encode: Callable[[Any], bytes],
+        decode: Callable[[bytes], Any],
+        lease_ttl: float,
+        store: Callable[[Any], bool] = lambda value: value is not None,
+    ) -> Any:
+        """Value stored under key, or the result of compute(), which is stored if store(result).
+
+        Only one worker at a time runs compute() for a key. The rest wait for its result
+        for up to lease_ttl seconds, the longest a computation is expected to take.
+        """
+        namespace = key.partition(":")[0]
+        stored = (await self.get_many([key])).get(key)
+        if stored is not None:
+            shared_cache_lookups.inc(namespace, "hit")
+            return decode(stored)
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + lease_ttl
+        while True:
+            # An unreachable cache counts as an acquired lease: compute rather than wait
+            if await self._call(self._acquire, key, owner, lease_ttl, default=True):
+                shared_cache_lookups.inc(namespace, "miss")
+                try:
+                    value = await compute()
+                    if store(value):
+                        await self.set(key, encode(value), ttl)
+                    return value
+                finally:
+                    await self._call(self._release, key, owner)
+            await asyncio.sleep(self.poll_interval)
+            stored = (await self.get_many([key])).get(key)
+            if stored is not None:
+                shared_cache_lookups.inc(namespace, "waited")
+                return decode(stored)
+            if time.monotonic() > deadline:
+                # The owner is stuck or gone without releasing; stop waiting on it
+                shared_cache_lookups.inc(namespace, "miss")
+                return await compute()
+
+
+class LocalCache(SharedCache):
+    """Default backend: nothing is shared between workers and every miss is computed"""
+
+    name = "memory"
+    shared = False
+
+    def _get_many(self, keys):
+        return {}
+
+    def _set(self, key, value, ttl):
+        pass
+
+    def _delete_prefix(self, prefix):
+        return 0
+
+    def _acquire(self, key, owner, ttl):
+        return True
+
+    def _release(self, key, owner):
+        pass
+
+    # Nothing to look up, so skip the thread hop of the base methods
+    async def get_many(self, keys):
+        return {}
+
+    async def set(self, key, value, ttl):
+        pass
+
+    async def invalidate(self, prefix):
+        return 0
+
+    async def get_or_compute(self, key, compute, ttl, encode, decode, lease_ttl, store=None):
+        return await compute()
+
+
+class SQLiteCache(SharedCache):
+    """Shared cache in a SQLite file; every worker on the host opens the same file.
+
+    Expiry uses wall-clock time since monotonic clocks are not comparable across
+    processes. Expired entries are purged, and the table trimmed to max_entries, every
+    `PURGE_EVERY` writes.
+    """
+
+    name = "sqlite"
+    PURGE_EVERY = 100
+
+    def __init__(self, path: str, max_entries: int, poll_interval: float):
+        super().__init__(poll_interval)
+        self.path = path
+        self.max_entries = max_entries
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def connect(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._conn is None:
+                if self.path != ":memory:" and os.path.dirname(self.path):
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.executescript(SCHEMA)
+                self._conn = conn
+                logger.info(f"SQLite shared cache at {self.path}")
+            return self._conn
+
+    def _get_many(self, keys):
+        conn = self.connect()
+        placeholders = ", ".join("?" for _ in keys)
+        with self._lock:
+            rows = conn.execute(
+                f"SELECT key, value FROM cache_entries WHERE key IN ({placeholders}) AND expires_at > ?",
+                [*keys, time.time()],
+            ).fetchall()
+        return {key: value for key, value in rows}
+
+    def _set(self, key, value, ttl):
+        conn = self.connect()
+        with self._lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                [key, value, time.time() + ttl],
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._purge(conn)
+
+    def _purge(self, conn: sqlite3.Connection):
+        conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", [time.time()])
+        conn.execute(
+            "DELETE FROM cache_entries WHERE key IN "
+            "(SELECT key FROM cache_entries ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            [self.max_entries],
+        )
+        conn.execute("DELETE FROM cache_leases WHERE expires_at <= ?", [time.time()])
+
+    def _delete_prefix(self, prefix):
+        conn = self.connect()
+        with self._lock:
+            cursor = conn.execute(
+                "DELETE FROM cache_entries WHERE substr(key, 1, ?) = ?", [len(prefix), prefix]
+            )
+        return cursor.rowcount
+
+    def _acquire(self, key, owner, ttl):
+        conn = self.connect()
+        now = time.time()
+        with self._lock:
+            # Inserts a new lease or takes over an expired one; a live lease leaves rowcount at 0
+            cursor = conn.execute(
+                "INSERT INTO cache_leases (key, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE cache_leases.expires_at <= ?",
+                [key, owner, now + ttl, now],
+            )
+        return cursor.rowcount == 1
+
+    def _release(self, key, owner):
+        conn = self.connect()
+        with self._lock:
+            conn.execute("DELETE FROM cache_leases WHERE key = ? AND owner = ?", [key, owner])
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class RedisCache(SharedCache):
+    """Shared cache on a Redis-compatible server; leases are SET NX keys with an expiry"""
+
+    name = "redis"
+    # Deletes the lease only if this worker still owns it
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, url: str, poll_interval: float):
+        super().__init__(poll_interval)
+        self.url = url
+        self._client = None
+        self._release_script = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        with self._lock:
+            if self._client is None:
+                import redis
+                client = redis.Redis.from_url(self.url)
+                self._release_script = client.register_script(self.RELEASE_SCRIPT)
+                self._client = client
+                logger.info(f"Redis shared cache at {self.url}")
+            return self._client
+
+    def _get_many(self, keys):
+        return {key: value for key, value in zip(keys, self.connect().mget(keys)) if value is not None}
+
+    def _set(self, key, value, ttl):
+        self.connect().set(key, value, px=int(ttl * 1000))
+
+    def _delete_prefix(self, prefix):
+        client = self.connect()
+        keys = list(client.scan_iter(match=f"{prefix}*", count=500))
+        return client.delete(*keys) if keys else 0
+
+    def _acquire(self, key, owner, ttl):
+        return bool(self.connect().set(f"lease:{key}", owner, nx=True, px=int(ttl * 1000)))
+
+    def _release(self, key, owner):
+        self.connect()
+        self._release_script(keys=[f"lease:{key}"], args=[owner])
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+def create_shared_cache() -> SharedCache:
+    """Instantiate the backend named by settings.SHARED_CACHE_BACKEND"""
+    backend = settings.SHARED_CACHE_BACKEND.lower()
+    if backend == "sqlite":
+        return SQLiteCache(settings.SHARED_CACHE_PATH, settings.SHARED_CACHE_MAX_ENTRIES, settings.SHARED_CACHE_POLL_INTERVAL)
+    if backend == "redis":
+        if importlib.util.find_spec("redis") is not None:
+            return RedisCache(settings.SHARED_CACHE_URL, settings.SHARED_CACHE_POLL_INTERVAL)
+        logger.error("The 'redis' package is not installed (see requirements.txt); caches stay per worker")
+    elif backend != "memory":
+        logger.error(f"Unknown SHARED_CACHE_BACKEND {settings.SHARED_CACHE_BACKEND!r}; caches stay per worker")
+    return LocalCache(settings.SHARED_CACHE_POLL_INTERVAL)
+
+
+# Global shared cache instance
+shared_cache = create_shared_cache()
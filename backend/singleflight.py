@@ -0,0 +1,87 @@
+"""
+Single-flight: concurrent identical calls share one execution.
+
+When many dashboards poll at the same moment, the same event page, graph list or
+generation prompt is requested several times before the first request returns.
+A SingleFlight group runs the first call for a key as a task and hands every caller
+that arrives while it is running the same result (or exception), so upstream sees one
+call per key at a time. Callers share the returned object and must not mutate it.
+
+The task is shielded from its callers: a client disconnecting cancels only its own
+wait, never the call the others are waiting on.
+"""
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from config import settings
+from metrics import metrics
+
+single_flight_calls = metrics.counter(
+    "single_flight_calls_total", "Calls by single-flight group and outcome (executed, collapsed)", ("group", "outcome")
+)
+
+_groups: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    """Named group of in-flight calls keyed by argument-derived keys"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        _groups[name] = self
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark retrieved so the loop does not warn when every caller has gone away
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of fn(), or of the running call with the same key if there is one"""
+        task = self._calls.get(key)
+        if task is not None:
+            single_flight_calls.inc(self.name, "collapsed")
+            return await asyncio.shield(task)
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        task.add_done_callback(functools.partial(self._forget, key))
+        single_flight_calls.inc(self.name, "executed")
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+def _default_key(*args, **kwargs) -> Hashable:
+    return args, tuple(sorted(kwargs.items()))
+
+
+def single_flight(name: str, key: Optional[Callable[..., Hashable]] = None):
+    """Decorate an async function so concurrent calls with equal keys share one execution.
+
+    `key` receives the call's arguments (including self for methods) and returns a
+    hashable key; by default the arguments themselves are the key, so they must be
+    hashable. Disabled entirely by SINGLE_FLIGHT_ENABLED=false.
+    """
+    group = SingleFlight(name)
+    key_fn = key or _default_key
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not settings.SINGLE_FLIGHT_ENABLED:
+                return await fn(*args, **kwargs)
+            return await group.do(key_fn(*args, **kwargs), lambda: fn(*args, **kwargs))
+        wrapper.group = group
+        return wrapper
+
+    return decorator
+
+
+metrics.gauge(
+    "single_flight_in_flight", "Distinct calls running per single-flight group", ("group",),
+    fn=lambda: {(name,): len(group) for name, group in _groups.items()},
+)
@@ -0,0 +1,268 @@
+"""
+Storage backends behind DatabaseService.
+
+Backends expose synchronous methods that raise on failure; DatabaseService runs them
+on its thread pool and turns exceptions into the None/[]/False results routes expect.
+The backend is picked by `settings.STORAGE_BACKEND`.
+"""
+import logging
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from typed_columns import TYPED_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+EVENT_COLUMNS = ("id", "time", "type", "properties")
+FIELD_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# (time, id) keyset position; id is None for a bare time cursor
+Cursor = Tuple[int, Optional[int]]
+
+
+class QueryTimeout(RuntimeError):
+    """Chart SQL ran longer than the statement timeout"""
+
+
+class QueryTooLarge(RuntimeError):
+    """Chart SQL returned more rows than the row cap"""
+
+
+def parse_cost(data: Any) -> Optional[float]:
+    """Cost from the `sql_cost` RPC response: a one-row list like [{"cost": 123.4}]"""
+    if not data:
+        return None
+    cost = data[0].get("cost")
+    return float(cost) if cost is not None else None
+
+
+def time_window_cte(sql_query: str, table: str, before: Optional[int], after: Optional[int]) -> str:
+    """Shadow `events` with a CTE restricted to after < time <= before"""
+    conditions = []
+    if after is not None:
+        conditions.append(f"time > {int(after)}")
+    if before is not None:
+        conditions.append(f"time <= {int(before)}")
+    if not conditions:
+        return sql_query
+    return f"WITH events AS (SELECT * FROM {table} WHERE {' AND '.join(conditions)})\n{sql_query}"
+
+
+def cap_rows(sql_query: str, max_rows: int) -> str:
+    """Wrap chart SQL so it returns at most max_rows + 1 rows; the extra row reveals an overflow"""
+    return f"SELECT * FROM (\n{sql_query.strip().rstrip(';')}\n) AS capped LIMIT {int(max_rows) + 1}"
+
+
+class StorageBackend(ABC):
+    """Interface every storage implementation provides"""
+
+    name = "base"
+    # Whether events has the typed property columns from typed_columns.py; set from migrate()
+    typed_columns = False
+
+    @abstractmethod
+    def is_available(self) -> bool:
+        ...
+
+    def migrate(self) -> bool:
+        """Bring the schema up to date at startup; returns whether typed columns are available"""
+        return False
+
+    @abstractmethod
+    def ping(self):
+        """Cheapest real round-trip to the database; raises if it cannot be reached"""
+
+    @abstractmethod
+    def query_events(
+        self,
+        limit: int,
+        cursor: Optional[Cursor] = None,
+        ascending: bool = False,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Up to limit events strictly beyond cursor, ordered by (time, id)"""
+
+    @abstractmethod
+    def run_sql(
+        self,
+        sql_query: str,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+        timeout: Optional[float] = None,
+        max_rows: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Run chart SQL with `events` restricted to after < time <= before.
+
+        Raises QueryTimeout if the statement runs past timeout seconds and QueryTooLarge
+        if it produces more than max_rows rows.
+        """
+
+    def explain_cost(self, sql_query: str) -> Optional[float]:
+        """Planner cost estimate for chart SQL, or None if the backend cannot provide one"""
+        return None
+
+    @abstractmethod
+    def insert_events(self, events: List[Dict[str, Any]]) -> int:
+        """Insert events in as few statements as possible; returns the number written.
+
+        Rows are written in order: when fewer than all are written, they are the first ones.
+        """
+
+    @abstractmethod
+    def create_graph(self, graph_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def get_graph(self, graph_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def list_graphs(self) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def update_graph(self, graph_id: str, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def delete_graph(self, graph_id: str) -> bool:
+        ...
+
+    def close(self):
+        pass
+
+
+class SupabaseStorage(StorageBackend):
+    """Supabase/PostgREST backend; chart SQL runs through the `sql` RPC"""
+
+    name = "supabase"
+
+    def __init__(self):
+        self.client = None
+        try:
+            if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
+                logger.warning("Supabase credentials not found. Using mock client.")
+                return
+
+            # Imported here: the supabase SDK takes a noticeable share of cold-start time
+            from supabase import create_client
+            self.client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+            logger.info("Supabase client initialized successfully")
+        except Exception as e:
+            logger.error(f"Failed to initialize Supabase client: {e}")
+            self.client = None
+
+    def is_available(self) -> bool:
+        return self.client is not None
+
+    def ping(self):
+        self.client.table("graphs").select("id").limit(1).execute()
+
+    def migrate(self):
+        # DDL cannot go through PostgREST; only detect whether the migration has been applied
+        try:
+            columns = ",".join(typed.column for typed in TYPED_COLUMNS)
+            self.client.table("events").select(columns).limit(1).execute()
+            return True
+        except Exception as e:
+            logger.warning(
+                f"Typed event columns not found ({e}); apply migrations/001_typed_event_columns.sql to enable them"
+            )
+            return False
+
+    @staticmethod
+    def _projection(fields: Optional[List[str]]) -> str:
+        """PostgREST select string for fields, mapping non-column names to properties keys"""
+        if not fields:
+            # Not "*": typed projection columns stay out of API responses
+            return ",".join(EVENT_COLUMNS)
+        columns = ["id", "time"]
+        for name in fields:
+            if name not in columns:
+                columns.append(name if name in EVENT_COLUMNS else f"{name}:properties->>{name}")
+        return ",".join(columns)
+
+    def query_events(self, limit, cursor=None, ascending=False, fields=None):
+        query = self.client.table("events").select(self._projection(fields))
+        operator = "gt" if ascending else "lt"
+        if cursor is not None:
+            cursor_time, cursor_id = cursor
+            if cursor_id is None:
+                query = query.filter("time", operator, cursor_time)
+            else:
+                # This postgrest version has no or_() builder, so add the `or` param directly
+                query.params = query.params.add(
+                    "or", f"(time.{operator}.{cursor_time},and(time.eq.{cursor_time},id.{operator}.{cursor_id}))"
+                )
+        query = query.order("time", desc=not ascending).order("id", desc=not ascending)
+        return query.limit(limit).execute().data
+
+    def run_sql(self, sql_query, before=None, after=None, timeout=None, max_rows=None):
+        # The statement timeout is enforced by Postgres (migrations/002_chart_query_limits.sql);
+        # DatabaseService stops waiting after `timeout` either way
+        if max_rows is not None:
+            sql_query = cap_rows(sql_query, max_rows)
+        modified = time_window_cte(sql_query, "public.events", before, after)
+        rows = self.client.rpc("sql", {"modifiedquery": modified}).execute().data or []
+        if max_rows is not None and len(rows) > max_rows:
+            raise QueryTooLarge(f"Query returned more than {max_rows} rows")
+        return rows
+
+    def explain_cost(self, sql_query):
+        # `sql_cost` is installed by migrations/002_chart_query_limits.sql
+        return parse_cost(self.client.rpc("sql_cost", {"modifiedquery": sql_query}).execute().data)
+
+    def insert_events(self, events):
+        from postgrest.types import ReturnMethod
+        # A bulk insert needs the same keys on every row, so each run of rows with the same
+        # keys (e.g. with or without id) is one request. Runs go in order, so a failure
+        # leaves exactly the rows before it written.
+        written = 0
+        start = 0
+        while start < len(events):
+            keys = events[start].keys()
+            end = start + 1
+            while end < len(events) and events[end].keys() == keys:
+                end += 1
+            try:
+                self.client.table("events").insert(events[start:end], returning=ReturnMethod.minimal).execute()
+            except Exception as e:
+                if not written:
+                    raise
+                logger.error(f"Event insert failed after {written} of {len(events)} rows: {e}")
+                return written
+            written = end
+            start = end
+        return written
+
+    def create_graph(self, graph_data):
+        result = self.client.table("graphs").insert(graph_data).execute()
+        return result.data[0] if result.data else None
+
+    def get_graph(self, graph_id):
+        result = self.client.table("graphs").select("*").eq("id", graph_id).execute()
+        return result.data[0] if result.data else None
+
+    def list_graphs(self):
+        return self.client.table("graphs").select("*").execute().data or []
+
+    def update_graph(self, graph_id, update_data):
+        result = self.client.table("graphs").update(update_data).eq("id", graph_id).execute()
+        return result.data[0] if result.data else None
+
+    def delete_graph(self, graph_id):
+        result = self.client.table("graphs").delete().eq("id", graph_id).execute()
+        return bool(result.data)  # True if rows were deleted
+
+
+def create_storage_backend() -> StorageBackend:
+    """Instantiate the backend named by settings.STORAGE_BACKEND"""
+    backend = settings.STORAGE_BACKEND.lower()
+    if backend == "duckdb":
+        from duckdb_storage import DuckDBStorage
+        return DuckDBStorage(settings.DUCKDB_PATH)
+    if backend != "supabase":
+        logger.error(f"Unknown STORAGE_BACKEND {settings.STORAGE_BACKEND!r}; falling back to supabase")
+    return SupabaseStorage()
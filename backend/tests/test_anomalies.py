@@ -0,0 +1,195 @@
+import asyncio
+import warnings
+
+import numpy as np
+import pytest
+
+import anomalies as anomalies_module
+from anomalies import AnomalyDetector, _Moments, _rolling_z
+from event_window import NUMERIC_FIELDS, to_columns
+
+
+def _detector(**overrides):
+    options = dict(
+        z_threshold=6.0,
+        mad_threshold=6.0,
+        rolling_window=50,
+        rolling_threshold=6.0,
+        min_samples=20,
+        baseline_interval=60,
+        max_results=100,
+    )
+    options.update(overrides)
+    return AnomalyDetector(**options)
+
+
+def _rows(amounts, **fields):
+    rows = []
+    for i, amount in enumerate(amounts):
+        row = {"id": i + 1, "time": 1000 + i, "type": "TRANSFER", "amount": amount}
+        row.update({name: values[i] for name, values in fields.items()})
+        rows.append(row)
+    return rows
+
+
+def _consistent_balances(amounts, rng):
+    """Balance fields that satisfy both balance identities for each amount"""
+    new_orig = rng.uniform(0, 1000, len(amounts)).round(2)
+    old_dest = rng.uniform(0, 1000, len(amounts)).round(2)
+    return {
+        "oldbalanceOrg": list(new_orig + amounts),
+        "newbalanceOrig": list(new_orig),
+        "oldbalanceDest": list(old_dest),
+        "newbalanceDest": list(old_dest + amounts),
+    }
+
+
+def _score(detector, rows):
+    columns = to_columns(rows)
+    detector._baselines = detector._robust_baselines(columns)
+    detector._score(columns)
+    return {name: list(records) for name, records in detector._recent.items()}
+
+
+def test_constant_data_flags_nothing():
+    amounts = [250.0] * 200
+    rows = _rows(amounts, oldbalanceOrg=[1250.0] * 200, newbalanceOrig=[1000.0] * 200)
+    detector = _detector()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        recent = _score(detector, rows)
+    assert recent == {name: [] for name in anomalies_module.DETECTORS}
+    assert detector.rows_scanned == 200
+
+
+def test_all_missing_fields_flag_nothing():
+    rows = [{"id": i, "time": i, "type": "PAYMENT"} for i in range(1, 101)]
+    detector = _detector()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        baselines = detector._robust_baselines(to_columns(rows))
+        recent = _score(detector, rows)
+    median, mad = baselines["PAYMENT"]
+    assert np.isnan(median).all() and np.isnan(mad).all()
+    assert all(not records for records in recent.values())
+    assert detector.counts == {name: 0 for name in anomalies_module.DETECTORS}
+
+
+def test_a_single_outlier_is_flagged_by_every_statistical_detector():
+    rng = np.random.default_rng(7)
+    amounts = rng.normal(500, 20, 400).round(2)
+    amounts[300] = 5000.0
+    recent = _score(_detector(), _rows(list(amounts)))
+    for detector in ("zscore", "mad", "rolling"):
+        assert [(record["id"], record["field"]) for record in recent[detector]] == [(301, "amount")]
+        assert recent[detector][0]["value"] == 5000.0
+        assert recent[detector][0]["score"] > 6
+    # No balance fields, so no identity to check
+    assert recent["balance"] == []
+
+
+def test_outliers_are_not_scored_before_min_samples():
+    amounts = [100.0, 101.0, 99.0, 100.5, 5000.0] + [100.0] * 5
+    detector = _detector(min_samples=20)
+    recent = _score(detector, _rows(amounts))
+    assert all(not records for records in recent.values())
+
+
+def test_a_balance_discontinuity_is_flagged_on_its_side():
+    rng = np.random.default_rng(11)
+    amounts = rng.uniform(10, 500, 300).round(2)
+    fields = _consistent_balances(amounts, rng)
+    fields["newbalanceOrig"][120] -= 100.0
+    # Within the tolerance of a cent
+    fields["newbalanceDest"][200] += 0.004
+    recent = _score(_detector(), _rows(list(amounts), **fields))
+    assert [(record["id"], record["field"], record["value"]) for record in recent["balance"]] == [
+        (121, "origin_balance", 100.0)
+    ]
+    assert recent["balance"][0]["score"] is None
+
+
+def test_moments_merged_batch_by_batch_match_the_whole_series():
+    rng = np.random.default_rng(3)
+    values = rng.normal(1000, 250, (600, len(NUMERIC_FIELDS)))
+    values[rng.random(values.shape) < 0.2] = np.nan
+    values[:, 4] = np.nan
+    moments = _Moments()
+    for batch in np.array_split(values, [1, 7, 50, 51, 300]):
+        moments.update(batch)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        expected_mean = np.nanmean(values, axis=0)
+        expected_std = np.nanstd(values, axis=0)
+    assert np.array_equal(moments.count, (~np.isnan(values)).sum(axis=0))
+    np.testing.assert_allclose(moments.mean[:4], expected_mean[:4])
+    np.testing.assert_allclose(moments.std()[:4], expected_std[:4])
+    assert np.isnan(moments.std()[4])
+
+
+@pytest.mark.parametrize("splits", [[], [1], [10, 11, 12], [49, 50, 51, 200]])
+def test_rolling_scores_carry_history_across_batches(splits):
+    rng = np.random.default_rng(5)
+    series = rng.normal(0, 1, 300)
+    series[rng.random(300) < 0.1] = np.nan
+    window, min_samples = 30, 10
+
+    history, scores = np.empty(0), []
+    for batch in np.split(series, splits):
+        batch_scores, history = _rolling_z(history, batch, window, min_samples)
+        scores.append(batch_scores)
+    scores = np.concatenate(scores)
+
+    for i, score in enumerate(scores):
+        previous = series[max(i - window, 0):i]
+        previous = previous[~np.isnan(previous)]
+        if len(previous) < min_samples or np.isnan(series[i]):
+            assert np.isnan(score)
+        else:
+            expected = abs(series[i] - previous.mean()) / previous.std()
+            assert score == pytest.approx(expected, rel=1e-6)
+
+
+class _FakeWindow:
+    """The parts of the event window the detector reads, appended to in batches"""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self.epoch = 1
+        self.end = 0
+        self.columns = to_columns([])
+
+    def append(self, count):
+        self.end += count
+        self.columns = to_columns(self._rows[:self.end])
+
+    async def refresh(self):
+        pass
+
+    def since(self, epoch, position):
+        if epoch != self.epoch:
+            return None
+        return to_columns(self._rows[position:self.end])
+
+    def __len__(self):
+        return self.end
+
+
+def test_update_scores_only_new_events(monkeypatch):
+    rng = np.random.default_rng(9)
+    amounts = rng.normal(500, 20, 300).round(2)
+    amounts[250] = 9000.0
+    window = _FakeWindow(_rows(list(amounts)))
+    monkeypatch.setattr(anomalies_module, "event_window", window)
+    detector = _detector()
+
+    async def scenario():
+        window.append(200)
+        await detector.update()
+        window.append(100)
+        return await detector.get(10, detector="zscore")
+
+    result = asyncio.run(scenario())
+    assert result["rows_scanned"] == 300
+    assert [record["id"] for record in result["anomalies"]] == [251]
+    assert result["window_rows"] == 300
@@ -0,0 +1,94 @@
+import asyncio
+import uuid
+
+import pytest
+
+import charts as charts_module
+from charts import ChartService
+from duckdb_storage import DuckDBStorage
+
+SQLS = [
+    "SELECT type AS category, COUNT(*) AS value FROM events GROUP BY type",
+    "SELECT type AS category, MAX(time) AS value FROM events GROUP BY type ORDER BY value DESC",
+    "SELECT type AS category, SUM(time) AS value FROM events GROUP BY 1",
+]
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    """Chart queries run against an in-memory DuckDB, slowly enough to overlap; returns the SQL run"""
+    storage = DuckDBStorage(":memory:")
+    storage.insert_events([{"time": t, "type": "A" if t % 3 else "B"} for t in range(1, 61)])
+    ran = []
+
+    async def run_chart_query(sql_query, before=None, after=None):
+        ran.append(sql_query)
+        await asyncio.sleep(0.05)
+        return storage.run_sql(sql_query, before=before, after=after)
+
+    async def check(sql_query, chart_type):
+        pass
+
+    monkeypatch.setattr(charts_module.db_service, "run_chart_query", run_chart_query)
+    monkeypatch.setattr(charts_module.query_guard, "check", check)
+    yield storage, ran
+    storage.close()
+
+
+def _dashboard():
+    # Fresh ids so running incremental state from other tests does not apply
+    return [{"id": uuid.uuid4().hex, "type": "bar", "sql_query": sql} for sql in SQLS]
+
+
+def test_concurrent_batches_and_member_requests_share_one_scan(queries):
+    storage, ran = queries
+    service = ChartService()
+    graphs = _dashboard()
+
+    async def scenario():
+        batches = [asyncio.create_task(service.get_many_graph_data(graphs, 60)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        single = await service.get_graph_data(graphs[1], 60)
+        return await asyncio.gather(*batches), single
+
+    batches, single = asyncio.run(scenario())
+    assert len(ran) == 1 and "__s2" in ran[0]
+    expected = {graph["id"]: storage.run_sql(graph["sql_query"], before=60) for graph in graphs}
+    for results in batches:
+        assert {graph_id: sorted(rows, key=str) for graph_id, rows in results.items()} == {
+            graph_id: sorted(rows, key=str) for graph_id, rows in expected.items()
+        }
+    assert single == expected[graphs[1]["id"]]
+
+
+def test_a_member_already_being_computed_is_not_run_twice(queries):
+    _, ran = queries
+    service = ChartService()
+    graphs = _dashboard()
+
+    async def scenario():
+        single = asyncio.create_task(service.get_graph_data(graphs[0], 60))
+        await asyncio.sleep(0.01)
+        results = await service.get_many_graph_data(graphs, 60)
+        return await single, results
+
+    single, results = asyncio.run(scenario())
+    # The single query, and the shared scan for the dashboard
+    assert len(ran) == 2
+    assert results[graphs[0]["id"]] == single
+
+
+def test_a_failed_scan_is_reported_for_every_member(queries, monkeypatch):
+    _, ran = queries
+
+    async def failing_query(sql_query, before=None, after=None):
+        ran.append(sql_query)
+        return None
+
+    monkeypatch.setattr(charts_module.db_service, "run_chart_query", failing_query)
+    service = ChartService()
+    graphs = _dashboard()
+    results = asyncio.run(service.get_many_graph_data(graphs, 60))
+    assert results == {graph["id"]: None for graph in graphs}
+    assert len(ran) == 1
+    assert len(service.cache) == 0
@@ -0,0 +1,105 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from downsample import downsample_series, lttb_indices
+
+
+def _reference_lttb(x, y, max_points):
+    """Plain-Python LTTB over the same buckets as lttb_indices"""
+    n = len(x)
+    edges = [int(1 + i * (n - 2) / (max_points - 2)) for i in range(max_points - 1)]
+    kept = [0]
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            following = range(edges[bucket + 1], edges[bucket + 2])
+            avg_x = sum(x[i] for i in following) / len(following)
+            avg_y = sum(y[i] for i in following) / len(following)
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        px, py = x[kept[-1]], y[kept[-1]]
+        areas = [abs((px - avg_x) * (y[i] - py) - (px - x[i]) * (avg_y - py)) for i in range(start, end)]
+        kept.append(start + areas.index(max(areas)))
+    return kept + [n - 1]
+
+
+@pytest.mark.parametrize("n, max_points", [(10, 3), (10, 9), (100, 7), (1000, 50), (1001, 1000), (5000, 333)])
+def test_keeps_first_and_last_and_exactly_max_points(n, max_points):
+    rng = random.Random(n)
+    x = np.arange(n, dtype=float)
+    y = np.array([rng.gauss(0, 1) for _ in range(n)])
+    kept = lttb_indices(x, y, max_points)
+    assert len(kept) == max_points
+    assert kept[0] == 0 and kept[-1] == n - 1
+    assert all(a < b for a, b in zip(kept, kept[1:]))
+    assert list(kept) == _reference_lttb(list(x), list(y), max_points)
+
+
+def test_preserves_a_spike():
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 50)
+    y[437] = 25.0
+    y[812] = -25.0
+    kept = lttb_indices(x, y, 20)
+    assert 437 in kept and 812 in kept
+
+
+@pytest.mark.parametrize("max_points", [0, 1, 2, 10, 11])
+def test_short_series_and_tiny_targets_pass_through(max_points):
+    x = np.arange(10, dtype=float)
+    assert list(lttb_indices(x, x, max_points)) == list(range(10))
+
+
+def test_downsample_series_passes_through_when_small_enough():
+    rows = [{"time": t, "value": t} for t in range(10)]
+    assert downsample_series(rows, 10) is rows
+    assert downsample_series(rows, 2) == rows
+
+
+def test_downsamples_each_labelled_series_separately():
+    rows = []
+    for t in range(300):
+        for label in ("A", "B"):
+            rows.append({"time": t, "value": math.sin(t / 10) + (t == 150 and label == "B") * 50, "series": label})
+    reduced = downsample_series(rows, 30)
+    by_label = {label: [row for row in reduced if row["series"] == label] for label in ("A", "B")}
+    assert len(by_label["A"]) == len(by_label["B"]) == 30
+    for label, kept in by_label.items():
+        assert kept[0]["time"] == 0 and kept[-1]["time"] == 299
+        assert [row["time"] for row in kept] == sorted(row["time"] for row in kept)
+    assert any(row["time"] == 150 for row in by_label["B"])
+
+
+def test_unsorted_numeric_x_is_sorted_before_downsampling():
+    rows = [{"time": t, "value": t % 7} for t in range(200)]
+    random.Random(1).shuffle(rows)
+    reduced = downsample_series(rows, 20)
+    assert len(reduced) == 20
+    assert reduced[0]["time"] == 0 and reduced[-1]["time"] == 199
+    assert [row["time"] for row in reduced] == sorted(row["time"] for row in reduced)
+
+
+def test_non_numeric_x_keeps_the_query_order():
+    # ISO timestamps arrive already ordered by the query; they are spaced evenly in that order
+    rows = [{"time": f"2025-01-{1 + t // 24:02d}T{t % 24:02d}:00:00", "value": (t * 37) % 11} for t in range(240)]
+    rows.reverse()
+    reduced = downsample_series(rows, 24)
+    assert len(reduced) == 24
+    assert reduced[0] is rows[0] and reduced[-1] is rows[-1]
+    positions = [rows.index(row) for row in reduced]
+    assert positions == sorted(positions)
+
+
+def test_non_numeric_values_are_returned_as_is():
+    rows = [{"time": t, "value": "n/a" if t == 5 else t} for t in range(100)]
+    assert downsample_series(rows, 10) is rows
+
+
+def test_null_values_do_not_break_downsampling():
+    rows = [{"time": t, "value": None if t % 10 == 0 else float(t % 13)} for t in range(1, 500)]
+    reduced = downsample_series(rows, 25)
+    assert len(reduced) == 25
+    assert reduced[0]["time"] == 1 and reduced[-1]["time"] == 499
@@ -0,0 +1,249 @@
+import asyncio
+import random
+
+import pytest
+
+import incremental as incremental_module
+from duckdb_storage import DuckDBStorage
+from incremental import (
+    IncrementalEngine,
+    combine_queries,
+    mask_sql,
+    parse_aggregate_query,
+    split_partial_rows,
+    split_top_level,
+)
+
+AMOUNT = "(properties->>'amount')::NUMERIC"
+# Distinct group sizes keep ORDER BY on counts free of ties
+TYPE_COUNTS = {"PAYMENT": 60, "TRANSFER": 35, "CASH_OUT": 20, "DEBIT": 9, None: 4, "EMPTY": 3}
+END = 400
+
+
+@pytest.fixture(scope="module")
+def storage():
+    rng = random.Random(7)
+    events = []
+    for event_type, count in TYPE_COUNTS.items():
+        for _ in range(count):
+            properties = {"isFraud": str(rng.randint(0, 1))}
+            if event_type != "EMPTY" and rng.random() > 0.15:
+                properties["amount"] = str(round(rng.uniform(-50, 5000), 2))
+            events.append({"time": rng.randint(1, END), "type": event_type, "properties": properties})
+    storage = DuckDBStorage(":memory:")
+    storage.insert_events(events)
+    yield storage
+    storage.close()
+
+
+def _sliced(storage, query, cuts):
+    groups = {}
+    after = None
+    for before in cuts:
+        query.merge(groups, storage.run_sql(query.partial_sql(), before=before, after=after))
+        after = before
+    return query.finalize(groups)
+
+
+def _assert_rows_equal(actual, expected):
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        assert list(got) == list(want)
+        for column in want:
+            if isinstance(want[column], float):
+                assert got[column] == pytest.approx(want[column])
+            else:
+                assert got[column] == want[column]
+
+
+@pytest.mark.parametrize("sql", [
+    f"SELECT type AS category, SUM({AMOUNT}) AS value FROM events GROUP BY type ORDER BY type",
+    "SELECT type AS category, COUNT(*) AS value FROM events GROUP BY type ORDER BY value DESC",
+    "SELECT type AS category, COUNT(properties->>'amount') AS value FROM events GROUP BY 1 ORDER BY 2 DESC",
+    f"SELECT type AS category, AVG({AMOUNT}) AS value, MIN({AMOUNT}) AS low, MAX({AMOUNT}) AS high "
+    f"FROM events GROUP BY category ORDER BY category",
+    f"SELECT properties->>'isFraud' AS slice, SUM({AMOUNT})::float AS value FROM events "
+    f"WHERE type IN ('PAYMENT', 'TRANSFER') GROUP BY properties->>'isFraud' ORDER BY properties->>'isFraud'",
+    "SELECT type AS category, MIN(time) AS first, MAX(time) AS last FROM events WHERE time > 50 GROUP BY type ORDER BY last DESC, 1",
+    "SELECT COUNT(*) AS value, type AS category FROM events GROUP BY type ORDER BY value",
+])
+@pytest.mark.parametrize("cuts", [[END], [100, 200, 300, END], list(range(7, END + 1, 7)) + [END], [0, 0, 150, 150, END]])
+def test_sliced_merge_matches_full_recompute(storage, sql, cuts):
+    query = parse_aggregate_query(sql)
+    assert query is not None
+    _assert_rows_equal(_sliced(storage, query, cuts), storage.run_sql(sql, before=END))
+
+
+def test_groups_without_order_by_come_back_sorted_by_key_with_nulls_last(storage):
+    sql = f"SELECT type AS category, SUM({AMOUNT}) AS value, COUNT({AMOUNT}) AS n FROM events GROUP BY type"
+    rows = _sliced(storage, parse_aggregate_query(sql), [120, 250, END])
+    assert [row["category"] for row in rows] == sorted(t for t in TYPE_COUNTS if t) + [None]
+    empty = next(row for row in rows if row["category"] == "EMPTY")
+    # A group whose values are all NULL: SUM stays NULL, COUNT is 0
+    assert empty["value"] is None and empty["n"] == 0
+
+
+def test_avg_of_all_null_group_is_null(storage):
+    sql = f"SELECT type AS category, AVG({AMOUNT}) AS value FROM events WHERE type = 'EMPTY' GROUP BY type"
+    assert _sliced(storage, parse_aggregate_query(sql), [200, END]) == [{"category": "EMPTY", "value": None}]
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT DISTINCT type AS category, COUNT(*) AS value FROM events GROUP BY type",
+    "SELECT type AS category, COUNT(DISTINCT properties->>'nameOrig') AS value FROM events GROUP BY type",
+    f"SELECT type AS category, SUM({AMOUNT}) + 1 AS value FROM events GROUP BY type",
+    f"SELECT type AS category, SUM({AMOUNT})::int AS value FROM events GROUP BY type",
+    f"SELECT type AS category, STDDEV({AMOUNT}) AS value FROM events GROUP BY type",
+    "SELECT type AS category, SUM(SUM(time)) OVER () AS value FROM events GROUP BY type",
+    "SELECT type AS category, COUNT(*) AS value FROM events GROUP BY type HAVING COUNT(*) > 1",
+    "SELECT type AS category, COUNT(*) AS value FROM events GROUP BY type LIMIT 3",
+    "SELECT type AS category, COUNT(*) AS value FROM events GROUP BY properties->>'isFraud'",
+    "SELECT type AS category, properties->>'isFraud' AS fraud, COUNT(*) AS value FROM events GROUP BY type, properties->>'isFraud'",
+    "SELECT type AS category, COUNT(*) AS value FROM events GROUP BY type ORDER BY time",
+    "SELECT type AS category, COUNT(*) AS value FROM graphs GROUP BY type",
+    "SELECT e.type AS category, COUNT(*) AS value FROM events e JOIN graphs g ON true GROUP BY e.type",
+    "SELECT type AS category, COUNT(*) AS value FROM (SELECT * FROM events) t GROUP BY type",
+    "SELECT type AS category, COUNT(*) AS value FROM events WHERE time > (SELECT MIN(time) FROM events) GROUP BY type",
+    "SELECT type AS category, COUNT(*) AS value FROM events WHERE time > now() GROUP BY type",
+    "SELECT type AS category, COUNT(*) FROM events GROUP BY type",
+    "SELECT type AS category, COUNT(*) AS value FROM events GROUP BY type -- by type",
+    "SELECT type AS category, COUNT(*) AS value FROM events GROUP BY type; DELETE FROM events",
+    "SELECT COUNT(*) AS value FROM events",
+    "SELECT type AS category, time AS value FROM events GROUP BY type",
+])
+def test_rejects_queries_that_do_not_decompose(sql):
+    assert parse_aggregate_query(sql) is None
+
+
+def test_string_literals_do_not_confuse_the_parser():
+    query = parse_aggregate_query(
+        "SELECT type AS category, COUNT(*) AS value FROM events WHERE type <> 'SELECT, (GROUP BY)' GROUP BY type"
+    )
+    assert query is not None and query.where == "type <> 'SELECT, (GROUP BY)'"
+
+
+def test_mask_sql_keeps_offsets_and_hides_quoted_and_nested_text():
+    sql = "a, 'x, (y)', f(b, c), \"d,e\""
+    masked = mask_sql(sql)
+    assert len(masked) == len(sql)
+    assert masked == "a, '      ', f(    ), \"   \""
+    assert mask_sql(sql, nested=False) == "a, '      ', f(b, c), \"   \""
+
+
+def test_split_top_level_only_splits_outer_commas():
+    assert split_top_level("a, COALESCE(b, c) AS d, 'x,y' AS e, \"f,g\"") == ["a", "COALESCE(b, c) AS d", "'x,y' AS e", '"f,g"']
+
+
+def test_combined_scan_splits_into_each_querys_partial_rows(storage):
+    sqls = [
+        f"SELECT type AS category, SUM({AMOUNT}) AS value FROM events GROUP BY type",
+        "SELECT type AS category, COUNT(*) AS value, MAX(time) AS last FROM events GROUP BY type ORDER BY 2",
+        f"SELECT type AS category, AVG({AMOUNT}) AS value, MIN({AMOUNT}) AS low FROM events GROUP BY category",
+    ]
+    queries = [parse_aggregate_query(sql) for sql in sqls]
+    assert len({query.scan_key() for query in queries}) == 1
+    combined = storage.run_sql(combine_queries(queries).partial_sql(), before=END)
+
+    def by_key(rows):
+        return sorted(rows, key=lambda row: (row["__key"] is None, row["__key"] or ""))
+
+    for query, split in zip(queries, split_partial_rows(queries, combined)):
+        assert by_key(split) == by_key(storage.run_sql(query.partial_sql(), before=END))
+
+
+class _Graphs:
+    """Runs engine queries against a DuckDB storage and records each call"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.calls = []
+
+    async def run_chart_query(self, sql_query, before=None, after=None):
+        self.calls.append((before, after))
+        return self.storage.run_sql(sql_query, before=before, after=after)
+
+
+GRAPH = {"id": "g1", "type": "bar", "sql_query": "SELECT type AS category, COUNT(*) AS value FROM events GROUP BY type"}
+
+
+@pytest.fixture
+def engine_storage(monkeypatch):
+    storage = DuckDBStorage(":memory:")
+    storage.insert_events([{"time": t, "type": "A" if t % 2 else "B"} for t in range(1, 101)])
+    graphs = _Graphs(storage)
+    monkeypatch.setattr(incremental_module.db_service, "run_chart_query", graphs.run_chart_query)
+    yield storage, graphs
+    storage.close()
+
+
+def _counts(rows):
+    return {row["category"]: row["value"] for row in rows}
+
+
+def test_events_written_at_or_before_the_cursor_rebuild_the_state(engine_storage):
+    storage, graphs = engine_storage
+    engine = IncrementalEngine()
+    assert _counts(asyncio.run(engine.run(GRAPH, 100))) == {"A": 50, "B": 50}
+
+    storage.insert_events([{"time": 40, "type": "A"}, {"time": 120, "type": "B"}])
+    # Without the report the late row is invisible to the folded-in slice (100, 150]
+    assert _counts(asyncio.run(engine.run(GRAPH, 150))) == {"A": 50, "B": 51}
+
+    storage.insert_events([{"time": 60, "type": "C"}])
+    asyncio.run(engine.events_written(60))
+    assert _counts(asyncio.run(engine.run(GRAPH, 150))) == {"A": 51, "B": 51, "C": 1}
+    assert graphs.calls[-1] == (150, None)
+    assert engine.resets == 1
+
+
+def test_events_written_after_the_cursor_keep_the_state(engine_storage):
+    storage, graphs = engine_storage
+    engine = IncrementalEngine()
+    asyncio.run(engine.run(GRAPH, 100))
+    storage.insert_events([{"time": 101, "type": "A"}])
+    asyncio.run(engine.events_written(101))
+    assert _counts(asyncio.run(engine.run(GRAPH, 110))) == {"A": 51, "B": 50}
+    assert graphs.calls[-1] == (110, 100)
+    assert engine.resets == 0
+
+
+def test_state_is_not_kept_when_a_late_write_lands_mid_query(engine_storage):
+    storage, graphs = engine_storage
+    engine = IncrementalEngine()
+    original = graphs.run_chart_query
+
+    async def racing_query(sql_query, before=None, after=None):
+        rows = await original(sql_query, before, after)
+        storage.insert_events([{"time": 10, "type": "C"}])
+        await engine.events_written(10)
+        return rows
+
+    incremental_module.db_service.run_chart_query = racing_query
+    asyncio.run(engine.run(GRAPH, 100))
+    assert not engine.is_warm(GRAPH, 100)
+
+
+def test_reset_keeps_the_lock_so_runs_never_overlap(engine_storage):
+    _, graphs = engine_storage
+    engine = IncrementalEngine()
+    original = graphs.run_chart_query
+    running = []
+    overlap = []
+
+    async def slow_query(sql_query, before=None, after=None):
+        running.append(1)
+        overlap.append(len(running))
+        await asyncio.sleep(0.02)
+        running.pop()
+        return await original(sql_query, before, after)
+
+    incremental_module.db_service.run_chart_query = slow_query
+
+    async def scenario():
+        first = asyncio.create_task(engine.run(GRAPH, 100))
+        await asyncio.sleep(0.005)
+        engine.reset(GRAPH["id"])
+        await asyncio.gather(first, engine.run(GRAPH, 100))
+
+    asyncio.run(scenario())
+    assert max(overlap) == 1
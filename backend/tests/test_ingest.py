@@ -0,0 +1,161 @@
+import asyncio
+import json
+import random
+
+import pytest
+
+import ingest as ingest_module
+import routers as routers_module
+from ingest import iter_json_records
+
+RECORDS = [
+    {"time": 1, "type": "PAYMENT", "properties": {"amount": "9839.64", "nameOrig": "C1231006815"}},
+    {"time": 2, "type": "TRANSFER", "properties": {"note": "café ☕ 日本 😀", "tags": ["a", "]", ","]}},
+    {"time": 3, "type": "CASH_OUT", "properties": {"text": "line\nbreak, \"quoted\" } ]"}},
+    {"time": -4, "type": "DEBIT", "properties": {"amount": -1.5e3, "nested": {"deep": [1, [2, {}]]}}},
+    {"time": 5, "type": "CASH_IN", "id": 12345678901, "properties": {}},
+    12345,
+    "a bare string",
+    [1, 2, 3],
+    None,
+    0.25,
+]
+
+
+def _chunks(body, sizes):
+    async def stream():
+        position = 0
+        for size in sizes:
+            if position >= len(body):
+                break
+            yield body[position:position + size]
+            position += size
+        if position < len(body):
+            yield body[position:]
+    return stream()
+
+
+def _split(body, how):
+    """Chunk sizes: one byte at a time, seeded random sizes, or the whole body"""
+    if how == "bytes":
+        return [1] * len(body)
+    if how == "whole":
+        return [len(body)]
+    rng = random.Random(how)
+    return [rng.randint(1, 9) for _ in range(len(body))]
+
+
+def _parse(body, how):
+    async def collect():
+        return [record async for record in iter_json_records(_chunks(body, _split(body, how)))]
+    return asyncio.run(collect())
+
+
+SPLITS = ["bytes", "whole", 1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize("how", SPLITS)
+def test_json_array_in_any_chunking(how):
+    body = (" \n[" + ",\n  ".join(json.dumps(record, ensure_ascii=False) for record in RECORDS) + "]\n").encode()
+    assert _parse(body, how) == [(i, record, None) for i, record in enumerate(RECORDS)]
+
+
+@pytest.mark.parametrize("how", SPLITS)
+def test_ndjson_in_any_chunking(how):
+    lines = [json.dumps(record, ensure_ascii=False) for record in RECORDS]
+    body = ("\n".join(lines[:3]) + "\r\n\n  \n" + "\n".join(lines[3:])).encode()
+    assert _parse(body, how) == [(i, record, None) for i, record in enumerate(RECORDS)]
+
+
+@pytest.mark.parametrize("how", SPLITS)
+def test_a_number_split_across_chunks_is_one_record(how):
+    body = b"[123456789, -98765.4321e-2, 7]"
+    assert _parse(body, how) == [(0, 123456789, None), (1, -98765.4321e-2, None), (2, 7, None)]
+
+
+@pytest.mark.parametrize("how", SPLITS)
+def test_malformed_ndjson_lines_are_rejected_individually(how):
+    body = '{"time": 1, "type": "A"}\n{"time": 2, "type": \n{"time": 3, "type": "Ü"}\nnot json\n{"time": 5, "type": "E"}'.encode()
+    parsed = _parse(body, how)
+    assert [(index, record) for index, record, error in parsed if error is None] == [
+        (0, {"time": 1, "type": "A"}), (2, {"time": 3, "type": "Ü"}), (4, {"time": 5, "type": "E"}),
+    ]
+    assert [index for index, record, error in parsed if error is not None] == [1, 3]
+
+
+@pytest.mark.parametrize("how", SPLITS)
+def test_a_malformed_array_record_stops_parsing(how):
+    body = b'[{"time": 1, "type": "A"}, {"time": 2, type: "B"}, {"time": 3, "type": "C"}]'
+    parsed = _parse(body, how)
+    assert parsed[0] == (0, {"time": 1, "type": "A"}, None)
+    assert [(index, record) for index, record, error in parsed[1:]] == [(1, None)]
+    assert parsed[1][2] is not None
+
+
+@pytest.mark.parametrize("how", SPLITS)
+def test_an_unterminated_array_reports_an_error_after_its_records(how):
+    body = b'[{"time": 1, "type": "A"}, {"time": 2, "type": "B"}, 42'
+    parsed = _parse(body, how)
+    assert [record for _, record, error in parsed if error is None] == [{"time": 1, "type": "A"}, {"time": 2, "type": "B"}]
+    assert [(index, record) for index, record, error in parsed if error is not None] == [(2, None)]
+
+
+@pytest.mark.parametrize("body", [b"", b"  \n\r\n", b"[]", b" [ \n ] "])
+def test_empty_bodies_yield_nothing(body):
+    assert _parse(body, "bytes") == []
+
+
+@pytest.mark.parametrize("how", ["bytes", "whole", 1])
+def test_oversized_records_are_rejected(monkeypatch, how):
+    monkeypatch.setattr(ingest_module, "MAX_RECORD_CHARS", 64)
+    big = json.dumps({"time": 2, "type": "B", "properties": {"pad": "x" * 200}})
+    small = [json.dumps({"time": t, "type": "A"}) for t in (1, 3)]
+
+    ndjson = _parse("\n".join([small[0], big, small[1]]).encode(), how)
+    assert [(index, error is None) for index, _, error in ndjson] == [(0, True), (1, False), (2, True)]
+    assert ndjson[2][1] == {"time": 3, "type": "A"}
+
+    array = _parse(("[" + ",".join([small[0], big, small[1]]) + "]").encode(), how)
+    assert [(index, error is None) for index, _, error in array] == [(0, True), (1, False)]
+
+
+class _Request:
+    def __init__(self, body, how):
+        self._body = body
+        self._how = how
+
+    def stream(self):
+        return _chunks(self._body, _split(self._body, self._how))
+
+
+class _Batcher:
+    def __init__(self):
+        self.rows = []
+
+    async def submit(self, events):
+        self.rows.extend(events)
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(len(events))
+        return future
+
+
+@pytest.mark.parametrize("how", ["bytes", 6])
+def test_endpoint_reports_accepted_rows_and_error_indexes(monkeypatch, how):
+    batcher = _Batcher()
+    monkeypatch.setattr(routers_module, "event_batcher", batcher)
+    monkeypatch.setattr(routers_module.settings, "INGEST_BATCH_SIZE", 2)
+    lines = [
+        '{"time": 1, "type": "PAYMENT", "properties": {"nameOrig": "Zoë"}}',
+        '{"time": "soon", "type": "PAYMENT"}',
+        '{"time": 3, "type": "TRANSFER"}',
+        "{broken",
+        '{"time": 5, "type": "CASH_OUT", "id": 9}',
+        '{"type": "DEBIT"}',
+        '{"time": 7, "type": "CASH_IN"}',
+    ]
+    body = "\n".join(lines).encode()
+    response = asyncio.run(routers_module.ingest_events(_Request(body, how)))
+    assert (response.accepted, response.flushed, response.rejected) == (4, 4, 3)
+    assert [error["index"] for error in response.errors] == [1, 3, 5]
+    assert [row["time"] for row in batcher.rows] == [1, 3, 5, 7]
+    assert batcher.rows[0]["properties"] == {"nameOrig": "Zoë"}
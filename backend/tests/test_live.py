@@ -0,0 +1,67 @@
+import asyncio
+
+from live import LiveHub
+
+
+def _hub():
+    hub = LiveHub(poll_interval=0.01, heartbeat_interval=0.01, buffer_batches=4, max_events_per_tick=100)
+
+    async def produce():
+        # No database: the producer only idles while anyone is subscribed
+        while hub.subscribers:
+            await asyncio.sleep(0.01)
+        hub._task = None
+
+    hub._produce = produce
+    return hub
+
+
+def test_a_stream_that_never_starts_registers_nothing():
+    hub = _hub()
+
+    async def scenario():
+        # e.g. the client went away before the response body was sent
+        stream = hub.stream({"g1"})
+        await asyncio.sleep(0.02)
+        count = len(hub.subscribers)
+        await stream.aclose()
+        return count
+
+    assert asyncio.run(scenario()) == 0
+    assert not hub.subscribers and hub._task is None
+
+
+def test_closing_a_stream_unregisters_its_subscriber():
+    hub = _hub()
+
+    async def scenario():
+        stream = hub.stream(include_events=False)
+        assert await stream.__anext__() == ": connected\n\n"
+        subscriber, = hub.subscribers
+        assert subscriber.graph_ids is None and not subscriber.include_events
+        subscriber.push_chart("g1", "event: chart\ndata: {}\n\n")
+        assert await stream.__anext__() == "event: chart\ndata: {}\n\n"
+        assert await stream.__anext__() == ": heartbeat\n\n"
+        await stream.aclose()
+        return len(hub.subscribers)
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_a_cancelled_stream_unregisters_its_subscriber():
+    hub = _hub()
+
+    async def consume():
+        async for _ in hub.stream():
+            pass
+
+    async def scenario():
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.03)
+        during = len(hub.subscribers)
+        # What the server does when the client disconnects mid-stream
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return during, len(hub.subscribers)
+
+    assert asyncio.run(scenario()) == (1, 0)
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+import query_guard as guard_module
+from duckdb_storage import DuckDBStorage
+from query_guard import QueryCostUnavailable, QueryGuard, QueryRejected, validation_error
+from storage import parse_cost
+
+BAR = "SELECT type AS category, COUNT(*) AS value FROM events GROUP BY type"
+
+
+@pytest.mark.parametrize("sql, chart_type", [
+    (BAR, "bar"),
+    (BAR + ";", "bar"),
+    ("SELECT time AS time, SUM(amount) AS value FROM events GROUP BY time ORDER BY time", "line"),
+    ("SELECT type AS slice, COUNT(*) AS value FROM events WHERE properties->>'isFraud' = '1' GROUP BY type", "pie"),
+    ("SELECT amount AS x_value, oldbalance AS y_value FROM events LIMIT 500", "scatter"),
+    ("SELECT EXTRACT(hour FROM to_timestamp(time)) AS category, COUNT(*) AS value FROM events GROUP BY 1", "bar"),
+    ("SELECT category, value FROM (SELECT type AS category, COUNT(*) AS value FROM events GROUP BY type) t", "bar"),
+    ("SELECT 'JOIN' AS category, COUNT(*) AS value FROM events", "bar"),
+])
+def test_accepts_plain_selects_over_events(sql, chart_type):
+    assert validation_error(sql, chart_type) is None
+
+
+@pytest.mark.parametrize("sql, reason", [
+    (BAR + " JOIN graphs g ON true", "JOIN is not allowed"),
+    ("SELECT e.type AS category, COUNT(*) AS value FROM events e, events f GROUP BY e.type", "Cross joins"),
+    ("WITH t AS (SELECT * FROM events) SELECT type AS category, COUNT(*) AS value FROM t GROUP BY type", "must be a SELECT"),
+    ("SELECT category, value FROM (WITH t AS (SELECT 1) SELECT 1 AS category, 2 AS value FROM events) s", "WITH is not allowed"),
+    ("DROP TABLE events", "must be a SELECT"),
+    (BAR + "; DELETE FROM events", "single statement"),
+    ("SELECT type AS category, COUNT(*) AS value INTO copy FROM events GROUP BY type", "INTO is not allowed"),
+    ("SELECT pg_sleep(10) AS category, 1 AS value FROM events", "pg_sleep() is not allowed"),
+    ("SELECT set_config('a', 'b', false) AS category, 1 AS value FROM events", "set_config() is not allowed"),
+    ("SELECT a AS category, b AS value FROM read_csv('/etc/passwd')", "read_csv() is not allowed"),
+    ("SELECT type AS category, COUNT(*) AS value FROM public.graphs GROUP BY type", "only read from events"),
+    ("SELECT * FROM events", "SELECT * is not allowed"),
+    (BAR + " -- comment", "Comments"),
+    ("SELECT type AS label, COUNT(*) AS value FROM events GROUP BY type", "missing category"),
+    ("SELECT type AS category FROM events", "missing value"),
+])
+def test_rejects_unsafe_or_malformed_sql(sql, reason):
+    error = validation_error(sql, "bar")
+    assert error is not None and reason in error
+
+
+def test_rejects_unknown_chart_type():
+    assert "Unsupported chart type" in validation_error(BAR, "heatmap")
+
+
+def _stub_explain(monkeypatch, cost):
+    """Make db_service.explain_cost return cost; returns the list of queries it was asked about"""
+    calls = []
+
+    async def explain_cost(sql_query):
+        calls.append(sql_query)
+        return cost
+
+    monkeypatch.setattr(guard_module.db_service, "explain_cost", explain_cost)
+    return calls
+
+
+def test_accepts_query_under_cost_limit(monkeypatch):
+    calls = _stub_explain(monkeypatch, cost=999.0)
+    guard = QueryGuard(max_cost=1000.0, cache_size=16, cache_ttl=60)
+    asyncio.run(guard.check(BAR, "bar"))
+    asyncio.run(guard.check(BAR, "bar"))
+    # The outcome is cached, so EXPLAIN runs once
+    assert calls == [BAR]
+
+
+def test_rejects_query_over_cost_limit(monkeypatch):
+    _stub_explain(monkeypatch, cost=1e6)
+    guard = QueryGuard(max_cost=1000.0, cache_size=16, cache_ttl=60)
+    with pytest.raises(QueryRejected, match="exceeds the limit"):
+        asyncio.run(guard.check(BAR, "bar"))
+    assert guard.rejections == 1
+
+
+def test_zero_max_cost_skips_explain(monkeypatch):
+    calls = _stub_explain(monkeypatch, cost=1e12)
+    guard = QueryGuard(max_cost=0, cache_size=16, cache_ttl=60, cost_required=True)
+    asyncio.run(guard.check(BAR, "bar"))
+    assert calls == []
+
+
+def test_invalid_sql_is_rejected_without_explain(monkeypatch):
+    calls = _stub_explain(monkeypatch, cost=1.0)
+    guard = QueryGuard(max_cost=1000.0, cache_size=16, cache_ttl=60)
+    with pytest.raises(QueryRejected):
+        asyncio.run(guard.check("DROP TABLE events", "bar"))
+    assert calls == []
+
+
+def test_missing_cost_is_allowed_by_default(monkeypatch):
+    _stub_explain(monkeypatch, cost=None)
+    guard = QueryGuard(max_cost=1000.0, cache_size=16, cache_ttl=60)
+    asyncio.run(guard.check(BAR, "bar"))
+    assert guard.cost_unavailable == 1
+
+
+def test_missing_cost_fails_closed_when_required_and_is_retried(monkeypatch):
+    calls = _stub_explain(monkeypatch, cost=None)
+    guard = QueryGuard(max_cost=1000.0, cache_size=16, cache_ttl=60, cost_required=True)
+    for _ in range(2):
+        with pytest.raises(QueryCostUnavailable):
+            asyncio.run(guard.check(BAR, "bar"))
+    assert len(calls) == 2
+    assert guard.cost_unavailable == 2
+
+
+@pytest.mark.parametrize("data, cost", [
+    ([{"cost": 123.5}], 123.5),
+    ([{"cost": "42"}], 42.0),
+    ([{"cost": None}], None),
+    ([], None),
+    (None, None),
+])
+def test_parse_supabase_cost(data, cost):
+    assert parse_cost(data) == cost
+
+
+def test_duckdb_explain_cost_estimates_cardinality():
+    storage = DuckDBStorage(":memory:")
+    storage.insert_events([{"time": i, "type": "A", "properties": {}} for i in range(100)])
+    cost = storage.explain_cost(BAR)
+    assert isinstance(cost, float) and cost > 0
+    storage.close()
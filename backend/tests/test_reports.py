@@ -0,0 +1,205 @@
+import asyncio
+import sqlite3
+import sys
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from reports import ReportJobs, ReportJobStore
+
+
+def _jobs(path, **overrides):
+    options = dict(
+        store_path=str(path),
+        workers=2,
+        llm_concurrency=2,
+        render_processes=1,
+        max_attempts=3,
+        retry_backoff=0,
+        output_dir=str(path.parent),
+        heartbeat_interval=0.01,
+        heartbeat_timeout=0.2,
+    )
+    options.update(overrides)
+    return ReportJobs(**options)
+
+
+def _submit(jobs, tmp_path):
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir(exist_ok=True)
+    return jobs.submit(str(spool_dir), [{"filename": "a.png", "path": str(spool_dir / "a.png"), "size": 1}])["job_id"]
+
+
+async def _noop():
+    pass
+
+
+async def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_only_one_process_claims_a_queued_job(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    first, second = ReportJobStore(str(path)), ReportJobStore(str(path))
+    first.insert({
+        "job_id": "j1", "status": "queued", "files": [], "spool_dir": "", "attempts": 0,
+        "timings": {}, "created_at": "2026-01-01T00:00:00", "updated_at": "2026-01-01T00:00:00",
+    })
+    assert first.claim("j1", "a")
+    assert not second.claim("j1", "b")
+    assert second.get("j1")["owner"] == "a"
+
+
+def test_a_restarted_worker_leaves_siblings_running_jobs_alone(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    runs = []
+
+    async def scenario():
+        busy = _jobs(path)
+        release = asyncio.Event()
+
+        async def slow_pipeline(job, timings):
+            runs.append(busy.owner)
+            await release.wait()
+            return "report.pdf"
+
+        busy._run_pipeline = slow_pipeline
+        job_id = _submit(busy, tmp_path)
+        await _wait_for(lambda: runs)
+
+        # A worker process starting up (e.g. respawned after a crash) sweeps the same table
+        restarted = _jobs(path)
+
+        async def other_pipeline(job, timings):
+            runs.append(restarted.owner)
+            return "other.pdf"
+
+        restarted._run_pipeline = other_pipeline
+        restarted.start()
+        # Several heartbeat timeouts pass while the sibling is still alive and heartbeating
+        await asyncio.sleep(0.6)
+        release.set()
+        await _wait_for(lambda: busy.get(job_id)["status"] == "succeeded")
+        await asyncio.gather(busy.stop(), restarted.stop())
+        return busy.get(job_id)
+
+    job = asyncio.run(scenario())
+    assert len(runs) == 1
+    assert job["report_path"] == "report.pdf"
+
+
+def test_jobs_of_a_dead_worker_are_recovered_after_the_heartbeat_lapses(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+
+    async def scenario():
+        dead = _jobs(path)
+        job_id = _submit(dead, tmp_path)
+        dead.store.claim(job_id, dead.owner)
+        # The owner dies without releasing: no workers, no heartbeat
+        for task in dead._tasks:
+            task.cancel()
+
+        survivor = _jobs(path)
+        ran = []
+
+        async def pipeline(job, timings):
+            ran.append(job["job_id"])
+            return "report.pdf"
+
+        survivor._run_pipeline = pipeline
+        survivor.start()
+        await _wait_for(lambda: survivor.get(job_id)["status"] == "succeeded")
+        await survivor.stop()
+        return ran, survivor.get(job_id)
+
+    ran, job = asyncio.run(scenario())
+    assert ran == [job["job_id"]]
+    assert job["owner"] is not None
+
+
+def test_stop_hands_running_jobs_back_to_the_queue(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+
+    async def scenario():
+        jobs = _jobs(path, heartbeat_timeout=60)
+        started = asyncio.Event()
+
+        async def pipeline(job, timings):
+            started.set()
+            await asyncio.sleep(60)
+
+        jobs._run_pipeline = pipeline
+        job_id = _submit(jobs, tmp_path)
+        await started.wait()
+        await jobs.stop()
+        return jobs.get(job_id)
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "queued" and job["owner"] is None
+
+
+def test_adds_claim_columns_to_an_existing_job_table(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE report_jobs (job_id TEXT PRIMARY KEY, status TEXT NOT NULL, files TEXT NOT NULL, "
+        "spool_dir TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, error TEXT, report_path TEXT, "
+        "timings TEXT NOT NULL DEFAULT '{}', created_at TEXT NOT NULL, updated_at TEXT NOT NULL)"
+    )
+    conn.close()
+    store = ReportJobStore(str(path))
+    assert store.requeue_expired(60) == 0
+    assert store.heartbeat("someone") == 0
+
+
+
+def test_render_retries_reuse_the_saved_markdown(tmp_path, monkeypatch):
+    calls = {"llm": 0, "render": 0}
+
+    async def write_financial_report(api_key, images):
+        calls["llm"] += 1
+        return "# Report"
+
+    def save_financial_report_to_pdf(markdown_text, images, pdf_path):
+        calls["render"] += 1
+        if calls["render"] < 3:
+            raise RuntimeError("pandoc failed")
+        assert markdown_text == "# Report"
+        return pdf_path
+
+    pipeline = types.ModuleType("generate_financial_reports")
+    pipeline.write_financial_report = write_financial_report
+    pipeline.save_financial_report_to_pdf = save_financial_report_to_pdf
+    pipeline.close_http_client = _noop
+    monkeypatch.setitem(sys.modules, "generate_financial_reports", pipeline)
+
+    async def scenario():
+        jobs = _jobs(tmp_path / "jobs.sqlite3", heartbeat_timeout=60)
+        render_pool = ThreadPoolExecutor(1)
+        jobs._get_render_pool = lambda: render_pool
+        job_id = _submit(jobs, tmp_path)
+        await _wait_for(lambda: jobs.get(job_id)["status"] == "succeeded")
+        jobs._render_pool = None
+        await jobs.stop()
+        render_pool.shutdown()
+        return jobs.get(job_id)
+
+    job = asyncio.run(scenario())
+    assert calls == {"llm": 1, "render": 3}
+    assert job["attempts"] == 3
+
+
+def test_job_table_is_opened_on_start_not_at_construction(tmp_path):
+    path = tmp_path / "data" / "jobs.sqlite3"
+    jobs = _jobs(path)
+    assert not path.parent.exists()
+
+    async def scenario():
+        jobs.start()
+        await jobs.stop()
+
+    asyncio.run(scenario())
+    assert path.exists()
@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+import pytest
+
+import shared_cache as shared_cache_module
+from shared_cache import LocalCache, SQLiteCache, create_shared_cache
+
+
+def _encode(value):
+    return str(value).encode()
+
+
+def _decode(data):
+    return data.decode()
+
+
+def _caches(tmp_path, count=2):
+    path = str(tmp_path / "shared.sqlite3")
+    # Separate instances, each with its own connection, as separate worker processes have
+    return [SQLiteCache(path, max_entries=100, poll_interval=0.01) for _ in range(count)]
+
+
+def test_concurrent_misses_on_one_file_compute_once(tmp_path):
+    first, second = _caches(tmp_path)
+    computed = []
+
+    async def compute(name):
+        computed.append(name)
+        await asyncio.sleep(0.2)
+        return f"value from {name}"
+
+    async def scenario():
+        a = asyncio.create_task(first.get_or_compute("chart:g1", lambda: compute("first"), 60, _encode, _decode, lease_ttl=5))
+        await asyncio.sleep(0.05)
+        b = await second.get_or_compute("chart:g1", lambda: compute("second"), 60, _encode, _decode, lease_ttl=5)
+        return await a, b
+
+    a, b = asyncio.run(scenario())
+    assert computed == ["first"]
+    assert a == b == "value from first"
+    # Later lookups are plain hits
+    assert asyncio.run(second.get_many(["chart:g1"])) == {"chart:g1": b"value from first"}
+
+
+def test_an_expired_lease_is_taken_over(tmp_path):
+    dead, alive = _caches(tmp_path)
+    # A worker took the lease and died before computing or releasing it
+    assert dead._acquire("chart:g1", "dead-owner", 0.2)
+    assert not alive._acquire("chart:g1", "other", 0.2)
+
+    async def compute():
+        return "recomputed"
+
+    started = time.monotonic()
+    value = asyncio.run(alive.get_or_compute("chart:g1", compute, 60, _encode, _decode, lease_ttl=5))
+    waited = time.monotonic() - started
+    assert value == "recomputed"
+    # Took over once the dead lease lapsed, well before its own 5 s wait ran out
+    assert 0.1 < waited < 2
+
+
+def test_waiters_stop_waiting_after_lease_ttl(tmp_path):
+    stuck, waiter = _caches(tmp_path)
+    assert stuck._acquire("chart:g1", "stuck-owner", 60)
+
+    async def compute():
+        return "computed anyway"
+
+    started = time.monotonic()
+    value = asyncio.run(waiter.get_or_compute("chart:g1", compute, 60, _encode, _decode, lease_ttl=0.2))
+    assert value == "computed anyway"
+    assert time.monotonic() - started < 2
+
+
+def test_results_refused_by_store_are_not_cached(tmp_path):
+    (cache,) = _caches(tmp_path, count=1)
+    computed = []
+
+    async def compute():
+        computed.append(1)
+        return "stale"
+
+    for _ in range(2):
+        value = asyncio.run(
+            cache.get_or_compute("chart:g1", compute, 60, _encode, _decode, lease_ttl=5, store=lambda value: False)
+        )
+        assert value == "stale"
+    assert len(computed) == 2
+    assert asyncio.run(cache.get_many(["chart:g1"])) == {}
+    # The lease was released, so nobody is left waiting on it
+    assert cache._acquire("chart:g1", "next", 5)
+
+
+def test_none_is_not_cached_by_default(tmp_path):
+    (cache,) = _caches(tmp_path, count=1)
+
+    async def compute():
+        return None
+
+    asyncio.run(cache.get_or_compute("chart:g1", compute, 60, _encode, _decode, lease_ttl=5))
+    assert asyncio.run(cache.get_many(["chart:g1"])) == {}
+
+
+def test_invalidate_drops_only_the_prefix(tmp_path):
+    (cache,) = _caches(tmp_path, count=1)
+    asyncio.run(cache.set("chart:g1:a", b"1", 60))
+    asyncio.run(cache.set("chart:g10:a", b"2", 60))
+    asyncio.run(cache.set("chart:g2:a", b"3", 60))
+    assert asyncio.run(cache.invalidate("chart:g1:")) == 1
+    assert set(asyncio.run(cache.get_many(["chart:g1:a", "chart:g10:a", "chart:g2:a"]))) == {"chart:g10:a", "chart:g2:a"}
+
+
+def test_connects_on_first_use_not_at_construction(tmp_path):
+    path = tmp_path / "cache" / "shared.sqlite3"
+    cache = SQLiteCache(str(path), max_entries=100, poll_interval=0.01)
+    assert not path.parent.exists()
+    asyncio.run(cache.start())
+    assert path.exists()
+    cache.close()
+
+
+def test_falls_back_to_local_cache_without_redis(monkeypatch):
+    monkeypatch.setattr(shared_cache_module.settings, "SHARED_CACHE_BACKEND", "redis")
+    monkeypatch.setattr(shared_cache_module.importlib.util, "find_spec", lambda name: None)
+    cache = create_shared_cache()
+    assert isinstance(cache, LocalCache) and not cache.shared
+
+
+def test_unknown_backend_falls_back_to_local_cache(monkeypatch):
+    monkeypatch.setattr(shared_cache_module.settings, "SHARED_CACHE_BACKEND", "memcached")
+    assert isinstance(create_shared_cache(), LocalCache)
+
+
+def test_backends_must_implement_every_primitive():
+    class Incomplete(shared_cache_module.SharedCache):
+        def _get_many(self, keys):
+            return {}
+
+    with pytest.raises(TypeError, match="_acquire"):
+        Incomplete(poll_interval=0.01)
+    assert asyncio.run(LocalCache(0.01).get_many(["a"])) == {}
@@ -0,0 +1,23 @@
+import pytest
+
+from duckdb_storage import DuckDBStorage
+from storage import StorageBackend, SupabaseStorage
+
+
+def test_backends_must_implement_every_abstract_method():
+    class Incomplete(StorageBackend):
+        def is_available(self):
+            return True
+
+    with pytest.raises(TypeError, match="run_sql"):
+        Incomplete()
+    with pytest.raises(TypeError):
+        StorageBackend()
+
+
+def test_bundled_backends_implement_the_interface():
+    for backend in (DuckDBStorage, SupabaseStorage):
+        assert not backend.__abstractmethods__
+    storage = DuckDBStorage(":memory:")
+    assert storage.is_available()
+    storage.close()
@@ -0,0 +1,86 @@
+import pytest
+
+from duckdb_storage import DuckDBStorage
+from typed_columns import rewrite_sql
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT SUM((properties->>'amount')::NUMERIC) FROM events",
+     "SELECT SUM(amount::NUMERIC) FROM events"),
+    ("SELECT SUM(( properties ->> 'amount' ) :: numeric(18, 2)) FROM events",
+     "SELECT SUM(amount::numeric(18, 2)) FROM events"),
+    ("SELECT AVG(CAST(properties->>'oldbalanceOrg' AS DOUBLE PRECISION)) FROM events",
+     "SELECT AVG(old_balance_org::DOUBLE PRECISION) FROM events"),
+    ("SELECT AVG(cast((properties->>'step') as int)) FROM events",
+     "SELECT AVG(step::int) FROM events"),
+    ("SELECT COALESCE(properties->>'nameDest', 'unknown') AS dest FROM events",
+     "SELECT COALESCE(name_dest, 'unknown') AS dest FROM events"),
+    ("SELECT (properties->>'nameOrig') AS orig FROM events WHERE e.properties->>'nameOrig' LIKE 'C%'",
+     "SELECT name_orig AS orig FROM events WHERE e.name_orig LIKE 'C%'"),
+    ("SELECT MAX((properties->>'isFraud')::INTEGER + (properties->>'isFlaggedFraud')::INTEGER) FROM events",
+     "SELECT MAX(is_fraud::INTEGER + is_flagged_fraud::INTEGER) FROM events"),
+])
+def test_rewrites_typed_keys(sql, expected):
+    assert rewrite_sql(sql) == expected
+
+
+@pytest.mark.parametrize("sql", [
+    # Text comparisons against numeric keys keep their text semantics
+    "SELECT COUNT(*) FROM events WHERE properties->>'step' = '1'",
+    "SELECT COUNT(*) FROM events WHERE (properties->>'amount') > '9'",
+    # Keys without a typed column, near misses and differently cased keys
+    "SELECT SUM((properties->>'amountUsd')::NUMERIC) FROM events",
+    "SELECT SUM((properties->>'Amount')::NUMERIC) FROM events",
+    "SELECT COUNT(*) FROM events WHERE properties->>'ISFRAUD' = '1'",
+    "SELECT (properties->>'type') AS kind FROM events",
+    # JSON rather than text extraction, and columns that only end in "properties"
+    "SELECT properties->'nameOrig' FROM events",
+    "SELECT (old_properties->>'amount')::NUMERIC FROM events",
+    # Inside string literals and quoted identifiers
+    "SELECT COUNT(*) FROM events WHERE type = 'properties->>''nameOrig'''",
+    "SELECT 'CAST(properties->>''amount'' AS NUMERIC)' AS note FROM events",
+    "SELECT COUNT(*) AS \"properties->>'nameOrig'\" FROM events",
+])
+def test_leaves_other_sql_alone(sql):
+    assert rewrite_sql(sql) == sql
+
+
+def test_rewrites_the_expression_but_not_its_quoted_alias():
+    sql = "SELECT (properties->>'isFraud')::INT AS \"(properties->>'isFraud')::INT\" FROM events"
+    assert rewrite_sql(sql) == "SELECT is_fraud::INT AS \"(properties->>'isFraud')::INT\" FROM events"
+
+
+def test_quotes_before_a_match_do_not_hide_it():
+    sql = "SELECT 'it''s' AS label, \"x\" AS y, SUM((properties->>'amount')::NUMERIC) FROM events WHERE type = 'a'"
+    assert rewrite_sql(sql) == "SELECT 'it''s' AS label, \"x\" AS y, SUM(amount::NUMERIC) FROM events WHERE type = 'a'"
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT type AS category, SUM((properties->>'amount')::NUMERIC) AS value FROM events GROUP BY type",
+    "SELECT properties->>'nameOrig' AS category, COUNT(*) AS value FROM events GROUP BY 1 ORDER BY 1",
+    "SELECT CAST(properties->>'step' AS INTEGER) AS step, AVG(CAST(properties->>'newbalanceDest' AS DOUBLE)) AS value "
+    "FROM events WHERE properties->>'step' = '2' GROUP BY 1 ORDER BY 1",
+    "SELECT COUNT(*) AS value FROM events WHERE (properties->>'isFraud')::INT = 1 AND type <> 'properties->>''isFraud'''",
+])
+def test_rewritten_sql_returns_the_same_rows(sql):
+    storage = DuckDBStorage(":memory:")
+    storage.insert_events([
+        {
+            "time": t,
+            "type": "TRANSFER" if t % 3 else "CASH_OUT",
+            "properties": {
+                "amount": t * 10.5,
+                "step": t % 4,
+                "isFraud": int(t % 7 == 0),
+                "nameOrig": f"C{t % 5}",
+                "newbalanceDest": t * 2.25,
+            },
+        }
+        for t in range(1, 101)
+    ])
+    expected = storage.run_sql(sql)
+    assert storage.migrate()
+    storage.typed_columns = True
+    assert rewrite_sql(sql) != sql
+    assert storage.run_sql(rewrite_sql(sql)) == expected
+    storage.close()
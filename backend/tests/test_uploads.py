@@ -0,0 +1,81 @@
+import asyncio
+import os
+
+import pytest
+
+from uploads import MalformedUpload, UploadTooLarge, spool_uploads
+
+BOUNDARY = "testboundary"
+HEADERS = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+
+
+def _body(*files):
+    parts = []
+    for name, data in files:
+        parts.append(
+            f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="files"; filename="{name}"\r\n'
+            "Content-Type: image/png\r\n\r\n".encode() + data + b"\r\n"
+        )
+    parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="note"\r\n\r\nignored\r\n'.encode())
+    return b"".join(parts) + f"--{BOUNDARY}--\r\n".encode()
+
+
+def _spool(tmp_path, body, chunk_size=7, headers=HEADERS, max_file_bytes=1000, max_request_bytes=10000, read=None):
+    async def stream():
+        for start in range(0, len(body), chunk_size):
+            if read is not None:
+                read.append(start)
+            yield body[start:start + chunk_size]
+
+    return asyncio.run(spool_uploads(headers, stream(), str(tmp_path), max_file_bytes, max_request_bytes))
+
+
+def test_spools_files_across_chunk_boundaries(tmp_path):
+    spool_dir, files = _spool(tmp_path, _body(("a.png", b"\x89PNG" * 50), ("../b c.png", b""), ("c.png", b"xyz")))
+    assert [(f["filename"], f["size"]) for f in files] == [("a.png", 200), ("../b c.png", 0), ("c.png", 3)]
+    assert [os.path.basename(f["path"]) for f in files] == ["000_a.png", "001_b_c.png", "002_c.png"]
+    assert os.path.dirname(files[0]["path"]) == spool_dir
+    with open(files[0]["path"], "rb") as f:
+        assert f.read() == b"\x89PNG" * 50
+    assert os.path.getsize(files[1]["path"]) == 0
+
+
+def test_refuses_oversized_content_length_before_reading(tmp_path):
+    read = []
+    body = _body(("a.png", b"x" * 100))
+    with pytest.raises(UploadTooLarge, match="request limit"):
+        _spool(tmp_path, body, headers={**HEADERS, "content-length": str(len(body))}, max_request_bytes=50, read=read)
+    assert read == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_aborts_oversized_file_while_streaming(tmp_path):
+    read = []
+    body = _body(("a.png", b"x" * 5000), ("b.png", b"y"))
+    with pytest.raises(UploadTooLarge, match="a.png exceeds the 1000 byte file limit"):
+        _spool(tmp_path, body, chunk_size=100, read=read, max_request_bytes=100000)
+    # Stopped shortly after the first 1000 bytes of the file, not at the end of the body
+    assert read[-1] < 1300
+    assert os.listdir(tmp_path) == []
+
+
+def test_aborts_body_over_request_limit_without_content_length(tmp_path):
+    read = []
+    body = _body(*[(f"{i}.png", b"x" * 900) for i in range(10)])
+    with pytest.raises(UploadTooLarge, match="request limit"):
+        _spool(tmp_path, body, chunk_size=100, read=read, max_request_bytes=2000)
+    assert read[-1] < 2100
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("headers, body", [
+    ({"content-type": "application/json"}, b"{}"),
+    ({"content-type": "multipart/form-data"}, b""),
+    (HEADERS, _body(("a.png", b"abc"))[:-20]),
+    (HEADERS, b"not multipart at all"),
+])
+def test_rejects_malformed_bodies(tmp_path, headers, body):
+    with pytest.raises(MalformedUpload):
+        _spool(tmp_path, body, headers=headers)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,91 @@
+"""
+Typed projections of hot `events.properties` keys.
+
+Chart SQL reads properties as `(properties->>'amount')::NUMERIC`, which extracts JSON
+and parses text for every row on every run. Storage backends that have the typed
+columns below (see migrations/001_typed_event_columns.sql) get chart SQL rewritten to
+read them instead. Stored graph SQL is left untouched, so it keeps working on a
+database without the columns.
+"""
+import re
+from functools import lru_cache
+from typing import Callable, List, NamedTuple
+
+
+class TypedColumn(NamedTuple):
+    key: str
+    column: str
+    postgres_type: str
+    duckdb_type: str
+
+
+TYPED_COLUMNS = (
+    TypedColumn("amount", "amount", "NUMERIC", "DECIMAL(18,3)"),
+    TypedColumn("step", "step", "INTEGER", "INTEGER"),
+    TypedColumn("isFraud", "is_fraud", "SMALLINT", "SMALLINT"),
+    TypedColumn("isFlaggedFraud", "is_flagged_fraud", "SMALLINT", "SMALLINT"),
+    TypedColumn("nameOrig", "name_orig", "TEXT", "VARCHAR"),
+    TypedColumn("nameDest", "name_dest", "TEXT", "VARCHAR"),
+    TypedColumn("oldbalanceOrg", "old_balance_org", "NUMERIC", "DECIMAL(18,3)"),
+    TypedColumn("newbalanceOrig", "new_balance_orig", "NUMERIC", "DECIMAL(18,3)"),
+    TypedColumn("oldbalanceDest", "old_balance_dest", "NUMERIC", "DECIMAL(18,3)"),
+    TypedColumn("newbalanceDest", "new_balance_dest", "NUMERIC", "DECIMAL(18,3)"),
+)
+_BY_KEY = {typed.key: typed for typed in TYPED_COLUMNS}
+_TEXT_TYPES = ("TEXT", "VARCHAR")
+# Columns used for point lookups and filters
+INDEXED_COLUMNS = ("step", "is_fraud", "name_orig", "name_dest")
+
+_KEYS = "|".join(re.escape(key) for key in _BY_KEY)
+# JSON keys are case-sensitive even though the SQL around them is not
+_ACCESS = rf"(?<![\w$])properties\s*->>\s*'(?P<key>(?-i:{_KEYS}))'"
+_TYPE = r"(?P<type>[A-Za-z_][A-Za-z0-9_]*(?:\s+precision)?(?:\s*\(\s*\d+(?:\s*,\s*\d+)?\s*\))?)"
+_CAST_RE = re.compile(rf"\(\s*{_ACCESS}\s*\)\s*::\s*{_TYPE}", re.IGNORECASE)
+_CAST_CALL_RE = re.compile(rf"\bCAST\s*\(\s*\(?\s*{_ACCESS}\s*\)?\s+AS\s+{_TYPE}\s*\)", re.IGNORECASE)
+_PAREN_TEXT_RE = re.compile(rf"\(\s*{_ACCESS}\s*\)(?!\s*::)", re.IGNORECASE)
+_TEXT_RE = re.compile(rf"{_ACCESS}(?!\s*\)?\s*::)", re.IGNORECASE)
+
+
+def _cast(match: re.Match) -> str:
+    # Keep the query's own cast so result types are unchanged; casting a typed column is cheap
+    return f"{_BY_KEY[match.group('key')].column}::{match.group('type')}"
+
+
+def _text(match: re.Match) -> str:
+    typed = _BY_KEY[match.group("key")]
+    if typed.postgres_type not in _TEXT_TYPES:
+        # Text comparisons against numeric properties must keep their text semantics
+        return match.group(0)
+    return typed.column
+
+
+def _quoted(sql: str) -> List[bool]:
+    """Per character, whether it is inside a string literal or quoted identifier"""
+    quoted = []
+    quote = None
+    for ch in sql:
+        if quote:
+            quoted.append(True)
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+            quoted.append(True)
+        else:
+            quoted.append(False)
+    return quoted
+
+
+def _sub(pattern: re.Pattern, replace: Callable[[re.Match], str], sql_query: str) -> str:
+    # Leave matches that start inside quotes, e.g. SQL text stored in a literal or an alias
+    quoted = _quoted(sql_query)
+    return pattern.sub(lambda match: match.group(0) if quoted[match.start()] else replace(match), sql_query)
+
+
+@lru_cache(maxsize=1024)
+def rewrite_sql(sql_query: str) -> str:
+    """Replace property extraction of typed keys with the typed columns"""
+    sql_query = _sub(_CAST_RE, _cast, sql_query)
+    sql_query = _sub(_CAST_CALL_RE, _cast, sql_query)
+    sql_query = _sub(_PAREN_TEXT_RE, _text, sql_query)
+    return _sub(_TEXT_RE, _text, sql_query)
@@ -0,0 +1,181 @@
+"""
+Streams multipart report uploads from the request body straight to a spool directory.
+
+The body is parsed as it arrives instead of through Starlette's form parser, which
+reads every file into temporary storage before the handler runs. Each file is written
+to disk as its bytes come in, a Content-Length over the request limit is refused before
+anything is read, and a body or file that passes its limit while streaming aborts the
+read part-way through. Memory use is bounded by one received chunk.
+"""
+import os
+import re
+import shutil
+import uuid
+from typing import AsyncIterator, Dict, List, Mapping, Optional, Tuple
+
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9._-]")
+
+
+class UploadTooLarge(ValueError):
+    """Raised when a file or the whole request exceeds its size limit"""
+
+
+class MalformedUpload(ValueError):
+    """Raised when the body is not a well-formed multipart/form-data upload"""
+
+
+def _safe_filename(filename: str, index: int) -> str:
+    name = _UNSAFE_CHARS.sub("_", os.path.basename(filename or "")).lstrip(".")
+    return f"{index:03d}_{name or 'upload'}"
+
+
+class _Part:
+    def __init__(self):
+        self.headers: Dict[bytes, bytes] = {}
+        self.filename: Optional[str] = None
+        self.path: Optional[str] = None
+        self.file = None
+        self.size = 0
+
+
+class _Spooler:
+    """Multipart parser callbacks that route file parts to files under spool_dir.
+
+    The callbacks run inside MultipartParser.write, so they only record data; the file
+    writes happen afterwards on a thread, once per received chunk. Parts without a
+    filename (plain form fields) are ignored.
+    """
+
+    def __init__(self, spool_dir: str, max_file_bytes: int):
+        self.spool_dir = spool_dir
+        self.max_file_bytes = max_file_bytes
+        self.files: List[_Part] = []
+        self.complete = False
+        self._part = _Part()
+        self._header_name = b""
+        self._header_value = b""
+        self._pending: List[Tuple[_Part, bytes]] = []
+        self._ended: List[_Part] = []
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_end": self.on_end,
+        }
+
+    def on_part_begin(self):
+        self._part = _Part()
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._part.headers[self._header_name.lower()] = self._header_value
+        self._header_name = self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._part.headers.get(b"content-disposition", b""))
+        if b"filename" in options:
+            part = self._part
+            part.filename = options[b"filename"].decode("utf-8", "replace")
+            part.path = os.path.join(self.spool_dir, _safe_filename(part.filename, len(self.files)))
+            self.files.append(part)
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        part = self._part
+        if part.filename is None:
+            return
+        part.size += end - start
+        if part.size > self.max_file_bytes:
+            raise UploadTooLarge(f"{part.filename} exceeds the {self.max_file_bytes} byte file limit")
+        self._pending.append((part, data[start:end]))
+
+    def on_part_end(self):
+        if self._part.filename is not None:
+            self._ended.append(self._part)
+
+    def on_end(self):
+        self.complete = True
+
+    def write_pending(self):
+        """Write the data parsed from the last chunk and close files whose part ended"""
+        for part, data in self._pending:
+            if part.file is None:
+                part.file = open(part.path, "wb")
+            part.file.write(data)
+        for part in self._ended:
+            if part.file is None:
+                # Empty file part
+                open(part.path, "wb").close()
+            else:
+                part.file.close()
+        self._pending.clear()
+        self._ended.clear()
+
+    def close(self):
+        for part in self.files:
+            if part.file is not None:
+                part.file.close()
+
+
+async def spool_uploads(
+    headers: Mapping[str, str],
+    stream: AsyncIterator[bytes],
+    spool_root: str,
+    max_file_bytes: int,
+    max_request_bytes: int,
+) -> Tuple[str, List[Dict[str, object]]]:
+    """Parse a multipart/form-data body and write its files under a fresh directory in spool_root.
+
+    Returns the directory and one {filename, path, size} dict per file, in upload
+    order. A body or file over its limit raises UploadTooLarge and a malformed body
+    MalformedUpload; either way the partial directory is removed.
+    """
+    content_type, params = parse_options_header(headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise MalformedUpload("Expected a multipart/form-data body with a boundary")
+    content_length = headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > max_request_bytes:
+        raise UploadTooLarge(f"Upload exceeds the {max_request_bytes} byte request limit")
+
+    spool_dir = os.path.join(spool_root, uuid.uuid4().hex)
+    os.makedirs(spool_dir, exist_ok=True)
+    spooler = _Spooler(spool_dir, max_file_bytes)
+    parser = MultipartParser(params[b"boundary"], spooler.callbacks())
+    received = 0
+    try:
+        try:
+            async for chunk in stream:
+                received += len(chunk)
+                # Content-Length may be absent (chunked encoding) or understated
+                if received > max_request_bytes:
+                    raise UploadTooLarge(f"Upload exceeds the {max_request_bytes} byte request limit")
+                parser.write(chunk)
+                await run_in_threadpool(spooler.write_pending)
+            parser.finalize()
+        except MultipartParseError as e:
+            raise MalformedUpload(f"Malformed multipart body: {e}")
+        if not spooler.complete:
+            raise MalformedUpload("Multipart body ended before its closing boundary")
+    except BaseException:
+        spooler.close()
+        remove_spool(spool_dir)
+        raise
+    return spool_dir, [{"filename": part.filename, "path": part.path, "size": part.size} for part in spooler.files]
+
+
+def remove_spool(spool_dir: str):
+    shutil.rmtree(spool_dir, ignore_errors=True)